@@ -1,11 +1,27 @@
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
 from random import randint, seed
-from typing import List, Dict
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+from weakref import WeakSet
 
 import matplotlib.pyplot as plt
+import numpy as np
+import shapely
 from shapely.geometry import Polygon, LineString
+from shapely.strtree import STRtree
 
 from geometry.circle import Circle
 from geometry.coord import Coord
+from geometry.path import Path
+
+# number of threats read or buffered into polygons at once
+THREATS_CHUNK_SIZE = 65536
+
+# number of segments of each parallel task, fewer segments are not evaluated in parallel
+PARALLEL_CHUNK_SIZE = 4096
 
 
 class Environment:
@@ -19,15 +35,144 @@ class Environment:
         :param env_range: the range of the environment
         :param seed_value: seed of the environment's threats map
         """
-        self._seed_value = seed_value
+        self._init_state(source, target, env_range, seed_value)
         seed(self._seed_value)
 
+        self._threats = []
+        self._create_disjoint_threats(num_threats)
+
+    def _init_state(self, source: Coord, target: Coord, env_range: (int, int), seed_value: int) -> None:
+        """Initializes the state of the environment, without threats
+
+        :param source: source of query
+        :param target: target of query
+        :param env_range: the range of the environment
+        :param seed_value: seed of the environment's threats map
+        """
+        self._seed_value = seed_value
         self._source = source
         self._target = target
         self._x_range, self._y_range = env_range
 
-        self._threats = []
-        self._create_disjoint_threats(num_threats)
+        # the threats and their arrays, each created from the other on first use
+        self._threats = None
+        self._threats_arrays = None
+        self._threats_tree = None
+
+        # roadmaps updated when the threats change
+        self._roadmaps = WeakSet()
+
+        # the workers evaluating segments in parallel, if enabled
+        self._parallel = None
+        self._executor = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Gets the state of the environment to pickle, without its attached roadmaps, spatial index and parallel
+        workers, so a copy evaluates the segments serially
+
+        :return: the state of the environment
+        """
+        state = vars(self).copy()
+        state['_roadmaps'] = None
+        state['_threats_tree'] = None
+        state['_parallel'] = state['_executor'] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Restores the state of a pickled environment, without attached roadmaps
+
+        :param state: the state of the environment
+        """
+        vars(self).update(state)
+        self._roadmaps = WeakSet()
+
+    @classmethod
+    def from_arrays(cls, source: Coord, target: Coord, centers: np.ndarray, radii: np.ndarray,
+                    env_range: (int, int) = (1000, 1000), seed_value: int = None) -> 'Environment':
+        """Creates an environment of given threats without generating them
+
+        :param source: source of query
+        :param target: target of query
+        :param centers: the xy centers of the threats
+        :param radii: the radii of the threats
+        :param env_range: the range of the environment
+        :param seed_value: seed of the environment's threats map if it was generated
+        :return: the environment
+        """
+        environment = cls.__new__(cls)
+        environment._init_state(source, target, env_range, seed_value)
+        environment._threats_arrays = (np.asarray(centers, dtype=float).reshape(-1, 2),
+                                       np.asarray(radii, dtype=float).reshape(-1))
+        return environment
+
+    def save(self, file_path: str) -> None:
+        """Saves the environment to a npz file, the threats as arrays of centers and radii
+
+        :param file_path: the path of the file
+        """
+        np.savez(file_path, centers=self.threats_centers, radii=self.threats_radii, metadata=json.dumps({
+            'range': [self._x_range, self._y_range],
+            'endpoints': [point.xy for point in self.endpoints],
+            'seed': self._seed_value,
+        }))
+
+    @classmethod
+    def load(cls, file_path: str) -> 'Environment':
+        """Loads an environment saved to a npz file
+
+        :param file_path: the path of the file
+        :return: the environment
+        """
+        with np.load(file_path) as data:
+            metadata = json.loads(str(data['metadata']))
+            source, target = [Coord(*point) for point in metadata['endpoints']]
+            return cls.from_arrays(source, target, data['centers'], data['radii'], tuple(metadata['range']),
+                                   metadata['seed'])
+
+    @classmethod
+    def from_threats_csv(cls, file_path: str, source: Coord, target: Coord, env_range: (int, int) = (1000, 1000),
+                         chunk_size: int = THREATS_CHUNK_SIZE) -> 'Environment':
+        """Creates an environment of threats read from a csv file of x, y and radius rows, with an optional header.
+        The file is read in chunks of rows
+
+        :param file_path: the path of the file
+        :param source: source of query
+        :param target: target of query
+        :param env_range: the range of the environment
+        :param chunk_size: the number of rows read at once
+        :return: the environment
+        """
+        chunks = []
+        with open(file_path) as file:
+            first_line = file.readline()
+            try:
+                chunks.append(np.array(first_line.split(','), dtype=float).reshape(-1, 3))
+            except ValueError:
+                pass
+
+            while True:
+                lines = list(islice(file, chunk_size))
+                if not lines:
+                    break
+                chunks.append(np.loadtxt(lines, delimiter=',', dtype=float, ndmin=2).reshape(-1, 3))
+
+        threats = np.concatenate(chunks) if chunks else np.zeros((0, 3))
+        return cls.from_arrays(source, target, threats[:, :2], threats[:, 2], env_range)
+
+    @classmethod
+    def from_threats_npy(cls, file_path: str, source: Coord, target: Coord, env_range: (int, int) = (1000, 1000)) \
+            -> 'Environment':
+        """Creates an environment of threats read from a npy file of x, y and radius rows.
+        The file is memory-mapped read-only and its rows are read on demand, without copying them
+
+        :param file_path: the path of the file
+        :param source: source of query
+        :param target: target of query
+        :param env_range: the range of the environment
+        :return: the environment
+        """
+        data = np.load(file_path, mmap_mode='r').reshape(-1, 3)
+        return cls.from_arrays(source, target, data[:, :2], data[:, 2], env_range)
 
     @property
     def x_range(self) -> int:
@@ -51,16 +196,76 @@ class Environment:
 
         :return: the threats in the environment
         """
+        if self._threats is None:
+            self._threats = [Circle(Coord(*center), radius) for center, radius
+                             in zip(self.threats_centers.tolist(), self.threats_radii.tolist())]
         return self._threats
 
+    @property
+    def threats_centers(self) -> np.ndarray:
+        """The centers of the threats in the environment
+
+        :return: the xy centers of the threats
+        """
+        return self._get_threats_arrays()[0]
+
+    @property
+    def threats_radii(self) -> np.ndarray:
+        """The radii of the threats in the environment
+
+        :return: the radii of the threats
+        """
+        return self._get_threats_arrays()[1]
+
+    def _get_threats_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Gets the centers and the radii of the threats as arrays
+
+        :return: the centers and the radii of the threats
+        """
+        if self._threats_arrays is None:
+            centers = np.array([threat.center.xy for threat in self._threats], dtype=float).reshape(-1, 2)
+            self._threats_arrays = (centers, np.array([threat.radius for threat in self._threats], dtype=float))
+        return self._threats_arrays
+
     @property
     def threats_polygons(self) -> List[Polygon]:
         """The threats polygons in the environment
 
         :return: the threats polygons in the environment
         """
+        if self._threats is None:
+            # buffer the centers in chunks instead of creating the threats
+            centers, radii = self._get_threats_arrays()
+            return [polygon for begin in range(0, len(radii), THREATS_CHUNK_SIZE)
+                    for polygon in shapely.buffer(shapely.points(centers[begin:begin + THREATS_CHUNK_SIZE]),
+                                                  radii[begin:begin + THREATS_CHUNK_SIZE],
+                                                  quad_segs=Circle.BUFFER_RESOLUTION).tolist()]
         return [threat.inner_polygon for threat in self._threats]
 
+    @property
+    def threats_tree(self) -> STRtree:
+        """A spatial index of the threats polygons in the environment
+
+        :return: a spatial index of the threats polygons in the environment
+        """
+        if self._threats_tree is None:
+            self._threats_tree = STRtree(self.threats_polygons)
+        return self._threats_tree
+
+    @property
+    def content_hash(self) -> str:
+        """A hash of the content of the environment, its ranges, endpoints, seed and threats
+
+        :return: the hex digest of the hash
+        """
+        content = hashlib.sha256(json.dumps({
+            'range': [self._x_range, self._y_range],
+            'endpoints': [point.xy for point in self.endpoints],
+            'seed': self._seed_value,
+        }).encode())
+        content.update(np.column_stack([self.threats_centers, self.threats_radii]).tobytes())
+        return content.hexdigest()
+
     @property
     def source(self) -> Coord:
         """The source coord
@@ -92,7 +297,7 @@ class Environment:
         :return: if the point is inside threat
         """
         for threat in self.threats_polygons:
-            if threat.contains(point):
+            if threat.contains(point.to_shapely):
                 return False
         return True
 
@@ -103,12 +308,122 @@ class Environment:
         :param v: the second coord of the edge
         :return: if the edge does not intersect threat
         """
-        line = LineString([u, v])
+        line = LineString([u.xy, v.xy])
         for threat_polygon in self.threats_polygons:
             if line.intersects(threat_polygon):
                 return False
         return True
 
+    def are_safe_points(self, points: Sequence[Tuple[float, float]]) -> np.ndarray:
+        """Checks at once which of given points are not inside threats
+
+        :param points: the xy points
+        :return: if each point is not inside threat
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        is_safe = np.ones(len(points), dtype=bool)
+        if len(self.threats_radii):
+            point_idx, _ = self.threats_tree.query(shapely.points(points), predicate='within')
+            is_safe[point_idx] = False
+        return is_safe
+
+    def are_safe_segments(self, segments: Sequence[Tuple[Tuple[float, float], Tuple[float, float]]]) -> np.ndarray:
+        """Checks at once which of given edges do not intersect threats
+
+        :param segments: the edges as pairs of xy points
+        :return: if each edge does not intersect threat
+        """
+        segments = np.asarray(segments, dtype=float).reshape(-1, 2, 2)
+        is_safe = np.ones(len(segments), dtype=bool)
+        if len(self.threats_radii):
+            segment_idx, _ = self.threats_tree.query(shapely.linestrings(segments), predicate='intersects')
+            is_safe[segment_idx] = False
+        return is_safe
+
+    def estimate_segments_attributes(self, segments: Sequence[Tuple[Tuple[float, float], Tuple[float, float]]]) \
+            -> Dict[str, np.ndarray]:
+        """Computes cheaply at once the attributes of given edges with a lower bound of the risk, which is the length of
+        the edges inside the circles inscribed in the threats polygons
+
+        :param segments: the edges as pairs of xy points
+        :return: the attributes of the segments, and if the risk bound of each segment is exact since its bounding box
+        does not intersect any threat
+        """
+        segments = np.asarray(segments, dtype=float).reshape(-1, 2, 2)
+        directions = segments[:, 1] - segments[:, 0]
+        lengths = np.hypot(*directions.T)
+
+        risks = np.zeros(len(segments))
+        is_exact = np.ones(len(segments), dtype=bool)
+        if len(self.threats_radii):
+            segment_idx, threat_idx = self.threats_tree.query(shapely.linestrings(segments))
+            is_exact[segment_idx] = False
+
+            polygons = self.threats_tree.geometries
+            centers = self.threats_centers
+            radii = shapely.distance(shapely.points(centers), shapely.boundary(polygons))
+
+            # the segments are p + t * d for t in [0, 1], intersecting a circle where |p + t * d - c| = r
+            d = directions[segment_idx]
+            f = segments[segment_idx, 0] - centers[threat_idx]
+            a = np.maximum(np.einsum('ij,ij->i', d, d), np.finfo(float).tiny)
+            b = np.einsum('ij,ij->i', f, d)
+            discriminant = np.maximum(b ** 2 - a * (np.einsum('ij,ij->i', f, f) - radii[threat_idx] ** 2), 0)
+            t1 = np.clip((-b - np.sqrt(discriminant)) / a, 0, 1)
+            t2 = np.clip((-b + np.sqrt(discriminant)) / a, 0, 1)
+            risks = np.bincount(segment_idx, weights=(t2 - t1) * lengths[segment_idx], minlength=len(segments))
+
+        return {'length': lengths, 'risk': risks, 'is_exact': is_exact}
+
+    def attach(self, roadmap: Any) -> None:
+        """Attaches a roadmap to be updated whenever the threats change
+
+        :param roadmap: the roadmap
+        """
+        self._roadmaps.add(roadmap)
+
+    def add_threat(self, threat: Circle) -> None:
+        """Adds a threat and updates the attached roadmaps
+
+        :param threat: the threat
+        """
+        self.threats.append(threat)
+        self._update_threats([threat])
+
+    def remove_threat(self, index: int) -> Circle:
+        """Removes a threat and updates the attached roadmaps
+
+        :param index: the index of the threat
+        :return: the removed threat
+        """
+        threat = self.threats.pop(index)
+        self._update_threats([threat])
+        return threat
+
+    def move_threat(self, index: int, center: Coord) -> None:
+        """Moves a threat to a new center and updates the attached roadmaps
+
+        :param index: the index of the threat
+        :param center: the new center of the threat
+        """
+        threat = self.threats[index]
+        self.threats[index] = Circle(center, threat.radius)
+        self._update_threats([threat, self.threats[index]])
+
+    def _update_threats(self, threats: List[Circle]) -> None:
+        """Resets the threats' arrays and spatial index after a change, and updates the attached roadmaps
+
+        :param threats: the changed threats, both before and after the change
+        """
+        self._threats_arrays = None
+        self._threats_tree = None
+        if self._executor is not None:
+            # the workers hold the previous threats
+            self._executor.shutdown()
+            self._start_executor()
+        for roadmap in list(self._roadmaps):
+            roadmap.update_threats(threats)
+
     def _create_threats(self, num_threats: int) -> None:
         """Creates the random threats of the environment
 
@@ -133,9 +448,73 @@ class Environment:
         :param v: the second point of the edge
         :return: the attributes of the segment
         """
-        segment = LineString([u, v])
+        segment = LineString([u.xy, v.xy])
         return {'length': segment.length,
-                'risk': sum([threat.path_intersection([u, v]) for threat in self.threats])}
+                'risk': sum([threat.path_intersection(Path([u, v])) for threat in self.threats])}
+
+    @contextmanager
+    def parallel(self, workers: int = None, threads: bool = False) -> Iterator['Environment']:
+        """Evaluates the attributes of many segments in parallel within the context, in chunks of segments.
+        Worker processes receive the threats once when they start, while worker threads share the environment and
+        run the vectorized shapely calls which release the GIL
+
+        :param workers: the number of workers, the number of processors by default
+        :param threads: if to evaluate in threads instead of processes
+        :return: the environment
+        """
+        self._parallel = (workers, threads)
+        self._start_executor()
+        try:
+            yield self
+        finally:
+            self._executor.shutdown()
+            self._parallel = self._executor = None
+
+    def _start_executor(self) -> None:
+        """Starts the workers evaluating segments in parallel"""
+        workers, threads = self._parallel
+        if threads:
+            # the threats arrays and spatial index are built before the threads share them
+            _ = self.threats_radii, self.threats_tree
+            self._executor = ThreadPoolExecutor(workers)
+        else:
+            self._executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(
+                self.threats_centers, self.threats_radii, (self._x_range, self._y_range)))
+
+    def compute_segments_attributes(self, segments: Sequence[Tuple[Tuple[float, float], Tuple[float, float]]]) \
+            -> Dict[str, np.ndarray]:
+        """Computes the attributes of given edges at once, intersecting each edge only with threats it may cross.
+        Within the parallel context, chunks of the edges are computed by the workers
+
+        :param segments: the edges as pairs of xy points
+        :return: the attributes of the segments
+        """
+        segments = np.asarray(segments, dtype=float).reshape(-1, 2, 2)
+        if self._executor is None or len(segments) <= PARALLEL_CHUNK_SIZE:
+            return self._compute_segments_attributes(segments)
+
+        chunks = [segments[begin:begin + PARALLEL_CHUNK_SIZE]
+                  for begin in range(0, len(segments), PARALLEL_CHUNK_SIZE)]
+        compute = self._compute_segments_attributes if self._parallel[1] else _compute_chunk_attributes
+        results = list(self._executor.map(compute, chunks))
+        return {attribute: np.concatenate([result[attribute] for result in results]) for attribute in results[0]}
+
+    def _compute_segments_attributes(self, segments: np.ndarray) -> Dict[str, np.ndarray]:
+        """Computes the attributes of given edges at once in the calling process
+
+        :param segments: the edges as an array of pairs of xy points
+        :return: the attributes of the segments
+        """
+        lines = shapely.linestrings(segments)
+        lengths = np.hypot(*(segments[:, 1] - segments[:, 0]).T)
+
+        risks = np.zeros(len(segments))
+        if len(self.threats_radii):
+            segment_idx, threat_idx = self.threats_tree.query(lines, predicate='intersects')
+            intersections = shapely.intersection(lines[segment_idx], self.threats_tree.geometries[threat_idx])
+            risks = np.bincount(segment_idx, weights=shapely.length(intersections), minlength=len(segments))
+
+        return {'length': lengths, 'risk': risks}
 
     def compute_path_attributes(self, path: List[Coord]) -> Dict[str, float]:
         """Computes the attributes of a given path
@@ -166,10 +545,34 @@ class Environment:
         plt.axis('equal')
 
         # plot threats
-        for threat in self._threats:
+        for threat in self.threats:
             threat.plot()
 
         # plot source and target
         for endpoint in [self._source, self._target]:
             plt.scatter(endpoint.x, endpoint.y, color='black', zorder=9, s=60)
             plt.scatter(endpoint.x, endpoint.y, color='gold', zorder=10, s=50)
+
+
+# the threats of a worker process evaluating segments in parallel
+_worker_environment = None
+
+
+def _init_worker(centers: np.ndarray, radii: np.ndarray, env_range: Tuple[int, int]) -> None:
+    """Creates the environment of a worker process from the threats arrays
+
+    :param centers: the xy centers of the threats
+    :param radii: the radii of the threats
+    :param env_range: the range of the environment
+    """
+    global _worker_environment
+    _worker_environment = Environment.from_arrays(Coord(0, 0), Coord(0, 0), centers, radii, env_range)
+
+
+def _compute_chunk_attributes(segments: np.ndarray) -> Dict[str, np.ndarray]:
+    """Computes the attributes of a chunk of segments in a worker process
+
+    :param segments: the edges as an array of pairs of xy points
+    :return: the attributes of the segments
+    """
+    return _worker_environment._compute_segments_attributes(segments)
@@ -0,0 +1,203 @@
+from abc import ABC, abstractmethod
+from itertools import combinations
+from random import getrandbits
+from typing import List, Tuple
+
+import numpy as np
+
+from environment.environment import Environment
+from geometry.circle import Circle
+from geometry.coord import Coord
+from geometry.geometric import calculate_tangent_segments_of_circles
+
+# max number of batches drawn to gather the requested number of samples
+MAX_BATCHES = 100
+
+
+class Sampler(ABC):
+    def __init__(self, environment: Environment, is_safe_sample: bool = False, seed_value: int = None) -> None:
+        """Init of sampler of points in the environment, drawing whole batches at once
+
+        :param environment: the environment
+        :param is_safe_sample: if sample only safe points
+        :param seed_value: seed of the samples, drawn from the global random state if not given
+        """
+        self._environment = environment
+        self._is_safe_sample = is_safe_sample
+        self._rng = np.random.default_rng(getrandbits(32) if seed_value is None else seed_value)
+
+    @abstractmethod
+    def _sample_batch(self, num_samples: int) -> np.ndarray:
+        """Draws a batch of candidate points
+
+        :param num_samples: the number of points to draw
+        :return: the xy points, may be fewer than the requested number
+        """
+        pass
+
+    def sample_array(self, num_samples: int) -> np.ndarray:
+        """Samples points in the environment
+
+        :param num_samples: num to sample
+        :return: the xy points of the samples
+        """
+        batches, num_sampled = [], 0
+        for _ in range(MAX_BATCHES):
+            batch = self._sample_batch(num_samples - num_sampled)
+            if self._is_safe_sample:
+                batch = batch[self._environment.are_safe_points(batch)]
+
+            batches.append(batch)
+            num_sampled += len(batch)
+            if num_sampled >= num_samples or not self._is_resampling:
+                break
+
+        return np.concatenate(batches)[:num_samples]
+
+    def sample(self, num_samples: int) -> List[Coord]:
+        """Samples points in the environment
+
+        :param num_samples: num to sample
+        :return: the samples
+        """
+        return [Coord(x, y) for x, y in self.sample_array(num_samples).tolist()]
+
+    @property
+    def _is_resampling(self) -> bool:
+        """If drawing another batch may add new points
+
+        :return: if drawing another batch may add new points
+        """
+        return True
+
+    def _uniform(self, num_samples: int) -> np.ndarray:
+        """Draws uniform integer points in the environment, like Environment.sample
+
+        :param num_samples: the number of points to draw
+        :return: the xy points
+        """
+        return self._rng.integers(0, [self._environment.x_range + 1, self._environment.y_range + 1],
+                                  size=(num_samples, 2)).astype(float)
+
+    def _inside_range(self, points: np.ndarray) -> np.ndarray:
+        """Drops points outside the environment's range
+
+        :param points: the xy points
+        :return: the points inside the range
+        """
+        return points[(points[:, 0] >= 0) & (points[:, 0] <= self._environment.x_range)
+                      & (points[:, 1] >= 0) & (points[:, 1] <= self._environment.y_range)]
+
+
+class UniformSampler(Sampler):
+    def _sample_batch(self, num_samples: int) -> np.ndarray:
+        return self._uniform(num_samples)
+
+
+class GaussianBoundarySampler(Sampler):
+    def __init__(self, environment: Environment, sigma: float = 10, is_safe_sample: bool = False,
+                 seed_value: int = None) -> None:
+        """Init of sampler of points around the threats' boundaries
+
+        :param environment: the environment
+        :param sigma: the standard deviation of the distance of a sample from the boundary
+        :param is_safe_sample: if sample only safe points
+        :param seed_value: seed of the samples
+        """
+        super().__init__(environment, is_safe_sample, seed_value)
+        self._sigma = sigma
+
+    def _sample_batch(self, num_samples: int) -> np.ndarray:
+        # the threats are read on each batch since they may have changed
+        centers, radii = self._environment.threats_centers, self._environment.threats_radii
+        if not len(radii):
+            return self._uniform(num_samples)
+
+        # threats are chosen by the length of their boundaries
+        threat_idx = self._rng.choice(len(radii), size=num_samples, p=radii / radii.sum())
+        angles = self._rng.uniform(0, 2 * np.pi, size=num_samples)
+        distances = radii[threat_idx] + self._rng.normal(0, self._sigma, size=num_samples)
+
+        points = centers[threat_idx] + distances[:, None] * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+        return self._inside_range(points)
+
+
+class BridgeSampler(Sampler):
+    def __init__(self, environment: Environment, sigma: float = 50, is_safe_sample: bool = False,
+                 seed_value: int = None) -> None:
+        """Init of sampler of points between threats, as midpoints of short bridges whose ends are inside threats
+
+        :param environment: the environment
+        :param sigma: the standard deviation of the bridges' length on each axis
+        :param is_safe_sample: if sample only safe points
+        :param seed_value: seed of the samples
+        """
+        super().__init__(environment, is_safe_sample, seed_value)
+        self._sigma = sigma
+
+    def _sample_batch(self, num_samples: int) -> np.ndarray:
+        # draw more bridges than needed since most of them are rejected
+        starts = self._uniform(4 * num_samples)
+        ends = starts + self._rng.normal(0, self._sigma, size=starts.shape)
+        midpoints = (starts + ends) / 2
+
+        is_bridge = ~self._environment.are_safe_points(starts) & ~self._environment.are_safe_points(ends) \
+            & self._environment.are_safe_points(midpoints)
+        return self._inside_range(midpoints[is_bridge])[:num_samples]
+
+
+class TangentSampler(Sampler):
+    def __init__(self, environment: Environment, is_safe_sample: bool = False, seed_value: int = None) -> None:
+        """Init of sampler of the tangent points of the threats' common tangents and of the tangents from the endpoints.
+        There are finitely many such points, so fewer samples than requested may be returned
+
+        :param environment: the environment
+        :param is_safe_sample: if sample only safe points
+        :param seed_value: seed of the samples
+        """
+        super().__init__(environment, is_safe_sample, seed_value)
+        self._points = self._inside_range(np.array(self._tangent_points(), dtype=float).reshape(-1, 2))
+
+    def _tangent_points(self) -> List[Tuple[float, float]]:
+        """Computes the tangent points on the threats' safe boundaries
+
+        :return: the tangent points
+        """
+        threats = self._environment.threats
+        radii = [threat.radius + Circle.EPSILON for threat in threats]
+
+        points = []
+        for endpoint in self._environment.endpoints:
+            for threat, radius in zip(threats, radii):
+                if endpoint.distance_to(threat.center) > radius:
+                    points.extend(p.xy for p in endpoint.contact_points_with_circle(threat.center, radius))
+
+        for i, j in combinations(range(len(threats)), 2):
+            for p1, p2 in calculate_tangent_segments_of_circles(threats[i].center, radii[i],
+                                                                 threats[j].center, radii[j]):
+                points.extend([p1.xy, p2.xy])
+        return points
+
+    @property
+    def _is_resampling(self) -> bool:
+        return False
+
+    def _sample_batch(self, num_samples: int) -> np.ndarray:
+        return self._points[self._rng.permutation(len(self._points))[:num_samples]]
+
+
+class MixtureSampler(Sampler):
+    def __init__(self, samplers: List[Sampler], weights: List[float], seed_value: int = None) -> None:
+        """Init of sampler drawing from other samplers by given proportions
+
+        :param samplers: the samplers
+        :param weights: the proportion of the samples drawn from each sampler
+        :param seed_value: seed of the proportions
+        """
+        super().__init__(samplers[0]._environment, False, seed_value)
+        self._samplers = samplers
+        self._weights = np.array(weights, dtype=float) / sum(weights)
+
+    def _sample_batch(self, num_samples: int) -> np.ndarray:
+        counts = self._rng.multinomial(num_samples, self._weights)
+        return np.concatenate([sampler.sample_array(count) for sampler, count in zip(self._samplers, counts)])
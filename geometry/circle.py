@@ -20,8 +20,10 @@ class Circle(Entity):
     def __init__(self, center: Coord, radius: float) -> None:
         self._center = center
         self._radius = radius
-        self._inner_polygon = center.to_shapely.buffer(radius, resolution=Circle.BUFFER_RESOLUTION)
-        self._outer_polygon = center.to_shapely.buffer(radius + Circle.EPSILON, resolution=Circle.BUFFER_RESOLUTION)
+
+        # the polygons are computed on first use
+        self._inner_polygon = None
+        self._outer_polygon = None
         self._boundary = None
 
     @property
@@ -34,15 +36,20 @@ class Circle(Entity):
 
     @property
     def inner_polygon(self) -> Polygon:
+        if self._inner_polygon is None:
+            self._inner_polygon = self.center.to_shapely.buffer(self.radius, resolution=Circle.BUFFER_RESOLUTION)
         return self._inner_polygon
 
     @property
     def outer_polygon(self) -> Polygon:
+        if self._outer_polygon is None:
+            self._outer_polygon = self.center.to_shapely.buffer(self.radius + Circle.EPSILON,
+                                                                resolution=Circle.BUFFER_RESOLUTION)
         return self._outer_polygon
 
     @property
     def to_shapely(self) -> Polygon:
-        return self._inner_polygon
+        return self.inner_polygon
 
     def path_intersection(self, path: Path) -> float:
         return sum([self.inner_polygon.intersection(segment.to_shapely).length for segment in path.segments])
@@ -1,6 +1,6 @@
 import math
 from math import atan2
-from typing import Tuple
+from typing import List, Tuple
 
 from geometry.coord import Coord
 
@@ -142,3 +142,33 @@ def calculate_inner_tangent_points_of_circles(center1: Coord, radius1: float, ce
 
     return center1.shifted(radius1, upper_theta), center1.shifted(radius1, lower_theta), \
            center2.shifted(radius2, math.pi - upper_theta), center2.shifted(radius2, math.pi - lower_theta)
+
+
+def calculate_tangent_segments_of_circles(center1: Coord, radius1: float, center2: Coord, radius2: float) \
+        -> List[Tuple[Coord, Coord]]:
+    """Calculate the segments of the outer and the inner common tangents of two circles
+
+    :param center1: the center of circle1
+    :param radius1: the radius of circle1
+    :param center2: the center of circle2
+    :param radius2: the radius of circle2
+    :return: the tangent segments from circle1 to circle2, the outer ones first
+    """
+    distance = math.hypot(center2.x - center1.x, center2.y - center1.y)
+    dx, dy = (center2.x - center1.x) / distance, (center2.y - center1.y) / distance
+
+    segments = []
+    # the tangent points are on the same side of the centers line for outer tangents and on opposite sides for inner
+    for side in [1, -1]:
+        cos_normal = (radius1 - side * radius2) / distance
+        if cos_normal ** 2 > 1:
+            continue
+
+        sin_normal = math.sqrt(1 - cos_normal ** 2)
+        for sign in [1, -1]:
+            # the unit normal of the tangent line
+            nx = dx * cos_normal - sign * sin_normal * dy
+            ny = dy * cos_normal + sign * sin_normal * dx
+            segments.append((Coord(center1.x + radius1 * nx, center1.y + radius1 * ny),
+                             Coord(center2.x + side * radius2 * nx, center2.y + side * radius2 * ny)))
+    return segments
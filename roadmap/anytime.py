@@ -0,0 +1,87 @@
+from math import ceil, inf
+from time import time
+from typing import Dict, List, Tuple, Union
+
+import networkx as nx
+
+from environment.sampling import Sampler
+from geometry.coord import Coord
+from roadmap.roadmap import Roadmap
+
+ANYTIME_BATCH_SIZE = 100
+
+# the number of samples added by the first step, which measures the time of adding a sample
+ANYTIME_FIRST_STEP = 10
+
+
+class AnytimePlanner:
+    def __init__(self, roadmap: Roadmap, weight: Union[str, Dict[str, float]] = 'length',
+                 batch_size: int = ANYTIME_BATCH_SIZE, sampler: Sampler = None) -> None:
+        """Init of anytime planner, which grows a sampling roadmap in batches between the environment's endpoints.
+        After each batch the shortest path is repaired by the replanning session of the roadmap, so the search is
+        incremental over the added edges
+
+        :param roadmap: the roadmap, which adds samples only
+        :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+        :param batch_size: the number of samples added between the searches
+        :param sampler: the sampling strategy, uniform sampling of the environment by default
+        """
+        self._roadmap = roadmap
+        self._session = roadmap.replanning_session(weight)
+        self._batch_size = batch_size
+        self._sampler = sampler
+
+        # the path of the last search is the best so far, since the roadmap only gains edges
+        self._incumbent = None
+
+    def plan(self, deadline: float, max_samples: int = None) -> Tuple[List[Coord], float, float,
+                                                                       List[Tuple[float, int, float, float]]]:
+        """Interleaves sampling batches and searches until the deadline. The samples of a batch are added in steps
+        which double in size, and each step is cut to the samples expected to be added before the deadline by the time
+        of adding a sample in the last step, so a slow batch is cut short. A batch is started only if the search after
+        it is expected to end before the deadline
+
+        :param deadline: the time budget in seconds
+        :param max_samples: the maximal number of samples to add
+        :return: the best path, its length and risk, and the elapsed time, number of nodes, length and risk after each
+        batch
+        """
+        start = time()
+        graph = self._roadmap.graph
+        trace, num_samples = [], 0
+        step_size, sample_time, search_time = ANYTIME_FIRST_STEP, 0, 0
+        while time() - start + search_time <= deadline and (max_samples is None or num_samples < max_samples):
+            batch_size = self._batch_size if max_samples is None else min(self._batch_size, max_samples - num_samples)
+            batch_end = num_samples + batch_size
+            while num_samples < batch_end:
+                num_step_samples = min(step_size, batch_end - num_samples)
+                if sample_time:
+                    num_step_samples = min(num_step_samples, int((deadline - (time() - start)) / sample_time))
+                if num_step_samples <= 0:
+                    break
+
+                # the roadmap repairs the session for the added edges
+                step_start = time()
+                self._roadmap.add_samples(num_step_samples, self._sampler)
+                num_samples += num_step_samples
+                sample_time = (time() - step_start) / num_step_samples
+                step_size *= 2
+
+            search_start = time()
+            try:
+                self._incumbent = self._session.path()
+            except nx.NetworkXNoPath:
+                pass
+            search_time = time() - search_start
+
+            length, risk = self._incumbent[1:3] if self._incumbent is not None else (inf, inf)
+            trace.append((round(time() - start, 3), graph.number_of_nodes(), length, risk))
+
+            # a batch cut short leaves no time for another one
+            if num_samples < batch_end:
+                break
+
+        if self._incumbent is None:
+            raise nx.NetworkXNoPath(f'No path was found within {deadline} seconds.')
+        path, length, risk, _ = self._incumbent
+        return path, length, risk, trace
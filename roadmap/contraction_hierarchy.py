@@ -0,0 +1,278 @@
+import hashlib
+import heapq
+import json
+from math import inf
+from time import time
+from typing import Callable, Dict, List, Tuple
+
+import networkx as nx
+import numpy as np
+
+# max number of nodes settled by a witness search
+WITNESS_SETTLE_LIMIT = 64
+
+
+class ContractionHierarchy:
+    def __init__(self, nodes: List[Tuple[float, float]], weight: Dict[str, float], up: List[List[Tuple[int, float]]],
+                 middle: Dict[Tuple[int, int], int], preprocessing_time: float, digest: str = '') -> None:
+        """Init of contraction hierarchy of a roadmap for a single weight.
+        The shortest paths are found by bidirectional searches over the edges to higher ranked nodes only
+
+        :param nodes: the nodes of the roadmap
+        :param weight: the coefficient of each attribute in the weight
+        :param up: the edges of each node to higher ranked nodes and their weights, including shortcuts
+        :param middle: the contracted node of each shortcut, keyed by its nodes in increasing order
+        :param preprocessing_time: the computation time of the contraction
+        :param digest: the digest of the weights of the edges the hierarchy was built from
+        """
+        self._nodes = nodes
+        self._index = {node: i for i, node in enumerate(nodes)}
+        self._weight = weight
+        self._up = up
+        self._middle = middle
+        self._preprocessing_time = preprocessing_time
+        self._digest = digest
+
+    @property
+    def weight(self) -> Dict[str, float]:
+        """The weight of the hierarchy
+
+        :return: the coefficient of each attribute in the weight
+        """
+        return self._weight
+
+    @property
+    def nodes(self) -> List[Tuple[float, float]]:
+        """The nodes of the hierarchy
+
+        :return: the nodes of the hierarchy
+        """
+        return self._nodes
+
+    @property
+    def preprocessing_time(self) -> float:
+        """The computation time of the contraction
+
+        :return: the computation time of the contraction
+        """
+        return round(self._preprocessing_time, 3)
+
+    @property
+    def digest(self) -> str:
+        """The digest of the weights of the edges the hierarchy was built from
+
+        :return: the digest of the weights of the edges
+        """
+        return self._digest
+
+    @classmethod
+    def build(cls, graph: nx.Graph, weight: Dict[str, float]) -> 'ContractionHierarchy':
+        """Contracts the nodes of a graph in order of their edge difference, contracted neighbors and level, adding a
+        shortcut between each pair of neighbors of a contracted node unless a witness search finds a path between them
+        which is not longer
+
+        :param graph: the graph
+        :param weight: the coefficient of each attribute in the weight
+        :return: the contraction hierarchy of the graph
+        """
+        start = time()
+        edge_weight = weight_function(weight)
+
+        nodes = list(graph.nodes)
+        index = {node: i for i, node in enumerate(nodes)}
+
+        # the remaining graph, from which the contracted nodes are removed
+        adj = [{} for _ in nodes]
+        for u, v, edge_data in graph.edges(data=True):
+            adj[index[u]][index[v]] = adj[index[v]][index[u]] = edge_weight(edge_data)
+
+        def _witness_search(source: int, excluded: int, targets: Dict[int, float]) -> Dict[int, float]:
+            limit = max(targets.values())
+            dist, remaining, settled = {source: 0}, set(targets), 0
+            queue = [(0, source)]
+            while queue and remaining and settled < WITNESS_SETTLE_LIMIT:
+                node_dist, node = heapq.heappop(queue)
+                if node_dist > dist[node]:
+                    continue
+                if node_dist > limit:
+                    break
+                remaining.discard(node)
+                settled += 1
+
+                for neighbor, neighbor_weight in adj[node].items():
+                    neighbor_dist = node_dist + neighbor_weight
+                    if neighbor != excluded and neighbor_dist < dist.get(neighbor, inf):
+                        dist[neighbor] = neighbor_dist
+                        heapq.heappush(queue, (neighbor_dist, neighbor))
+            return dist
+
+        def _shortcuts(node: int) -> List[Tuple[int, int, float]]:
+            neighbors = list(adj[node].items())
+            shortcuts = []
+            for i, (u, u_weight) in enumerate(neighbors[:-1]):
+                targets = {v: u_weight + v_weight for v, v_weight in neighbors[i + 1:]}
+                dist = _witness_search(u, node, targets)
+                shortcuts.extend((u, v, w) for v, w in targets.items() if dist.get(v, inf) > w)
+            return shortcuts
+
+        # the level of a node is the length of the longest chain of contracted nodes below it
+        contracted_neighbors, level = [0] * len(nodes), [0] * len(nodes)
+
+        def _priority(node: int, shortcuts: List[Tuple[int, int, float]]) -> int:
+            edge_difference = len(shortcuts) - len(adj[node])
+            return 2 * edge_difference + contracted_neighbors[node] + level[node]
+
+        queue = [(_priority(node, _shortcuts(node)), node) for node in range(len(nodes))]
+        heapq.heapify(queue)
+
+        up, middle = [[] for _ in nodes], {}
+        while queue:
+            _, node = heapq.heappop(queue)
+
+            # the priority may have increased since the node was pushed
+            shortcuts = _shortcuts(node)
+            node_priority = _priority(node, shortcuts)
+            if queue and node_priority > queue[0][0]:
+                heapq.heappush(queue, (node_priority, node))
+                continue
+
+            for neighbor, neighbor_weight in adj[node].items():
+                up[node].append((neighbor, neighbor_weight))
+                del adj[neighbor][node]
+                contracted_neighbors[neighbor] += 1
+                level[neighbor] = max(level[neighbor], level[node] + 1)
+            adj[node] = {}
+
+            for u, v, w in shortcuts:
+                if w < adj[u].get(v, inf):
+                    adj[u][v] = adj[v][u] = w
+                    middle[(min(u, v), max(u, v))] = node
+
+        return cls(nodes, dict(weight), up, middle, time() - start, weights_digest(graph, weight))
+
+    def shortest_path(self, sources: Dict[Tuple[float, float], float], targets: Dict[Tuple[float, float], float]) \
+            -> Tuple[List[Tuple[float, float]], float]:
+        """Computes the shortest path between sources and targets by a bidirectional search over the edges to higher
+        ranked nodes
+
+        :param sources: the source nodes and the initial weight of each
+        :param targets: the target nodes and the initial weight of each
+        :return: the shortest path from a source to a target and its weight including the initial weights
+        """
+        dists, preds, queues = [{}, {}], [{}, {}], [[], []]
+        for side, seeds in enumerate([sources, targets]):
+            for node, seed_dist in seeds.items():
+                if node not in self._index:
+                    raise nx.NodeNotFound(f'Node {node} is not in the contraction hierarchy.')
+                i = self._index[node]
+                if seed_dist < dists[side].get(i, inf):
+                    dists[side][i], preds[side][i] = seed_dist, None
+                    queues[side].append((seed_dist, i))
+            heapq.heapify(queues[side])
+
+        best, meeting = inf, None
+        while True:
+            # expand the side with the lower tentative distance, while it can improve the best path
+            tops = [queue[0][0] if queue else inf for queue in queues]
+            side = 0 if tops[0] <= tops[1] else 1
+            if tops[side] >= best:
+                break
+
+            node_dist, node = heapq.heappop(queues[side])
+            dist, other_dist = dists[side], dists[1 - side]
+            if node_dist > dist[node]:
+                continue
+            if node in other_dist and node_dist + other_dist[node] < best:
+                best, meeting = node_dist + other_dist[node], node
+
+            # a node reached better from a higher ranked node is on no shortest path going up, so it is stalled
+            edges = self._up[node]
+            if any(neighbor_weight + dist.get(neighbor, inf) < node_dist for neighbor, neighbor_weight in edges):
+                continue
+
+            for neighbor, neighbor_weight in edges:
+                neighbor_dist = node_dist + neighbor_weight
+                if neighbor_dist < dist.get(neighbor, inf):
+                    dist[neighbor] = neighbor_dist
+                    preds[side][neighbor] = node
+                    heapq.heappush(queues[side], (neighbor_dist, neighbor))
+
+        if meeting is None:
+            raise nx.NetworkXNoPath(f'No path between {list(sources)} and {list(targets)}.')
+
+        path = []
+        for side in [0, 1]:
+            half, node = [], meeting
+            while node is not None:
+                half.append(node)
+                node = preds[side][node]
+            path.extend(half[::-1] if side == 0 else half[1:])
+        return [self._nodes[i] for i in self._unpack(path)], best
+
+    def _unpack(self, path: List[int]) -> List[int]:
+        """Unpacks the shortcuts of a path into the edges of the roadmap
+
+        :param path: the path in the hierarchy
+        :return: the path in the roadmap
+        """
+        unpacked, stack = path[:1], list(zip(path[:-1], path[1:]))[::-1]
+        while stack:
+            u, v = stack.pop()
+            node = self._middle.get((min(u, v), max(u, v)))
+            if node is None:
+                unpacked.append(v)
+            else:
+                stack.extend([(node, v), (u, node)])
+        return unpacked
+
+    def save(self, file_path: str) -> None:
+        """Saves the hierarchy to a npz file
+
+        :param file_path: the path of the file
+        """
+        indptr = np.cumsum([0] + [len(edges) for edges in self._up])
+        edges = np.array([edge for edges in self._up for edge in edges], dtype=float).reshape(-1, 2)
+        np.savez(file_path, nodes=np.array(self._nodes, dtype=float).reshape(-1, 2), weight=json.dumps(self._weight),
+                 indptr=indptr, heads=edges[:, 0].astype(np.int64), weights=edges[:, 1],
+                 shortcuts=np.array(list(self._middle), dtype=np.int64).reshape(-1, 2),
+                 middles=np.array(list(self._middle.values()), dtype=np.int64),
+                 preprocessing_time=self._preprocessing_time, digest=self._digest)
+
+    @classmethod
+    def load(cls, file_path: str) -> 'ContractionHierarchy':
+        """Loads a hierarchy from a npz file
+
+        :param file_path: the path of the file
+        :return: the hierarchy
+        """
+        with np.load(file_path) as data:
+            nodes = [tuple(node) for node in data['nodes'].tolist()]
+            indptr, heads, weights = data['indptr'].tolist(), data['heads'].tolist(), data['weights'].tolist()
+            up = [list(zip(heads[begin:end], weights[begin:end])) for begin, end in zip(indptr[:-1], indptr[1:])]
+            middle = dict(zip(map(tuple, data['shortcuts'].tolist()), data['middles'].tolist()))
+            digest = str(data['digest']) if 'digest' in data else ''
+            return cls(nodes, json.loads(str(data['weight'])), up, middle, float(data['preprocessing_time']), digest)
+
+
+def weight_function(weight: Dict[str, float]) -> Callable[[Dict], float]:
+    """Gets the function of the weighted sum of the attributes of an edge
+
+    :param weight: the coefficient of each attribute in the weight
+    :return: the weight of an edge given its data
+    """
+    items = list(weight.items())
+    return lambda edge_data: sum(coefficient * edge_data[attribute] for attribute, coefficient in items)
+
+
+def weights_digest(graph: nx.Graph, weight: Dict[str, float]) -> str:
+    """Computes a digest of the edges of a graph and their weights, which changes if any edge or its weight changes
+
+    :param graph: the graph
+    :param weight: the coefficient of each attribute in the weight
+    :return: the digest
+    """
+    edge_weight = weight_function(weight)
+    edges = np.array([(*min(u, v), *max(u, v), edge_weight(edge_data)) for u, v, edge_data in graph.edges(data=True)],
+                     dtype=float).reshape(-1, 5)
+    edges = edges[np.lexsort(edges.T[::-1])]
+    return hashlib.sha256(edges.tobytes()).hexdigest()
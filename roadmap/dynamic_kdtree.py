@@ -0,0 +1,86 @@
+from typing import List, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+BUFFER_SIZE = 256
+
+
+class DynamicKDTree:
+    def __init__(self, points: List[Tuple[float, float]] = None) -> None:
+        """Init of a kd-tree supporting insertions.
+        The points are kept in static kd-trees of distinct power of two sizes, which are merged like a binary counter,
+        and a small buffer of the latest points, so insertions and queries take O(log^2 n) amortized time
+
+        :param points: initial points
+        """
+        self._buffer = np.empty((BUFFER_SIZE, 2))
+        self._buffer_size = 0
+        self._trees = []
+        self._size = 0
+
+        if points:
+            self._trees.append(cKDTree(np.array(points, dtype=float).reshape(-1, 2)))
+            self._size = len(points)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _flush(self) -> None:
+        """Merges the buffer with the smaller trees into a new tree"""
+        points = [self._buffer[:self._buffer_size].copy()]
+        while self._trees and self._trees[-1].n <= sum(len(p) for p in points):
+            points.append(self._trees.pop().data)
+
+        self._trees.append(cKDTree(np.concatenate(points)))
+        self._buffer_size = 0
+
+    def insert(self, point: Tuple[float, float]) -> None:
+        """Inserts a point
+
+        :param point: the point
+        """
+        self._buffer[self._buffer_size] = point
+        self._buffer_size += 1
+        self._size += 1
+        if self._buffer_size == BUFFER_SIZE:
+            self._flush()
+
+    def _buffer_distances(self, point: Tuple[float, float]) -> np.ndarray:
+        """Computes the distances of the buffered points from a given point
+
+        :param point: the point
+        :return: the distances of the buffered points
+        """
+        buffer = self._buffer[:self._buffer_size]
+        return np.hypot(buffer[:, 0] - point[0], buffer[:, 1] - point[1])
+
+    def nearest(self, point: Tuple[float, float]) -> Tuple[float, float]:
+        """Finds the nearest point to a given point
+
+        :param point: the point
+        :return: the nearest point
+        """
+        best, best_distance = None, np.inf
+        if self._buffer_size:
+            distances = self._buffer_distances(point)
+            i = distances.argmin()
+            best, best_distance = self._buffer[i], distances[i]
+
+        for tree in self._trees:
+            distance, i = tree.query(point, distance_upper_bound=best_distance)
+            if distance < best_distance:
+                best, best_distance = tree.data[i], distance
+        return tuple(best.tolist()) if best is not None else None
+
+    def near(self, point: Tuple[float, float], radius: float) -> List[Tuple[float, float]]:
+        """Finds the points in a radius from a given point
+
+        :param point: the point
+        :param radius: the radius
+        :return: the points in the radius
+        """
+        near = [tuple(tree.data[i].tolist()) for tree in self._trees for i in tree.query_ball_point(point, radius)]
+        if self._buffer_size:
+            near.extend(map(tuple, self._buffer[:self._buffer_size][self._buffer_distances(point) <= radius].tolist()))
+        return near
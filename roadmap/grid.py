@@ -1,38 +1,234 @@
+import math
+from time import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import shapely
+
+from geometry.circle import Circle
 from geometry.coord import Coord
 from environment.environment import Environment
-from roadmap.roadmap import Roadmap
+from roadmap.contraction_hierarchy import weight_function
+from roadmap.roadmap import Roadmap, EPSILON, QUERY_NEIGHBORHOOD_K
 
 GRID_STEP = 50
 
+# offsets of the 8 neighbours of a grid node
+NEIGHBOR_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
 
 class Grid(Roadmap):
-    def __init__(self, environment: Environment) -> None:
-        super().__init__(environment)
+    def __init__(self, environment: Environment, step: int = GRID_STEP, implicit: bool = False) -> None:
+        """Init of grid
 
-        grid_nodes = []
-        for x in range(0, int(environment.x_range), GRID_STEP):
-            row = []
-            for y in range(0, int(environment.y_range), GRID_STEP):
-                row.append(Coord(x,y))
+        :param environment: the environment
+        :param step: the distance between neighbouring grid nodes
+        :param implicit: if to compute the neighbours of the grid nodes and the data of their edges on demand during
+        the searches instead of materializing the edges
+        """
+        self._init_state(environment, step, implicit)
+        self._build()
 
-            grid_nodes.append(row)
+    def _init_state(self, environment: Environment, step: int = GRID_STEP, implicit: bool = False) -> None:
+        super()._init_state(environment)
+        self._step = step
+        self._implicit = implicit
+        self._columns = len(range(0, int(environment.x_range), step))
+        self._rows = len(range(0, int(environment.y_range), step))
 
-        grid_edges = []
-        for r in range(1, len(grid_nodes)-1):
-            for c in range(1, len(grid_nodes[0])-1):
-                grid_edges.append((grid_nodes[r][c], grid_nodes[r][c+1]))
-                grid_edges.append((grid_nodes[r][c], grid_nodes[r][c-1]))
+        # nodes which are not on the grid are connected to the corners of their cell
+        self._attached = {}
+
+        # data of the edges evaluated so far in implicit mode
+        self._edges_data = {}
 
-                grid_edges.append((grid_nodes[r][c], grid_nodes[r+1][c]))
-                grid_edges.append((grid_nodes[r][c], grid_nodes[r+1][c-1]))
-                grid_edges.append((grid_nodes[r][c], grid_nodes[r+1][c+1]))
+        if implicit:
+            self._attach(environment.endpoints)
 
-                grid_edges.append((grid_nodes[r][c], grid_nodes[r-1][c]))
-                grid_edges.append((grid_nodes[r][c], grid_nodes[r-1][c-1]))
-                grid_edges.append((grid_nodes[r][c], grid_nodes[r-1][c+1]))
+    def _build(self) -> None:
+        super()._build()
+        if self._implicit:
+            return
 
-                grid_edges.append((grid_nodes[r][c], grid_nodes[r - 1][c]))
-                grid_edges.append((grid_nodes[r][c], grid_nodes[r - 1][c - 1]))
-                grid_edges.append((grid_nodes[r][c], grid_nodes[r - 1][c + 1]))
+        environment, step = self._environment, self._step
+        grid_edges = []
+        for i in range(self._columns):
+            for j in range(self._rows):
+                # each edge once, from its lower left node
+                for di, dj in [(0, 1), (1, -1), (1, 0), (1, 1)]:
+                    if 0 <= i + di < self._columns and 0 <= j + dj < self._rows:
+                        grid_edges.append((Coord(i * step, j * step), Coord((i + di) * step, (j + dj) * step)))
+
+        # endpoints which are not grid nodes are connected to the corners of their cells
+        grid_edges.extend((point, Coord(*corner)) for point in environment.endpoints
+                          if self._grid_index(point.xy) is None for corner in self._cell_corners(point))
 
         self._add_edges(grid_edges)
+
+    def _parameters(self) -> Dict[str, Any]:
+        return {'step': self._step, 'implicit': self._implicit}
+
+    def _grid_index(self, node: Tuple[float, float]) -> Optional[Tuple[int, int]]:
+        """Computes the (i, j) index of a grid node
+
+        :param node: the node
+        :return: the index of the node, None if it is not a grid node
+        """
+        x, y = node
+        if x % self._step or y % self._step:
+            return None
+
+        i, j = int(x // self._step), int(y // self._step)
+        if not (0 <= i < self._columns and 0 <= j < self._rows):
+            return None
+        return i, j
+
+    def _cell_corners(self, point: Coord) -> List[Tuple[float, float]]:
+        """Computes the grid nodes at the corners of the cell of a point, the cell at the border of the grid if the
+        point is beyond it
+
+        :param point: the point
+        :return: the distinct corners of the cell
+        """
+        i = min(max(int(point.x // self._step), 0), self._columns - 1)
+        j = min(max(int(point.y // self._step), 0), self._rows - 1)
+        return list({(min(i + di, self._columns - 1) * self._step, min(j + dj, self._rows - 1) * self._step)
+                     for di in [0, 1] for dj in [0, 1]})
+
+    def _attach(self, points: List[Coord]) -> None:
+        """Connects points which are not grid nodes to the corners of their cells
+
+        :param points: the points
+        """
+        self._cache.clear()
+        for point in points:
+            if self._grid_index(point.xy) is not None or point.xy in self._attached:
+                continue
+
+            corners = self._cell_corners(point)
+            self._attached[point.xy] = corners
+            for corner in corners:
+                self._attached.setdefault(corner, []).append(point.xy)
+
+    def _detach(self, points: List[Coord]) -> None:
+        """Disconnects points which were attached to the grid
+
+        :param points: the points
+        """
+        self._cache.clear()
+        for point in points:
+            for corner in self._attached.pop(point.xy, []):
+                self._attached[corner].remove(point.xy)
+                self._edges_data.pop(self._edge_key(point.xy, corner), None)
+                if not self._attached[corner]:
+                    del self._attached[corner]
+
+    @staticmethod
+    def _edge_key(u: Tuple[float, float], v: Tuple[float, float]) \
+            -> Tuple[Tuple[float, float], Tuple[float, float]]:
+        """Gets the key of an undirected edge
+
+        :param u: the first node of the edge
+        :param v: the second node of the edge
+        :return: the key of the edge
+        """
+        return (u, v) if u <= v else (v, u)
+
+    def _neighbors(self, node: Tuple[float, float]) -> Iterable[Tuple[Tuple[float, float], Dict]]:
+        if not self._implicit:
+            return super()._neighbors(node)
+
+        neighbors = list(self._attached.get(node, []))
+        index = self._grid_index(node)
+        if index is not None:
+            i, j = index
+            neighbors.extend(((i + di) * self._step, (j + dj) * self._step) for di, dj in NEIGHBOR_OFFSETS
+                             if 0 <= i + di < self._columns and 0 <= j + dj < self._rows)
+
+        # evaluate the edges of the node which were not evaluated yet at once
+        keys = [self._edge_key(node, neighbor) for neighbor in neighbors]
+        missing = [key for key in keys if key not in self._edges_data]
+        if missing:
+            self._edges_data.update(zip(missing, self._compute_edges_data(missing)))
+
+        return [(neighbor, self._edges_data[key]) for neighbor, key in zip(neighbors, keys)]
+
+    def _edge_data(self, u: Tuple[float, float], v: Tuple[float, float]) -> Dict:
+        if not self._implicit:
+            return super()._edge_data(u, v)
+
+        key = self._edge_key(u, v)
+        if key not in self._edges_data:
+            self._edges_data[key] = self._compute_edges_data([key])[0]
+        return self._edges_data[key]
+
+    def _threatened_edges(self, threats: List[Circle]) -> List[Tuple[Tuple[float, float], Tuple[float, float]]]:
+        if not self._implicit:
+            return super()._threatened_edges(threats)
+
+        # an edge crossing the bounding box of a threat has both its nodes within a step of the box
+        keys = set()
+        for threat in threats:
+            min_x, min_y, max_x, max_y = threat.inner_polygon.bounds
+            for i in range(max(math.floor(min_x / self._step) - 1, 0), min(math.ceil(max_x / self._step) + 2,
+                                                                                self._columns)):
+                for j in range(max(math.floor(min_y / self._step) - 1, 0), min(math.ceil(max_y / self._step) + 2,
+                                                                                    self._rows)):
+                    node = (i * self._step, j * self._step)
+                    neighbors = [((i + di) * self._step, (j + dj) * self._step) for di, dj in NEIGHBOR_OFFSETS]
+                    keys.update(key for key in (self._edge_key(node, neighbor) for neighbor
+                                                in neighbors + self._attached.get(node, []))
+                                if key in self._edges_data)
+        if not keys:
+            return []
+
+        # only the edges evaluated so far are updated, the others are evaluated on demand
+        keys = list(keys)
+        lines = shapely.linestrings(np.array(keys, dtype=float))
+        is_threatened = np.zeros(len(keys), dtype=bool)
+        for threat in threats:
+            is_threatened |= shapely.intersects(lines, threat.inner_polygon)
+        return [key for key, threatened in zip(keys, is_threatened.tolist()) if threatened]
+
+    def _insert_endpoints(self, points: List[Coord], k: int = QUERY_NEIGHBORHOOD_K) -> List[Coord]:
+        if not self._implicit:
+            return super()._insert_endpoints(points, k)
+
+        inserted = list({point for point in points
+                         if self._grid_index(point.xy) is None and point.xy not in self._attached})
+        if inserted:
+            self._attach(inserted)
+        return inserted
+
+    def _remove_points(self, points: List[Coord]) -> None:
+        if not self._implicit:
+            return super()._remove_points(points)
+        self._detach(points)
+
+    def shortest_path(self, weight: Union[str, Dict[str, float]] = 'length', source: Coord = None,
+                      target: Coord = None) -> Tuple[List[Coord], float, float, float]:
+        """Computes the shortest path according given weight. In implicit mode this is an A* search which evaluates
+        only the edges of the nodes it expands
+
+        :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+        :param source: the source node, the environment's source by default
+        :param target: the target node, the environment's target by default
+        :return: the shortest path according given weight
+        """
+        if not self._implicit:
+            return super().shortest_path(weight, source, target)
+
+        source, target = self._query_endpoints(source, target)
+
+        # the risk of an edge is at least epsilon times its length
+        coefficients = {weight: 1} if isinstance(weight, str) else weight
+        scale = coefficients.get('length', 0) + EPSILON * coefficients.get('risk', 0)
+        edge_weight = weight if isinstance(weight, str) else weight_function(weight)
+
+        start = time()
+        path = [Coord(*p) for p in self._astar(
+            source, target, edge_weight, lambda node: scale * math.hypot(node[0] - target[0], node[1] - target[1]))]
+        computation_time = time() - start
+
+        path_length, path_risk = self._compute_path_length_and_risk(path)
+        return path, path_length, path_risk, round(computation_time, 3)
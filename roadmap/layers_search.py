@@ -0,0 +1,89 @@
+import heapq
+from math import inf
+from typing import Callable, Hashable, Iterable, List, Optional, Tuple
+
+
+def layers_search(source: Hashable, target: Hashable, max_layer: int,
+                  neighbors: Callable[[Hashable], Iterable[Tuple[Hashable, float, int]]],
+                  weight_bound: Callable[[Hashable], float], layers_bound: Callable[[Hashable], float],
+                  layers_pred: Callable[[Hashable], Hashable], edge_weight: Callable[[Hashable, Hashable], float]) \
+        -> Optional[List[Hashable]]:
+    """Searches the layers graph for the constrained shortest path, in which each layer is a discretized constraint
+    cost. Each label is (node, layer) and the search is an A* ordered by the weight bound, where labels which cannot
+    reach the target within the max layer, or cannot beat the incumbent path, are pruned by reverse search bounds
+
+    :param source: the source node
+    :param target: the target node
+    :param max_layer: the last layer within the budget
+    :param neighbors: the neighbours of a node, with the weight and the number of layers jumped over by each edge
+    :param weight_bound: a lower bound of the weight from a node to the target, inf if it cannot reach it
+    :param layers_bound: the least number of layers from a node to the target, inf if it cannot reach it
+    :param layers_pred: the next node along the least layers from a node other than the target to the target
+    :param edge_weight: the weight of an edge given its nodes
+    :return: the constrained shortest path, None if there is none
+    """
+    completion_memo = {target: 0}
+
+    def _completion_cost(node: Hashable) -> float:
+        # the cost of the weight along the least layers from the node to the target
+        chain = []
+        while node not in completion_memo:
+            chain.append(node)
+            node = layers_pred(node)
+        for n in reversed(chain):
+            completion_memo[n] = completion_memo[layers_pred(n)] + edge_weight(n, layers_pred(n))
+        return completion_memo[chain[0]] if chain else completion_memo[node]
+
+    # the incumbent is the best path found by completing a label along the least layers to the target
+    incumbent, incumbent_label = inf, None
+
+    pred = {(source, 0): None}
+    best_layer = {}
+    queue = [(weight_bound(source), 0, source, 0)]
+    while queue:
+        estimate, dist, node, layer = heapq.heappop(queue)
+        if estimate >= incumbent:
+            break
+
+        # a label of the same node with fewer layers and no greater weight was already expanded
+        if best_layer.get(node, inf) <= layer:
+            continue
+        best_layer[node] = layer
+
+        if node == target:
+            incumbent, incumbent_label = dist, (node, layer)
+            break
+
+        # complete the label along the least layers to the target to tighten the incumbent
+        if layer + layers_bound(node) <= max_layer:
+            completion = dist + _completion_cost(node)
+            if completion < incumbent:
+                incumbent, incumbent_label = completion, (node, layer)
+
+        for neighbor, weight, jump in neighbors(node):
+            next_layer = layer + jump
+            if next_layer + layers_bound(neighbor) > max_layer:
+                continue
+
+            next_dist = dist + weight
+            neighbor_bound = weight_bound(neighbor)
+            if next_dist + neighbor_bound >= incumbent or best_layer.get(neighbor, inf) <= next_layer:
+                continue
+
+            label = (neighbor, next_layer)
+            if label not in pred or next_dist < pred[label][1]:
+                pred[label] = ((node, layer), next_dist)
+                heapq.heappush(queue, (next_dist + neighbor_bound, next_dist, neighbor, next_layer))
+
+    if incumbent_label is None:
+        return None
+
+    # the path to the incumbent label followed by its completion to the target
+    path, label = [], incumbent_label
+    while label is not None:
+        path.append(label[0])
+        label = pred[label][0] if pred[label] is not None else None
+    path.reverse()
+    while path[-1] != target:
+        path.append(layers_pred(path[-1]))
+    return path
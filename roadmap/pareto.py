@@ -0,0 +1,67 @@
+from typing import Callable, List, Tuple
+
+from geometry.coord import Coord
+
+
+class ParetoPaths:
+    def __init__(self, nodes: List[Tuple[float, float]], lengths: List[float], risks: List[float],
+                 preds: List[int], front: List[int], computation_time: float,
+                 expand: Callable[[List[Coord]], List[Coord]] = None) -> None:
+        """Init of the non-dominated paths found by a multi-objective search.
+        The paths are kept as a tree of labels and are reconstructed only when retrieved
+
+        :param nodes: the node of each label
+        :param lengths: the length of each label
+        :param risks: the risk of each label
+        :param preds: the predecessor label of each label, -1 for the source label
+        :param front: the target labels ordered by increasing length
+        :param computation_time: the computation time of the search
+        :param expand: expands a path found in a compressed graph
+        """
+        self._nodes = nodes
+        self._lengths = lengths
+        self._risks = risks
+        self._preds = preds
+        self._front = front
+        self._computation_time = computation_time
+        self._expand = expand
+
+    @property
+    def lengths(self) -> List[float]:
+        """The lengths of the paths
+
+        :return: the lengths of the paths ordered by increasing length
+        """
+        return [round(self._lengths[label], 3) for label in self._front]
+
+    @property
+    def risks(self) -> List[float]:
+        """The risks of the paths
+
+        :return: the risks of the paths ordered by increasing length
+        """
+        return [round(self._risks[label], 3) for label in self._front]
+
+    @property
+    def computation_time(self) -> float:
+        """The computation time of the search
+
+        :return: the computation time of the search
+        """
+        return round(self._computation_time, 3)
+
+    def __len__(self) -> int:
+        return len(self._front)
+
+    def __getitem__(self, idx: int) -> Tuple[List[Coord], float, float]:
+        label = self._front[idx]
+        length, risk = self._lengths[label], self._risks[label]
+
+        path = []
+        while label != -1:
+            path.append(Coord(*self._nodes[label]))
+            label = self._preds[label]
+        path = path[::-1]
+        if self._expand is not None:
+            path = self._expand(path)
+        return path, round(length, 3), round(risk, 3)
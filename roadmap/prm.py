@@ -1,32 +1,55 @@
-import math
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from math import pi, sqrt
+from random import getrandbits
+from typing import Any, Dict, List, Tuple
 
-from heapq import nsmallest
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
 
 from roadmap.roadmap import Roadmap
 from geometry.coord import Coord
 from environment.environment import Environment
+from environment.sampling import Sampler
 
+TILE_SIZE = 1000
+NEIGHBORHOOD_K = 10
 
-class PRM(Roadmap):
-    def __init__(self, environment: Environment) -> None:
-        """Init of PRM
 
-        :param environment: the environment
-        """
-        super().__init__(environment)
+class PRM(Roadmap):
+    def _init_state(self, environment: Environment, lazy: bool = False) -> None:
+        super()._init_state(environment, lazy)
 
         # neighborhood consts
-        self._neighborhood_k = 10
+        self._neighborhood_k = NEIGHBORHOOD_K
         self._near_radius = 10
 
+    def _parameters(self) -> Dict[str, Any]:
+        return {'lazy': self._lazy}
+
     def _near(self, point: Coord) -> List[Coord]:
         """Computes the near nodes of a given point
 
         :param point: the point
         :return: the near nodes of the point
         """
-        return [Coord(*p) for p in self.graph.nodes if Coord(*p).distance(point) < self._near_radius]
+        nodes, tree = self._node_index()
+        return [Coord(*nodes[i]) for i in tree.query_ball_point(point.xy, self._near_radius) if nodes[i] != point.xy]
+
+    def _k_neighborhoods(self, points: List[Coord]) -> List[List[Coord]]:
+        """Computes the k neighborhoods of the points with one query of the nodes kd-tree
+
+        :param points: the points
+        :return: the k neighborhood of each point
+        """
+        nodes, tree = self._node_index()
+        k = min(self._neighborhood_k + 1, len(nodes))
+        distances, neighbors = tree.query(np.array([point.xy for point in points], dtype=float), k=k)
+        distances, neighbors = distances.reshape(len(points), k), neighbors.reshape(len(points), k)
+
+        # if distance is 0 it is the node itself
+        return [[Coord(*nodes[i]) for i in row[row_distances > 0][:self._neighborhood_k]]
+                for row, row_distances in zip(neighbors, distances)]
 
     def _k_neighborhood(self, point: Coord) -> List[Coord]:
         """Computes the k neighborhood of the point
@@ -34,34 +57,134 @@ class PRM(Roadmap):
         :param point: the point
         :return: the k neighborhood of the point
         """
+        return self._k_neighborhoods([point])[0]
 
-        def _k_nearest_key(other) -> float:
-            dist = Coord(*other).distance(point)
-            # if distance is 0 it is the node itself
-            return dist if dist > 0 else math.inf
-
-        return [Coord(*p) for p in nsmallest(self._neighborhood_k, self._graph.nodes, key=_k_nearest_key)]
+    def _perform_connections(self, samples: List[Coord]) -> None:
+        """Performs connections of samples with coords in their neighborhoods
 
-    def _perform_connections(self, sample: Coord) -> None:
-        """Performs connections with coord in neighborhood
-
-        :param sample: a sample to perform connections with
+        :param samples: samples to perform connections with
         """
-        # find near nodes to connect
-        near_nodes = self._k_neighborhood(sample)
+        # find near nodes to connect, each edge once even if both its nodes are in the other's neighborhood
+        edges = {}
+        for sample, near_nodes in zip(samples, self._k_neighborhoods(samples)):
+            sample_xy = sample.xy
+            for node in near_nodes:
+                edges.setdefault(frozenset((sample_xy, node.xy)), (sample, node))
 
-        self._add_edges([(sample, node) for node in near_nodes])
+        self._add_edges(list(edges.values()))
 
-    def add_samples(self, num_samples: int) -> None:
+    def add_samples(self, num_samples: int, sampler: Sampler = None) -> None:
         """Adds samples to roadmap
 
         :param num_samples: num to sample
+        :param sampler: the sampling strategy, uniform sampling of the environment by default
         """
-        samples = [self._environment.sample(is_safe_sample=False) for _ in range(num_samples)]
+        if sampler is None:
+            samples = [self._environment.sample(is_safe_sample=False) for _ in range(num_samples)]
+        else:
+            samples = sampler.sample(num_samples)
 
         # add nodes to graph
         self._add_points(samples)
 
         # add legal edges to graph
-        for sample in samples:
-            self._perform_connections(sample)
+        self._perform_connections(samples)
+
+    @classmethod
+    def build_tiled(cls, environment: Environment, num_samples: int, tile_size: int = TILE_SIZE, workers: int = None,
+                    stitch_radius: float = None, seed_value: int = None) -> 'PRM':
+        """Builds a PRM by tiles in parallel. The range of the environment is partitioned into square tiles, and each
+        worker process samples and connects the nodes of a tile given only the threats intersecting the tile. The tiles
+        are then stitched by connecting the nodes of different tiles within a radius across their boundaries
+
+        :param environment: the environment
+        :param num_samples: num to sample, divided among the tiles by their area
+        :param tile_size: the size of the tiles
+        :param workers: the number of worker processes, the number of processors by default
+        :param stitch_radius: the radius of the connections across tiles, the expected distance to the k-th nearest
+        node by default
+        :param seed_value: seed of the samples
+        :return: the PRM
+        """
+        prm = cls(environment)
+        x_range, y_range = environment.x_range, environment.y_range
+        tiles = [(x, y, min(x + tile_size, x_range), min(y + tile_size, y_range))
+                 for x in range(0, int(x_range), tile_size) for y in range(0, int(y_range), tile_size)]
+        areas = np.array([(max_x - min_x) * (max_y - min_y) for min_x, min_y, max_x, max_y in tiles], dtype=float)
+        counts = np.random.default_rng(seed_value).multinomial(num_samples, areas / areas.sum())
+        seeds = np.random.SeedSequence(getrandbits(32) if seed_value is None else seed_value).spawn(len(tiles))
+
+        tiles_threats = [environment.threats_tree.query(shapely.box(*tile), predicate='intersects')
+                         for tile in tiles] if len(environment.threats_radii) else [[] for _ in tiles]
+        tasks = [(tile, (x_range, y_range), int(count), tile_seed, environment.threats_centers[threat_idx],
+                  environment.threats_radii[threat_idx], prm._neighborhood_k)
+                 for tile, count, tile_seed, threat_idx in zip(tiles, counts, seeds, tiles_threats)]
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(_build_tile, tasks))
+
+        # the tiles do not share nodes, since each samples its own half-open range
+        offsets = np.cumsum([0] + [len(result['nodes']) for result in results])
+        nodes = [tuple(node) for result in results for node in result['nodes'].tolist()]
+        prm._add_points([Coord(*node) for node in nodes])
+        edges = [(Coord(*nodes[u]), Coord(*nodes[v])) for result, offset in zip(results, offsets[:-1].tolist())
+                 for u, v in (result['edges'] + offset).tolist()]
+        attributes = {attribute: np.concatenate([result[attribute] for result in results])
+                      for attribute in ['length', 'risk']}
+        prm._add_edges(edges, prm._attributes_edges_data(attributes))
+
+        if stitch_radius is None:
+            stitch_radius = sqrt(prm._neighborhood_k * areas.sum() / (pi * max(num_samples, 1)))
+        prm._stitch_tiles(tile_size, stitch_radius)
+
+        # the endpoints are connected as the samples are
+        prm._perform_connections(environment.endpoints)
+        return prm
+
+    def _stitch_tiles(self, tile_size: int, radius: float) -> None:
+        """Connects the nodes of different tiles within a radius of each other
+
+        :param tile_size: the size of the tiles
+        :param radius: the radius of the connections
+        """
+        nodes = np.array(list(self._graph.nodes), dtype=float).reshape(-1, 2)
+
+        # the nodes at the end of the range are in the last tiles
+        last_tile = np.ceil(np.array([self._environment.x_range, self._environment.y_range]) / tile_size) - 1
+        tile_idx = np.minimum(np.floor(nodes / tile_size), last_tile)
+
+        # only the nodes near the boundaries between tiles may be stitched, not near the ends of the range
+        offsets = nodes - tile_idx * tile_size
+        is_near_start = (offsets < radius) & (tile_idx > 0)
+        is_near_end = (offsets > tile_size - radius) & (tile_idx < last_tile)
+        is_seam = (is_near_start | is_near_end).any(axis=1)
+        seam_nodes, seam_tiles = nodes[is_seam], tile_idx[is_seam]
+
+        pairs = cKDTree(seam_nodes).query_pairs(radius, output_type='ndarray')
+        pairs = pairs[(seam_tiles[pairs[:, 0]] != seam_tiles[pairs[:, 1]]).any(axis=1)]
+        self._add_edges([(Coord(*seam_nodes[u]), Coord(*seam_nodes[v])) for u, v in pairs.tolist()])
+
+
+def _build_tile(task: Tuple) -> Dict[str, np.ndarray]:
+    """Samples and connects the nodes of a tile in a worker process
+
+    :param task: the bounds of the tile, the range of the environment, the number of samples, the seed of the samples,
+    the centers and radii of the threats intersecting the tile and the size of the neighborhoods
+    :return: the nodes of the tile, its edges as pairs of node indices and their length and risk
+    """
+    (min_x, min_y, max_x, max_y), env_range, num_samples, seed_value, centers, radii, k = task
+
+    # the tiles are half-open except at the ends of the range, as the samples are integer points
+    high = [max_x + (max_x == env_range[0]), max_y + (max_y == env_range[1])]
+    nodes = np.unique(np.random.default_rng(seed_value).integers([min_x, min_y], high, size=(num_samples, 2)), axis=0)
+    nodes = nodes.astype(float)
+    if len(nodes) < 2:
+        return {'nodes': nodes, 'edges': np.zeros((0, 2), dtype=int), 'length': np.zeros(0), 'risk': np.zeros(0)}
+
+    # each node is connected to its k nearest nodes, each edge once
+    _, neighbors = cKDTree(nodes).query(nodes, k=min(k + 1, len(nodes)))
+    edges = np.stack([np.repeat(np.arange(len(nodes)), neighbors.shape[1] - 1), neighbors[:, 1:].ravel()], axis=1)
+    edges = np.unique(np.sort(edges, axis=1), axis=0)
+
+    environment = Environment.from_arrays(Coord(min_x, min_y), Coord(max_x, max_y), centers, radii, env_range)
+    attributes = environment.compute_segments_attributes(nodes[edges])
+    return {'nodes': nodes, 'edges': edges, 'length': attributes['length'], 'risk': attributes['risk']}
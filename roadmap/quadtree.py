@@ -0,0 +1,109 @@
+from typing import Any, Dict
+
+import numpy as np
+import shapely
+from shapely.strtree import STRtree
+
+from geometry.coord import Coord
+from environment.environment import Environment
+from roadmap.roadmap import Roadmap
+
+MIN_DEPTH = 3
+MAX_DEPTH = 7
+
+
+class Quadtree(Roadmap):
+    def __init__(self, environment: Environment, min_depth: int = MIN_DEPTH, max_depth: int = MAX_DEPTH) -> None:
+        """Init of quadtree roadmap.
+        The environment is subdivided uniformly up to the min depth, and from there only the cells which a threat's
+        boundary crosses are subdivided, up to the max depth. The nodes are the centers of the leaf cells and the edges
+        connect leaves which touch, also across levels
+
+        :param environment: the environment
+        :param min_depth: the depth of the uniform subdivision
+        :param max_depth: the depth of the subdivision near the threats' boundaries
+        """
+        self._init_state(environment, min_depth, max_depth)
+        self._build()
+
+    def _init_state(self, environment: Environment, min_depth: int = MIN_DEPTH, max_depth: int = MAX_DEPTH) -> None:
+        super()._init_state(environment)
+        self._min_depth = min_depth
+        self._max_depth = max_depth
+
+    def _build(self) -> None:
+        super()._build()
+        environment, min_depth, max_depth = self._environment, self._min_depth, self._max_depth
+
+        # cells as rows of (min x, min y, max x, max y)
+        cells = np.array([[0, 0, environment.x_range, environment.y_range]], dtype=float)
+        leaves = []
+        for depth in range(max_depth + 1):
+            is_split = np.ones(len(cells), dtype=bool) if depth < min_depth else self._crosses_boundary(cells)
+            if depth == max_depth:
+                is_split[:] = False
+
+            leaves.append(cells[~is_split])
+            cells = self._subdivide(cells[is_split])
+        leaves = np.concatenate(leaves)
+
+        centers = (leaves[:, :2] + leaves[:, 2:]) / 2
+        boxes = shapely.box(*leaves.T)
+        tree = STRtree(boxes)
+
+        # leaves touching by a side or a corner are neighbours
+        first, second = tree.query(boxes, predicate='intersects')
+        is_pair = first < second
+        edges = [(Coord(*centers[i]), Coord(*centers[j])) for i, j in zip(first[is_pair].tolist(), second[is_pair].tolist())]
+
+        # connect the endpoints to the centers of the leaves around them
+        endpoints = self._environment.endpoints
+        endpoint_idx, leaf_idx = tree.query(shapely.points([p.xy for p in endpoints]), predicate='dwithin',
+                                            distance=np.min(leaves[:, 2:] - leaves[:, :2]))
+        edges.extend((endpoints[i], Coord(*centers[j])) for i, j in zip(endpoint_idx.tolist(), leaf_idx.tolist()))
+
+        self._add_edges(edges)
+
+    def _parameters(self) -> Dict[str, Any]:
+        return {'min_depth': self._min_depth, 'max_depth': self._max_depth}
+
+    @staticmethod
+    def _subdivide(cells: np.ndarray) -> np.ndarray:
+        """Subdivides cells into quarters
+
+        :param cells: the cells
+        :return: the quarters of the cells
+        """
+        x0, y0, x1, y1 = cells.T
+        xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+        return np.concatenate([np.stack(quarter, axis=1) for quarter in
+                               [(x0, y0, xm, ym), (xm, y0, x1, ym), (x0, ym, xm, y1), (xm, ym, x1, y1)]])
+
+    def _crosses_boundary(self, cells: np.ndarray) -> np.ndarray:
+        """Checks which cells a threat's boundary crosses, i.e. intersecting a threat but not inside it
+
+        :param cells: the cells
+        :return: if a threat's boundary crosses each cell
+        """
+        crosses = np.zeros(len(cells), dtype=bool)
+        threats = self._environment.threats
+        if not threats:
+            return crosses
+
+        # circle-box test on the cells whose bounding boxes intersect the threats
+        threats_boxes = STRtree(shapely.box(*np.array(
+            [[t.center.x - t.radius, t.center.y - t.radius, t.center.x + t.radius, t.center.y + t.radius]
+             for t in threats]).T))
+        cell_idx, threat_idx = threats_boxes.query(shapely.box(*cells.T), predicate='intersects')
+
+        centers = np.array([threat.center.xy for threat in threats])[threat_idx]
+        radii = np.array([threat.radius for threat in threats])[threat_idx]
+        x0, y0, x1, y1 = cells[cell_idx].T
+        cx, cy = centers.T
+
+        nearest_distance = np.hypot(np.maximum.reduce([x0 - cx, np.zeros_like(cx), cx - x1]),
+                                    np.maximum.reduce([y0 - cy, np.zeros_like(cy), cy - y1]))
+        farthest_distance = np.hypot(np.maximum(np.abs(cx - x0), np.abs(cx - x1)),
+                                     np.maximum(np.abs(cy - y0), np.abs(cy - y1)))
+        crosses[cell_idx[(nearest_distance <= radii) & (radii <= farthest_distance)]] = True
+        return crosses
@@ -0,0 +1,236 @@
+import heapq
+from math import hypot, inf
+from time import time
+from typing import Dict, Iterable, List, Tuple, Union, TYPE_CHECKING
+
+import networkx as nx
+
+from geometry.coord import Coord
+from roadmap.contraction_hierarchy import weight_function
+
+if TYPE_CHECKING:
+    from roadmap.roadmap import Roadmap
+
+
+class ReplanningSession:
+    def __init__(self, roadmap: 'Roadmap', source: Tuple[float, float], target: Tuple[float, float],
+                 weight: Union[str, Dict[str, float]] = 'length', budget: float = None,
+                 constraint: str = 'risk') -> None:
+        """Init of session of repeated queries to a target from a source which moves along the paths.
+        The shortest paths are searched backwards from the target by D* Lite, so the search state is kept between the
+        queries and only repaired around the edges whose weights changed and for the moves of the source.
+        With a budget, the paths are constrained shortest paths within the budget remaining after the moves, which
+        reuse the reverse search bounds cached by the roadmap
+
+        :param roadmap: the roadmap
+        :param source: the source node
+        :param target: the target node
+        :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+        :param budget: the constraint budget, if the paths are constrained
+        :param constraint: the constraint
+        """
+        self._roadmap = roadmap
+        self._source = self._last_source = source
+        self._target = target
+        self._weight = weight
+        self._remaining_budget = budget
+        self._constraint = constraint
+
+        # the weight of an edge is at least the distance between its nodes times the coefficient of the length
+        coefficients = {weight: 1} if isinstance(weight, str) else weight
+        self._edge_weight = weight_function(coefficients)
+        self._heuristic_coefficient = coefficients.get('length', 0)
+
+        # the weight to the target of each node, and its one step lookahead
+        self._g, self._rhs = {}, {target: 0}
+        self._key_modifier = 0
+        self._keys = {target: self._key(target)}
+        self._queue = [(*self._keys[target], target)]
+
+        # the last path found, through nodes of the roadmap
+        self._path = None
+
+        # the positions of the source which the session inserted into the roadmap
+        self._inserted = []
+
+    @property
+    def source(self) -> Coord:
+        """The current source of the session
+
+        :return: the current source
+        """
+        return Coord(*self._source)
+
+    @property
+    def remaining_budget(self) -> float:
+        """The constraint budget remaining after the moves of the source
+
+        :return: the remaining budget, None if the paths are not constrained
+        """
+        return self._remaining_budget
+
+    def _heuristic(self, u: Tuple[float, float], v: Tuple[float, float]) -> float:
+        return self._heuristic_coefficient * hypot(u[0] - v[0], u[1] - v[1])
+
+    def _key(self, node: Tuple[float, float]) -> Tuple[float, float]:
+        """Computes the priority of a node in the queue
+
+        :param node: the node
+        :return: the priority of the node
+        """
+        weight = min(self._g.get(node, inf), self._rhs.get(node, inf))
+        return weight + self._heuristic(self._source, node) + self._key_modifier, weight
+
+    def _update_node(self, node: Tuple[float, float]) -> None:
+        """Updates the lookahead weight of a node from its neighbors, and queues it if it is inconsistent
+
+        :param node: the node
+        """
+        if node != self._target:
+            try:
+                self._rhs[node] = min((self._edge_weight(edge_data) + self._g.get(neighbor, inf)
+                                       for neighbor, edge_data in self._roadmap._neighbors(node)), default=inf)
+            except KeyError:
+                # the node was removed from the roadmap
+                self._rhs.pop(node, None)
+                self._g.pop(node, None)
+
+        # the queued entries of a node are removed lazily when their key is outdated
+        self._keys.pop(node, None)
+        if self._g.get(node, inf) != self._rhs.get(node, inf):
+            self._keys[node] = self._key(node)
+            heapq.heappush(self._queue, (*self._keys[node], node))
+
+    def _compute_shortest_paths(self) -> None:
+        """Expands the inconsistent nodes until the weight of the source is consistent"""
+        while self._queue:
+            k1, k2, node = self._queue[0]
+            if self._keys.get(node) != (k1, k2):
+                heapq.heappop(self._queue)
+                continue
+            is_consistent = self._g.get(self._source, inf) == self._rhs.get(self._source, inf)
+            if (k1, k2) >= self._key(self._source) and is_consistent:
+                break
+
+            heapq.heappop(self._queue)
+            key = self._key(node)
+            if (k1, k2) < key:
+                # the key is outdated since the source moved
+                self._keys[node] = key
+                heapq.heappush(self._queue, (*key, node))
+                continue
+
+            del self._keys[node]
+            neighbors = [neighbor for neighbor, _ in self._roadmap._neighbors(node)]
+            if self._g.get(node, inf) > self._rhs.get(node, inf):
+                self._g[node] = self._rhs[node]
+            else:
+                self._g[node] = inf
+                self._update_node(node)
+            for neighbor in neighbors:
+                self._update_node(neighbor)
+
+    def _extract_path(self) -> List[Tuple[float, float]]:
+        """Follows from the source the neighbors of least weight to the target
+
+        :return: the path from the source to the target
+        """
+        if self._g.get(self._source, inf) == inf:
+            raise nx.NetworkXNoPath(f'No path between {self._source} and {self._target}.')
+
+        path, visited = [self._source], {self._source}
+        while path[-1] != self._target:
+            node = min(((neighbor, self._edge_weight(edge_data) + self._g.get(neighbor, inf))
+                        for neighbor, edge_data in self._roadmap._neighbors(path[-1])), key=lambda item: item[1])[0]
+            if node in visited:
+                raise nx.NetworkXNoPath(f'No path between {self._source} and {self._target}.')
+            path.append(node)
+            visited.add(node)
+        return path
+
+    def update_edges(self, edges: Iterable[Tuple[Tuple[float, float], Tuple[float, float]]]) -> None:
+        """Repairs the search state after edges were added, removed or their data changed
+
+        :param edges: the edges as pairs of nodes
+        """
+        for node in {node for edge in edges for node in edge}:
+            self._update_node(node)
+
+    def move_to(self, position: Coord) -> None:
+        """Moves the source to a new position. A position which is not a connected node is connected to its nearest
+        nodes until the source moves again or the session is closed. With a budget, the constraint cost of the move is
+        deducted from the remaining budget, along the last path if the position is on it and straight otherwise
+
+        :param position: the new position of the source
+        """
+        if self._remaining_budget is not None:
+            if self._path is not None and position.xy in self._path:
+                traversed = self._path[:self._path.index(position.xy) + 1]
+                cost = sum(self._roadmap._edge_data(u, v)[self._constraint]
+                           for u, v in zip(traversed[:-1], traversed[1:]))
+            else:
+                attributes = self._roadmap._environment.compute_segments_attributes([(self._source, position.xy)])
+                cost = float(attributes[self._constraint][0])
+            self._remaining_budget -= cost
+
+        # the roadmap repairs the session for the edges it adds, but not for implicit edges
+        inserted = self._roadmap._insert_endpoints([position])
+        self.update_edges((node, neighbor) for node in [point.xy for point in inserted]
+                          for neighbor, _ in self._roadmap._neighbors(node))
+
+        # the previous positions which the session inserted are removed once the source left them
+        previous = [point for point in self._inserted if point.xy != position.xy]
+        self._inserted = [point for point in self._inserted if point.xy == position.xy] + inserted
+        self._remove_inserted(previous)
+
+        self._source = position.xy
+        self._key_modifier += self._heuristic(self._last_source, self._source)
+        self._last_source = self._source
+        if self._path is not None and self._source in self._path:
+            self._path = self._path[self._path.index(self._source):]
+        else:
+            self._path = None
+
+    def close(self) -> None:
+        """Ends the session, removing the positions of the source which it inserted into the roadmap"""
+        self._remove_inserted(self._inserted)
+        self._inserted = []
+        self._roadmap._sessions.discard(self)
+
+    def _remove_inserted(self, points: List[Coord]) -> None:
+        """Removes positions which the session inserted from the roadmap, and repairs the search state for their edges
+
+        :param points: the positions
+        """
+        if not points:
+            return
+        removed = [(point.xy, neighbor) for point in points for neighbor, _ in self._roadmap._neighbors(point.xy)]
+        self._roadmap._remove_endpoints(points)
+        self.update_edges(removed)
+
+    def path(self) -> Tuple[List[Coord], float, float, float]:
+        """Computes the path from the current source to the target, repairing the search state only where it changed
+
+        :return: the shortest path according the weight, or the constrained shortest path within the remaining budget
+        """
+        start = time()
+        if self._remaining_budget is None:
+            path = self._roadmap._lazy_search(self._search, lambda path: [path])
+        else:
+            path = self._roadmap._lazy_search(
+                lambda: [Coord(*p) for p in self._roadmap._constrained_search(
+                    self._source, self._target, self._weight, self._constraint, self._remaining_budget)],
+                lambda path: [path])
+        computation_time = time() - start
+
+        self._path = [point.xy for point in path]
+        path_length, path_risk = self._roadmap._compute_path_length_and_risk(path)
+        return self._roadmap._expand_path(path), path_length, path_risk, round(computation_time, 3)
+
+    def _search(self) -> List[Coord]:
+        """Repairs the search state and extracts the shortest path
+
+        :return: the shortest path
+        """
+        self._compute_shortest_paths()
+        return [Coord(*p) for p in self._extract_path()]
@@ -1,30 +1,96 @@
-import itertools
+import hashlib
+import heapq
+import json
+from itertools import combinations
+from pathlib import Path
+from collections import Counter, defaultdict
+from operator import itemgetter
 from abc import ABC
 from time import time
-from math import ceil
-from typing import List, Tuple
+from math import ceil, inf
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+from weakref import WeakSet
 
 import networkx as nx
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+from shapely.strtree import STRtree
 
+from geometry.circle import Circle
 from geometry.coord import Coord
 from environment.environment import Environment
+from roadmap.contraction_hierarchy import ContractionHierarchy, weight_function, weights_digest
+from roadmap.layers_search import layers_search
+from roadmap.pareto import ParetoPaths
+from roadmap.replanning import ReplanningSession
+from roadmap.single_source import SingleSourcePaths
 import matplotlib.pyplot as plt
 
 EPSILON = 0.0000001
 LAYER_GRANULARITY = 1
+QUERY_NEIGHBORHOOD_K = 10
+REFINE_LOOKAHEAD = 32
 
 
 class Roadmap(ABC):
-    def __init__(self, environment: Environment) -> None:
+    def __init__(self, environment: Environment, lazy: bool = False) -> None:
         """Init roadmap
 
         :param environment: the environment
+        :param lazy: if to defer the evaluation of the edges' risk until they are on a path found by a query
+        """
+        self._init_state(environment, lazy)
+        self._build()
+
+    def _init_state(self, environment: Environment, lazy: bool = False) -> None:
+        """Initializes the state of the roadmap with an empty graph, without building it
+
+        :param environment: the environment
+        :param lazy: if to defer the evaluation of the edges' risk until they are on a path found by a query
         """
         self._environment = environment
+        self._lazy = lazy
+
+        # cached results of searches over the graph, cleared whenever the graph changes
+        self._cache = {}
+
+        # contraction hierarchies by weight, kept while only query endpoints are inserted and removed temporarily
+        self._hierarchies = {}
+
+        # the query endpoints inserted temporarily, and if each was an isolated node of the graph before
+        self._endpoints = {}
+
+        # replanning sessions repaired when the risks of edges change
+        self._sessions = WeakSet()
 
-        # init graph with source and target
         self._graph = nx.Graph()
-        self._add_points(environment.endpoints)
+
+        # the risks of the edges are updated when the threats change
+        environment.attach(self)
+
+    def _build(self) -> None:
+        """Builds the graph of the roadmap, which has the environment's endpoints as nodes"""
+        self._add_points(self._environment.endpoints)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Gets the state of the roadmap to pickle, without its replanning sessions and cached searches
+
+        :return: the state of the roadmap
+        """
+        state = vars(self).copy()
+        state['_sessions'] = None
+        state['_cache'] = {}
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Restores the state of a pickled roadmap, without replanning sessions, and attaches it to its environment
+
+        :param state: the state of the roadmap
+        """
+        vars(self).update(state)
+        self._sessions = WeakSet()
+        self._environment.attach(self)
 
     @property
     def graph(self) -> nx.Graph():
@@ -34,20 +100,223 @@ class Roadmap(ABC):
         """
         return self._graph
 
+    @classmethod
+    def store_path(cls, directory: Union[str, Path], environment: Environment, **parameters) -> Path:
+        """Gets the path in a store directory of a roadmap, keyed by the content of the environment and the parameters
+        of the roadmap
+
+        :param directory: the store directory
+        :param environment: the environment
+        :param parameters: the parameters of the roadmap, such as the number of samples
+        :return: the path of the roadmap in the store
+        """
+        key = hashlib.sha256(json.dumps([environment.content_hash, parameters], sort_keys=True).encode())
+        return Path(directory) / f'{cls.__name__}-{key.hexdigest()[:16]}'
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Saves the roadmap to a directory of npy arrays, the nodes, the CSR adjacency of the graph and the attributes
+        of its edges, and a manifest. The contraction hierarchies built for the roadmap are saved along
+
+        :param path: the path of the directory
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        arrays = self._to_arrays()
+        for name, array in arrays.items():
+            np.save(path / f'{name}.npy', array)
+
+        for i, hierarchy in enumerate(self._hierarchies.values()):
+            hierarchy.save(path / f'hierarchy-{i}.npz')
+
+        manifest = {'class': type(self).__name__, 'environment': self._environment.content_hash,
+                    'arrays': list(arrays), 'hierarchies': len(self._hierarchies), 'parameters': self._parameters()}
+        (path / 'manifest.json').write_text(json.dumps(manifest, indent=2))
+
+    def _parameters(self) -> Dict[str, Any]:
+        """Gets the parameters of the roadmap's constructor, which are saved with the roadmap
+
+        :return: the parameters by name
+        """
+        return {}
+
+    def _to_arrays(self) -> Dict[str, np.ndarray]:
+        """Converts the graph to arrays, the nodes, the CSR adjacency of the graph and the attributes of its edges
+
+        :return: the arrays by name
+        """
+        nodes = list(self._graph.nodes)
+        index = {node: i for i, node in enumerate(nodes)}
+        adjacency = [sorted((index[neighbor], edge_data) for neighbor, edge_data in self._graph[node].items())
+                     for node in nodes]
+        entries = [entry for neighbors in adjacency for entry in neighbors]
+
+        arrays = {
+            'nodes': np.array(nodes, dtype=float).reshape(-1, 2),
+            'indptr': np.cumsum([0] + [len(neighbors) for neighbors in adjacency]),
+            'indices': np.array([neighbor for neighbor, _ in entries], dtype=np.int64),
+            'length': np.array([edge_data['length'] for _, edge_data in entries], dtype=float),
+            'risk': np.array([edge_data['risk'] for _, edge_data in entries], dtype=float),
+        }
+        if self._lazy:
+            arrays['evaluated'] = np.array([edge_data.get('evaluated', True) for _, edge_data in entries], dtype=bool)
+
+        # the contracted chains of the edges as CSR of nodes
+        vias = [edge_data.get('via', ()) for _, edge_data in entries]
+        if any(vias):
+            arrays['via_indptr'] = np.cumsum([0] + [len(via) for via in vias])
+            arrays['via_nodes'] = np.array([node for via in vias for node in via], dtype=float).reshape(-1, 2)
+        return arrays
+
+    @classmethod
+    def load(cls, path: Union[str, Path], environment: Environment) -> 'Roadmap':
+        """Loads a roadmap saved to a directory, as an instance of the class it was saved from. The state of the roadmap
+        is initialized with its saved parameters without building it, and its graph is filled from the memory mapped
+        arrays
+
+        :param path: the path of the directory
+        :param environment: the environment of the roadmap
+        :return: the roadmap
+        """
+        path = Path(path)
+        manifest = json.loads((path / 'manifest.json').read_text())
+        if manifest['environment'] != environment.content_hash:
+            raise ValueError(f'The roadmap in {path} is not of the environment')
+
+        subclasses, pending = {}, [Roadmap]
+        while pending:
+            subclass = pending.pop()
+            subclasses[subclass.__name__] = subclass
+            pending.extend(subclass.__subclasses__())
+        roadmap_class = subclasses[manifest['class']]
+        if not issubclass(roadmap_class, cls):
+            raise ValueError(f'The roadmap in {path} is a {roadmap_class.__name__}')
+
+        arrays = {name: np.load(path / f'{name}.npy', mmap_mode='r') for name in manifest['arrays']}
+        roadmap = roadmap_class.__new__(roadmap_class)
+        roadmap._init_state(environment, **manifest['parameters'])
+
+        # each edge once, from its node of lower index
+        nodes = [tuple(node) for node in arrays['nodes'].tolist()]
+        rows = np.repeat(np.arange(len(nodes)), np.diff(arrays['indptr']))
+        is_first = rows < arrays['indices']
+        columns = {'length': arrays['length'][is_first].tolist(), 'risk': arrays['risk'][is_first].tolist()}
+        if 'evaluated' in arrays:
+            columns['evaluated'] = arrays['evaluated'][is_first].tolist()
+        if 'via_indptr' in arrays:
+            via_nodes = [tuple(node) for node in arrays['via_nodes'].tolist()]
+            via_indptr = arrays['via_indptr'].tolist()
+            columns['via'] = [tuple(via_nodes[begin:end]) for begin, end in zip(via_indptr[:-1], via_indptr[1:])]
+            columns['via'] = [via for via, first in zip(columns['via'], is_first.tolist()) if first]
+
+        names = list(columns)
+        edges_data = [dict(zip(names, values)) for values in zip(*columns.values())]
+        for edge_data in edges_data:
+            if not edge_data.get('via', True):
+                del edge_data['via']
+
+        # fill the adjacency of the graph directly, both directions share the data of an edge as in add_edges_from
+        roadmap._graph.add_nodes_from(nodes)
+        adjacency = [roadmap._graph._adj[node] for node in nodes]
+        for u, v, edge_data in zip(rows[is_first].tolist(), arrays['indices'][is_first].tolist(), edges_data):
+            adjacency[u][nodes[v]] = adjacency[v][nodes[u]] = edge_data
+
+        for i in range(manifest['hierarchies']):
+            roadmap.load_contraction_hierarchy(path / f'hierarchy-{i}.npz')
+        return roadmap
+
     def merge_graph(self, other: nx.Graph, merge_radius: float = 10) -> None:
         """Merges other graph with the roadmap's graph by a given radius
 
         :param other: other graph
         :param merge_radius: radius to connect nodes from both graphs
         """
-        # add all edges from other graph
-        self._add_edges([(Coord(*u), Coord(*v)) for u, v in other.edges])
+        nodes, tree = self._node_index()
+        other_nodes = list(other.nodes)
+        other_tree = cKDTree(np.array(other_nodes, dtype=float).reshape(-1, 2))
+
+        # join the nodes of both graphs by radius, skipping nodes which are in both
+        close_pairs = tree.sparse_distance_matrix(other_tree, merge_radius, output_type='ndarray')
+        close_pairs = close_pairs[(close_pairs['v'] > 0) & (close_pairs['v'] < merge_radius)]
+
+        # add all edges from other graph and edges between close nodes from the graphs at once
+        edges = [(Coord(*u), Coord(*v)) for u, v in other.edges]
+        edges.extend((Coord(*nodes[i]), Coord(*other_nodes[j])) for i, j in zip(close_pairs['i'], close_pairs['j']))
+        self._add_points([Coord(*p) for p in other_nodes])
+        self._add_edges(edges)
+
+    def compress(self) -> None:
+        """Compresses the graph before the queries by eliminating nodes which are not the environment's endpoints.
+        A node is eliminated if for each pair of its neighbors, an edge between them is not longer nor riskier than the
+        way through the node, or there is no edge between them and the way through the node is added instead as a
+        single edge with the summed length and risk, and if no more edges are added than removed. This covers dead
+        ends, chains of nodes of degree 2 and collinear runs along edges.
+        The eliminated nodes are kept on the added edges, so the paths found by the queries are expanded back.
+        In lazy mode the risks of the edges of eliminated nodes are evaluated
+        """
+        protected = {point.xy for point in self._environment.endpoints}
+
+        candidates = set(self._graph.nodes) - protected
+        while candidates:
+            # the neighbors of eliminated nodes may be eliminated next
+            candidates = {neighbor for node in candidates if node in self._graph
+                          for neighbor in self._eliminate_node(node)} - protected
+        self._clear_cache()
+
+    def _eliminate_node(self, node: Tuple[float, float]) -> List[Tuple[float, float]]:
+        """Eliminates a node if the ways through it are bypassed by edges between its neighbors or can be added as
+        edges between them without increasing the number of edges
+
+        :param node: the node
+        :return: the neighbors of the node if it was eliminated, otherwise no nodes
+        """
+        neighbors = list(self._graph[node])
+        if self._lazy:
+            self._evaluate_edges([(node, neighbor) for neighbor in neighbors])
+
+        shortcuts = []
+        for u, v in combinations(neighbors, 2):
+            u_data, v_data = self._edge_data(node, u), self._edge_data(node, v)
+            length, risk = u_data['length'] + v_data['length'], u_data['risk'] + v_data['risk']
+
+            edge_data = self._graph.get_edge_data(u, v)
+            if edge_data is None:
+                shortcuts.append((u, v, length, risk))
+            elif edge_data['length'] > length + EPSILON or edge_data['risk'] > risk + EPSILON:
+                # both the edge and the way through the node are needed
+                return []
+
+            if len(shortcuts) > len(neighbors):
+                return []
+
+        for u, v, length, risk in shortcuts:
+            via = self._edge_via(u, node) + [node] + self._edge_via(node, v)
+            self._graph.add_edge(u, v, length=length, risk=risk, via=tuple(via if u <= v else via[::-1]),
+                                 **({'evaluated': True} if self._lazy else {}))
+        self._graph.remove_node(node)
+        return neighbors
+
+    def _edge_via(self, u: Tuple[float, float], v: Tuple[float, float]) -> List[Tuple[float, float]]:
+        """Gets the nodes of the chain contracted into an edge
+
+        :param u: the first node of the edge
+        :param v: the second node of the edge
+        :return: the nodes contracted into the edge ordered from the first node to the second node
+        """
+        via = list(self._graph.get_edge_data(u, v, {}).get('via', ()))
+        return via if u <= v else via[::-1]
 
-        # add edge between close nodes from the graphs
-        for u, v in itertools.product(self.graph.nodes, other.nodes):
-            u, v = Coord(*u), Coord(*v)
-            if u.distance(v) < merge_radius:
-                self._add_edges([(u, v)])
+    def _expand_path(self, path: List[Coord]) -> List[Coord]:
+        """Expands the contracted chains of a path found in the compressed graph
+
+        :param path: the path
+        :return: the path through all the nodes of the contracted chains
+        """
+        expanded = path[:1]
+        for u, v in zip(path[:-1], path[1:]):
+            expanded.extend(Coord(*p) for p in self._edge_via(u.xy, v.xy))
+            expanded.append(v)
+        return expanded
 
     def _compute_path_length_and_risk(self, path: List[Coord]) -> Tuple[float, float]:
         """Computes the length and the risk of a given path
@@ -57,116 +326,839 @@ class Roadmap(ABC):
         """
         path_length = path_risk = 0
         for p1, p2 in zip(path[:-1], path[1:]):
-            path_length += self._graph[p1.xy][p2.xy]['length']
-            path_risk += self._graph[p1.xy][p2.xy]['risk']
+            edge_data = self._edge_data(p1.xy, p2.xy)
+            path_length += edge_data['length']
+            path_risk += edge_data['risk']
         return round(path_length, 3), round(path_risk, 3)
 
-    def refine_path(self, path: List[Coord]) -> List[Coord]:
-        """Refines path with shortcuts if available
+    def refine_path(self, path: List[Coord], lookahead: int = REFINE_LOOKAHEAD) -> List[Coord]:
+        """Refines path with shortcuts if available.
+        From each point the path shortcuts to the farthest point ahead for which the refined path is not riskier than
+        the path up to that point, so the refined path is never riskier than the path
 
         :param path: the path
+        :param lookahead: the max number of points ahead to try shortcutting to
         :return: path with shortcuts if available
         """
-        # compute risks table in O(path)
-        risk_up_to = {point: 0 for point in path}
-        for prev_p, cur_p in zip(path[:-1], path[1:]):
-            cur_risk = self._environment.compute_segment_attributes(prev_p, cur_p)['risk']
-            risk_up_to[cur_p] = risk_up_to[prev_p] + cur_risk
-
-        # check if shortcuts available
-        for i1, p1 in enumerate(path[:-1]):
-            for i2, p2 in enumerate(path[i1::-1]):
-                # length shortcut is sure. need to check if risk is not worse
-                shortcut_risk = self._environment.compute_segment_attributes(p1, p2)['risk']
-                if shortcut_risk > risk_up_to[p2] - risk_up_to[p1]:
-                    continue
+        if len(path) < 3:
+            return list(path)
 
-                path = path[:i1 + 1] + path[i2:]
-                break
-        return path
+        # compute prefix risks of the path at once
+        points = np.array([point.xy for point in path], dtype=float)
+        segments = np.stack([points[:-1], points[1:]], axis=1)
+        segment_risks = self._environment.compute_segments_attributes(segments)['risk']
+        risk_up_to = np.concatenate([[0], np.cumsum(segment_risks)])
+
+        # the risk of the refined path so far, which a shortcut may spend up to the risk of the path
+        refined = [path[0]]
+        refined_risk = 0
+        i = 0
+        while i < len(path) - 1:
+            # evaluate all the shortcuts of the point at once, length shortcut is sure so only risk is checked
+            ahead = np.arange(i + 2, min(i + lookahead, len(path) - 1) + 1)
+            shortcuts = np.stack([np.broadcast_to(points[i], (len(ahead), 2)), points[ahead]], axis=1)
+            shortcut_risks = self._environment.compute_segments_attributes(shortcuts)['risk']
+
+            is_shortcut = refined_risk + shortcut_risks <= risk_up_to[ahead] + EPSILON
+            if is_shortcut.any():
+                refined_risk += float(shortcut_risks[is_shortcut][-1])
+                i = int(ahead[is_shortcut][-1])
+            else:
+                refined_risk += float(segment_risks[i])
+                i += 1
+            refined.append(path[i])
+        return refined
+
+    def _clear_cache(self, only_endpoints: bool = False, removed: List[Tuple[float, float]] = ()) -> None:
+        """Clears the cached searches after the graph changed, and the contraction hierarchies unless only the edges
+        of query endpoints inserted temporarily changed, since the hierarchies are valid again once they are removed.
+        The kd-tree of the nodes is kept too in that case, unless it indexes a removed endpoint
+
+        :param only_endpoints: if only the edges of the inserted query endpoints changed
+        :param removed: the removed nodes
+        """
+        node_index = self._cache.get('node-index')
+        self._cache.clear()
+        if not only_endpoints:
+            self._hierarchies.clear()
+        elif node_index is not None:
+            distances, _ = node_index[1].query(np.array(removed, dtype=float).reshape(-1, 2))
+            if not np.any(distances == 0):
+                self._cache['node-index'] = node_index
 
     def _add_points(self, points: List[Coord]) -> None:
         """Adds points to roadmap
 
         :param points: points to add
         """
+        self._clear_cache(all(point.xy in self._endpoints for point in points))
         self._graph.add_nodes_from([point.xy for point in points])
 
-    def _add_edges(self, edges: List[Tuple[Coord, Coord]]) -> None:
+    def _add_edges(self, edges: List[Tuple[Coord, Coord]], edges_data: List[Dict] = None) -> None:
         """Adds edges to roadmap
 
         :param edges: edges to add
+        :param edges_data: the data of each edge if it was already computed, otherwise it is computed
+        """
+        self._clear_cache(all(u.xy in self._endpoints or v.xy in self._endpoints for u, v in edges))
+        segments = [(u.xy, v.xy) for u, v in edges]
+
+        added, restored = [], []
+        if edges_data is None:
+            edges_data = self._compute_edges_data(segments)
+        for (u, v), edge_data in zip(segments, edges_data):
+            chain_data = self._graph.get_edge_data(u, v, {})
+            if 'via' in chain_data:
+                # a straight edge replaces the contracted chain between the same nodes only if it dominates it, and
+                # otherwise the chain's nodes are restored so both ways remain, unless the chain dominates the edge
+                is_evaluated = edge_data.get('evaluated', True)
+                if not (is_evaluated and edge_data['length'] <= chain_data['length'] + EPSILON
+                        and edge_data['risk'] <= chain_data['risk'] + EPSILON):
+                    if chain_data['length'] <= edge_data['length'] + EPSILON \
+                            and chain_data['risk'] <= edge_data['risk'] + EPSILON:
+                        continue
+                    chain = [u] + self._edge_via(u, v) + [v]
+                    restored.extend((Coord(*a), Coord(*b)) for a, b in zip(chain[:-1], chain[1:]))
+                self._graph.remove_edge(u, v)
+            added.append((u, v, edge_data))
+
+        self._graph.add_edges_from(added)
+        self._update_sessions(segments)
+        if restored:
+            self._add_edges(restored)
+
+    def _compute_edges_data(self, segments: List[Tuple[Tuple[float, float], Tuple[float, float]]]) -> List[Dict]:
+        """Computes the data of edges at once
+
+        :param segments: the edges as pairs of nodes
+        :return: the data of each edge
+        """
+        if self._lazy:
+            return self._estimate_edges_data(segments)
+        return self._exact_edges_data(segments)
+
+    def _exact_edges_data(self, segments: List[Tuple[Tuple[float, float], Tuple[float, float]]]) -> List[Dict]:
+        """Computes the exact data of edges at once
+
+        :param segments: the edges as pairs of nodes
+        :return: the data of each edge
+        """
+        return self._attributes_edges_data(self._environment.compute_segments_attributes(segments))
+
+    @staticmethod
+    def _attributes_edges_data(attributes: Dict[str, np.ndarray]) -> List[Dict]:
+        """Converts the attributes of segments computed by the environment to the data of edges
+
+        :param attributes: the length and risk of each segment
+        :return: the data of each edge
+        """
+        # add epsilon * length to risk in order to prefer shorter paths with same risk
+        return [{'length': length, 'risk': risk + EPSILON * length}
+                for length, risk in zip(attributes['length'].tolist(), attributes['risk'].tolist())]
+
+    def _estimate_edges_data(self, segments: List[Tuple[Tuple[float, float], Tuple[float, float]]]) -> List[Dict]:
+        """Computes the data of edges at once with a lower bound of the risk instead of the risk
+
+        :param segments: the edges as pairs of nodes
+        :return: the data of each edge, marked if its risk was evaluated
+        """
+        attributes = self._environment.estimate_segments_attributes(segments)
+        return [{'length': length, 'risk': risk + EPSILON * length, 'evaluated': is_exact}
+                for length, risk, is_exact in zip(attributes['length'].tolist(), attributes['risk'].tolist(),
+                                                  attributes['is_exact'].tolist())]
+
+    def _evaluate_edges(self, edges: Iterable[Tuple[Tuple[float, float], Tuple[float, float]]]) -> bool:
+        """Evaluates at once the risk of edges whose risk was only estimated, and stores it in the graph
+
+        :param edges: the edges as pairs of nodes
+        :return: if any edge was evaluated
+        """
+        segments = list({frozenset(edge): edge for edge in edges
+                         if not self._edge_data(*edge).get('evaluated', True)}.values())
+        if not segments:
+            return False
+
+        for (u, v), edge_data in zip(segments, self._exact_edges_data(segments)):
+            self._edge_data(u, v).update(edge_data, evaluated=True)
+
+        # searches over the estimated risks are no longer valid
+        self._clear_cache(all(u in self._endpoints or v in self._endpoints for u, v in segments))
+        self._update_sessions(segments)
+        return True
+
+    def _lazy_search(self, search: Callable[[], Any], paths: Callable[[Any], List[List[Coord]]]) -> Any:
+        """Repeats a search until the risks of all the edges on the paths it finds are evaluated.
+        The estimated risks are lower bounds, so a path whose edges are all evaluated is also the result of the search
+        over the evaluated risks
+
+        :param search: the search
+        :param paths: gets the paths found by the search from its result
+        :return: the result of the last search
+        """
+        while True:
+            result = search()
+            if not self._lazy or not self._evaluate_edges(
+                    (u.xy, v.xy) for path in paths(result) for u, v in zip(path[:-1], path[1:])):
+                return result
+
+    def _neighbors(self, node: Tuple[float, float]) -> Iterable[Tuple[Tuple[float, float], Dict]]:
+        """Gets the neighbors of a node in the graph searched by the queries
+
+        :param node: the node
+        :return: the neighbors of the node and the data of the edges to them
+        """
+        return self._graph[node].items()
+
+    def _edge_data(self, u: Tuple[float, float], v: Tuple[float, float]) -> Dict:
+        """Gets the data of an edge in the graph searched by the queries
+
+        :param u: the first node of the edge
+        :param v: the second node of the edge
+        :return: the data of the edge
+        """
+        return self._graph[u][v]
+
+    def _remove_points(self, points: List[Coord]) -> None:
+        """Removes points and their edges from roadmap
+
+        :param points: points to remove
+        """
+        self._clear_cache(all(point.xy in self._endpoints for point in points), [point.xy for point in points])
+        removed = [(point.xy, neighbor) for point in points if point.xy in self._graph
+                   for neighbor in self._graph[point.xy]]
+        self._graph.remove_nodes_from([point.xy for point in points])
+        self._update_sessions(removed)
+
+    def _update_sessions(self, edges: List[Tuple[Tuple[float, float], Tuple[float, float]]]) -> None:
+        """Repairs the replanning sessions after edges were added, removed or their data changed
+
+        :param edges: the edges as pairs of nodes
         """
-        for (u, v) in edges:
-            attributes = self._environment.compute_segment_attributes(u, v)
-            self._add_points([u, v])
+        for session in list(self._sessions):
+            session.update_edges(edges)
+
+    def _node_index(self) -> Tuple[List[Tuple[float, float]], cKDTree]:
+        """Builds a kd-tree of the nodes of the graph, cached until the graph is modified
+
+        :return: the nodes of the graph and a kd-tree of their coordinates
+        """
+        if 'node-index' not in self._cache:
+            nodes = list(self._graph.nodes)
+            self._cache['node-index'] = (nodes, cKDTree(np.array(nodes, dtype=float).reshape(-1, 2)))
+        return self._cache['node-index']
+
+    def _edge_index(self) -> Tuple[List[Tuple[Tuple[float, float], Tuple[float, float]]], STRtree]:
+        """Builds a spatial index of the edges of the graph, through the nodes of their contracted chains, cached until
+        the graph is modified
+
+        :return: the edges of the graph and a spatial index of their lines
+        """
+        if 'edge-index' not in self._cache:
+            edges = list(self._graph.edges)
+            chains = [[u, *self._edge_via(u, v), v] for u, v in edges]
+            points = np.array([node for chain in chains for node in chain], dtype=float).reshape(-1, 2)
+            chain_idx = np.repeat(np.arange(len(chains)), [len(chain) for chain in chains])
+            lines = shapely.linestrings(points, indices=chain_idx)
+            self._cache['edge-index'] = (edges, STRtree(lines))
+        return self._cache['edge-index']
+
+    def _threatened_edges(self, threats: List[Circle]) -> List[Tuple[Tuple[float, float], Tuple[float, float]]]:
+        """Finds the edges which intersect given threats
+
+        :param threats: the threats
+        :return: the edges as pairs of nodes
+        """
+        if self._graph.number_of_edges() == 0:
+            return []
+
+        edges, tree = self._edge_index()
+        _, edge_idx = tree.query([threat.inner_polygon for threat in threats], predicate='intersects')
+        return [edges[i] for i in np.unique(edge_idx).tolist()]
+
+    def update_threats(self, threats: List[Circle]) -> None:
+        """Updates the data of the edges which intersect threats that were added, removed or moved.
+        The cached searches are kept if the changed risks cannot affect them
+
+        :param threats: the changed threats, both before and after the change
+        """
+        edges = self._threatened_edges(threats)
+        chains = [[u, *self._edge_via(u, v), v] for u, v in edges]
+        straight = [edge for edge, chain in zip(edges, chains) if len(chain) == 2]
+        edges_data = dict(zip(straight, self._compute_edges_data(straight)))
+
+        # the risk of a contracted chain is the sum of the risks of its edges
+        contracted = [(edge, chain) for edge, chain in zip(edges, chains) if len(chain) > 2]
+        segments = [(u, v) for _, chain in contracted for u, v in zip(chain[:-1], chain[1:])]
+        risks = iter(edge_data['risk'] for edge_data in self._exact_edges_data(segments))
+        for edge, chain in contracted:
+            edges_data[edge] = {'risk': sum(next(risks) for _ in chain[1:])}
 
-            # add epsilon * length to risk in order to prefer shorter paths with same risk
-            self._graph.add_edge(u.xy, v.xy,
-                                 length=attributes['length'],
-                                 risk=attributes['risk'] + EPSILON * attributes['length'])
+        changed = []
+        for (u, v), edge_data in edges_data.items():
+            current = self._edge_data(u, v)
+            if any(current.get(attribute) != value for attribute, value in edge_data.items()):
+                changed.append((u, v, edge_data['risk']))
+                current.update(edge_data)
+        if changed:
+            self._invalidate_risks(changed)
+            self._update_sessions([(u, v) for u, v, _ in changed])
 
-    def shortest_path(self, weight: str = 'length') -> Tuple[List[Coord], float, float, float]:
-        """Computes the shortest path according given weight
+    def _invalidate_risks(self, changed: List[Tuple[Tuple[float, float], Tuple[float, float], float]]) -> None:
+        """Removes the cached searches which may be affected by changed risks of edges. The spatial indices and the
+        searches by length are kept, and so are shortest paths trees by risk which no changed edge can improve
 
-        :param weight: a given weight
+        :param changed: the changed edges and their new risks
+        """
+        for key in list(self._cache):
+            if isinstance(key, str):
+                continue
+            if key[0] in ['shortest-paths-tree', 'lower-bounds'] and key[2] == 'length':
+                continue
+            if (key[0] == 'shortest-paths-tree' or key[0] == 'lower-bounds' and not key[3]) and key[2] == 'risk' \
+                    and self._is_tree_unchanged(self._cache[key], changed):
+                continue
+            del self._cache[key]
+
+        for key in [key for key in self._hierarchies if 'risk' in dict(key)]:
+            del self._hierarchies[key]
+
+    @staticmethod
+    def _is_tree_unchanged(tree: Tuple[Dict[Tuple[float, float], float],
+                                       Dict[Tuple[float, float], Tuple[float, float]]],
+                           changed: List[Tuple[Tuple[float, float], Tuple[float, float], float]]) -> bool:
+        """Checks if a shortest paths tree is still valid after the weights of edges changed, which is when no changed
+        edge is in the tree and no changed edge shortens the distance of a node
+
+        :param tree: the distance and the predecessor of each reachable node
+        :param changed: the changed edges and their new weights
+        :return: if the tree is still valid
+        """
+        dist, pred = tree
+        for u, v, weight in changed:
+            for a, b in [(u, v), (v, u)]:
+                if a in dist and (pred.get(b) == a or dist[a] + weight < dist.get(b, inf)):
+                    return False
+        return True
+
+    def _insert_endpoints(self, points: List[Coord], k: int = QUERY_NEIGHBORHOOD_K) -> List[Coord]:
+        """Inserts query endpoints which are not connected in the graph and connects each to its k nearest nodes
+
+        :param points: the endpoints
+        :param k: the number of nearest nodes to connect each endpoint to
+        :return: the inserted endpoints
+        """
+        inserted = list({point for point in points
+                         if point.xy not in self._graph or self._graph.degree(point.xy) == 0})
+        if not inserted:
+            return inserted
+        for point in inserted:
+            self._endpoints.setdefault(point.xy, point.xy in self._graph)
+        if self._graph.number_of_nodes() == 0:
+            self._add_points(inserted)
+            return inserted
+
+        nodes, tree = self._node_index()
+        _, nearest = tree.query(np.array([point.xy for point in inserted], dtype=float), k=min(k, len(nodes)))
+        nearest = np.asarray(nearest).reshape(len(inserted), -1)
+
+        self._add_edges([(point, Coord(*nodes[i])) for point, row in zip(inserted, nearest) for i in row])
+        return inserted
+
+    def _remove_endpoints(self, points: List[Coord]) -> None:
+        """Removes query endpoints inserted by _insert_endpoints, keeping those which were isolated nodes as before
+
+        :param points: the inserted endpoints
+        """
+        isolated = [point for point in points if self._endpoints.get(point.xy)]
+        self._remove_points(points)
+        self._add_points(isolated)
+        for point in points:
+            self._endpoints.pop(point.xy, None)
+
+    def _roadmap_graph(self) -> nx.Graph:
+        """Gets a view of the graph without the query endpoints inserted temporarily
+
+        :return: the graph of the roadmap's own nodes and edges
+        """
+        if not self._endpoints:
+            return self._graph
+        edges = [(u, v) for u in self._endpoints for v in self._graph[u]]
+        return nx.restricted_view(self._graph, [node for node, was_node in self._endpoints.items() if not was_node],
+                                  edges)
+
+    def _query_endpoints(self, source: Coord = None, target: Coord = None) \
+            -> Tuple[Tuple[float, float], Tuple[float, float]]:
+        """Gets the nodes of the query endpoints, the environment's endpoints by default
+
+        :param source: the source of the query
+        :param target: the target of the query
+        :return: the source and the target nodes
+        """
+        source = self._environment.source if source is None else source
+        target = self._environment.target if target is None else target
+        return source.xy, target.xy
+
+    def query(self, source: Coord, target: Coord, method: str = 'shortest_path', k: int = QUERY_NEIGHBORHOOD_K,
+              **kwargs) -> Any:
+        """Answers a query between endpoints which may not be in the roadmap.
+        The endpoints are connected to their k nearest nodes for the query and removed afterwards
+
+        :param source: the source of the query
+        :param target: the target of the query
+        :param method: the query method, one of shortest_path, constrained_shortest_path and pareto_paths
+        :param k: the number of nearest nodes to connect each endpoint to
+        :param kwargs: the arguments of the query method
+        :return: the result of the query method
+        """
+        return self.query_many([(source, target)], method, k, **kwargs)[0]
+
+    def query_many(self, pairs: List[Tuple[Coord, Coord]], method: str = 'shortest_path',
+                   k: int = QUERY_NEIGHBORHOOD_K, **kwargs) -> List[Any]:
+        """Answers queries between many pairs of endpoints on the same roadmap.
+        All endpoints are inserted at once, shortest paths from a source of several pairs share the cached shortest
+        paths tree unless in lazy mode while other pairs are searched bidirectionally, and queries to the same target
+        share the cached reverse search bounds.
+        Shortest paths by a weight with a contraction hierarchy are searched in it without inserting the endpoints
+
+        :param pairs: the source and target of each query
+        :param method: the query method, one of shortest_path, constrained_shortest_path and pareto_paths
+        :param k: the number of nearest nodes to connect each endpoint to
+        :param kwargs: the arguments of the query method
+        :return: the result of each query
+        """
+        hierarchy = self._contraction_hierarchy(kwargs.get('weight', 'length')) if method == 'shortest_path' else None
+        if hierarchy is not None:
+            return [self._hierarchy_query(hierarchy, source, target, k) for source, target in pairs]
+
+        inserted = self._insert_endpoints([point for pair in pairs for point in pair], k)
+        try:
+            if method == 'shortest_path' and not self._lazy:
+                # a shortest paths tree pays off only for a source of several pairs, otherwise a bidirectional search
+                # settles fewer nodes
+                num_targets = Counter(source for source, _ in pairs)
+                return [self.single_source(source).shortest_path(target, **kwargs) if num_targets[source] > 1
+                        else self.shortest_path(source=source, target=target, **kwargs) for source, target in pairs]
+            return [getattr(self, method)(source=source, target=target, **kwargs) for source, target in pairs]
+        finally:
+            if inserted:
+                self._remove_endpoints(inserted)
+
+    def shortest_path(self, weight: Union[str, Dict[str, float]] = 'length', source: Coord = None,
+                      target: Coord = None) -> Tuple[List[Coord], float, float, float]:
+        """Computes the shortest path according given weight, by the contraction hierarchy of the weight if it was built
+
+        :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+        :param source: the source node, the environment's source by default
+        :param target: the target node, the environment's target by default
         :return: the shortest path according given weight
         """
-        source, target = self._environment.source.xy, self._environment.target.xy
+        source, target = self._query_endpoints(source, target)
 
         start = time()
-        path = [Coord(*p) for p in nx.shortest_path(self.graph, weight=weight, source=source, target=target)]
+        hierarchy = self._contraction_hierarchy(weight)
+        if hierarchy is not None:
+            path = [Coord(*p) for p in hierarchy.shortest_path({source: 0}, {target: 0})[0]]
+        else:
+            edge_weight = weight
+            if not isinstance(weight, str):
+                weighted_sum = weight_function(weight)
+                edge_weight = lambda u, v, edge_data: weighted_sum(edge_data)
+            path = self._lazy_search(
+                lambda: [Coord(*p) for p in nx.shortest_path(self.graph, weight=edge_weight, source=source,
+                                                             target=target)],
+                lambda path: [path])
         computation_time = time() - start
 
         path_length, path_risk = self._compute_path_length_and_risk(path)
-        return path, path_length, path_risk, round(computation_time, 3)
+        return self._expand_path(path), path_length, path_risk, round(computation_time, 3)
+
+    @staticmethod
+    def _hierarchy_key(weight: Union[str, Dict[str, float]]) -> Tuple:
+        """Gets the key of the contraction hierarchy of a weight
+
+        :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+        :return: the key of the hierarchy
+        """
+        weight = {weight: 1} if isinstance(weight, str) else weight
+        return tuple(sorted(weight.items()))
+
+    def _contraction_hierarchy(self, weight: Union[str, Dict[str, float]]) -> ContractionHierarchy:
+        """Gets the contraction hierarchy of a weight if it was built and the graph was not modified since, and no query
+        endpoints are inserted in the graph
+
+        :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+        :return: the hierarchy, None if there is none
+        """
+        if self._endpoints:
+            return None
+        return self._hierarchies.get(self._hierarchy_key(weight))
+
+    def build_contraction_hierarchy(self, weight: Union[str, Dict[str, float]] = 'length') -> ContractionHierarchy:
+        """Builds the contraction hierarchy of a weight, which answers the shortest paths queries by the weight until the
+        graph is modified other than by the temporary insertion of query endpoints. The preprocessing time is reported
+        by the hierarchy
+
+        :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+        :return: the hierarchy
+        """
+        if self._lazy:
+            self._evaluate_edges(self._graph.edges)
+
+        key = self._hierarchy_key(weight)
+        if key not in self._hierarchies:
+            self._hierarchies[key] = ContractionHierarchy.build(self._roadmap_graph(), dict(key))
+        return self._hierarchies[key]
+
+    def load_contraction_hierarchy(self, file_path: str) -> ContractionHierarchy:
+        """Loads a contraction hierarchy saved for the roadmap, which must have been built from the same edges and weights
+
+        :param file_path: the path of the file
+        :return: the hierarchy
+        """
+        hierarchy = ContractionHierarchy.load(file_path)
+        graph = self._roadmap_graph()
+        if len(hierarchy.nodes) != graph.number_of_nodes() or not all(node in graph for node in hierarchy.nodes):
+            raise ValueError(f'The contraction hierarchy in {file_path} is not of the roadmap')
+        if hierarchy.digest != weights_digest(graph, hierarchy.weight):
+            raise ValueError(f'The contraction hierarchy in {file_path} is of other weights of the edges')
+
+        self._hierarchies[self._hierarchy_key(hierarchy.weight)] = hierarchy
+        return hierarchy
+
+    def _hierarchy_query(self, hierarchy: ContractionHierarchy, source: Coord, target: Coord,
+                         k: int = QUERY_NEIGHBORHOOD_K) -> Tuple[List[Coord], float, float, float]:
+        """Computes the shortest path between endpoints which may not be in the roadmap by a contraction hierarchy.
+        Endpoints which are not connected in the graph start the search from their k nearest nodes instead of being
+        inserted
+
+        :param hierarchy: the hierarchy
+        :param source: the source
+        :param target: the target
+        :param k: the number of nearest nodes to connect each endpoint to
+        :return: the shortest path according the weight of the hierarchy
+        """
+        start = time()
+        edge_weight = weight_function(hierarchy.weight)
+
+        connections = []
+        for point in [source, target]:
+            if point.xy in self._graph and self._graph.degree(point.xy) > 0:
+                connections.append({point.xy: None})
+                continue
+
+            nodes, tree = self._node_index()
+            _, nearest = tree.query(point.xy, k=min(k, len(nodes)))
+            neighbors = [nodes[i] for i in np.atleast_1d(nearest).tolist()]
+            connections.append(dict(zip(neighbors, self._exact_edges_data([(point.xy, node) for node in neighbors]))))
+
+        seeds = [{node: 0 if edge_data is None else edge_weight(edge_data) for node, edge_data in connection.items()}
+                 for connection in connections]
+        path = [Coord(*p) for p in hierarchy.shortest_path(*seeds)[0]]
+        computation_time = time() - start
+
+        # the edges of the endpoints are added to the path in the graph
+        edges_data = [self._edge_data(u.xy, v.xy) for u, v in zip(path[:-1], path[1:])]
+        source_data, target_data = connections[0][path[0].xy], connections[1][path[-1].xy]
+        path = ([source] if source_data is not None else []) + self._expand_path(path) \
+            + ([target] if target_data is not None else [])
+        edges_data.extend(edge_data for edge_data in [source_data, target_data] if edge_data is not None)
+
+        path_length = sum(edge_data['length'] for edge_data in edges_data)
+        path_risk = sum(edge_data['risk'] for edge_data in edges_data)
+        return path, round(path_length, 3), round(path_risk, 3), round(computation_time, 3)
+
+    def _dijkstra(self, source: Tuple[float, float], weight: Union[str, Callable[[Dict], float]]) \
+            -> Tuple[Dict[Tuple[float, float], float], Dict[Tuple[float, float], Tuple[float, float]]]:
+        """Computes the shortest paths tree from a source
+
+        :param source: the source node
+        :param weight: the weight attribute or a function of the edge data
+        :return: the distance and the predecessor of each reachable node
+        """
+        if isinstance(weight, str):
+            weight = itemgetter(weight)
+
+        dist, pred = {}, {source: None}
+        tentative = {source: 0}
+        queue = [(0, source)]
+        while queue:
+            node_dist, node = heapq.heappop(queue)
+            if node in dist:
+                continue
+            dist[node] = node_dist
+
+            for neighbor, edge_data in self._neighbors(node):
+                neighbor_dist = node_dist + weight(edge_data)
+                if neighbor not in dist and neighbor_dist < tentative.get(neighbor, inf):
+                    tentative[neighbor] = neighbor_dist
+                    pred[neighbor] = node
+                    heapq.heappush(queue, (neighbor_dist, neighbor))
+        return dist, pred
+
+    def _astar(self, source: Tuple[float, float], target: Tuple[float, float],
+               weight: Union[str, Callable[[Dict], float]],
+               heuristic: Callable[[Tuple[float, float]], float]) -> List[Tuple[float, float]]:
+        """Computes the shortest path between a source and a target by an A* search
 
-    def constrained_shortest_path(self, weight: str = 'length', constraint: str = 'risk', budget: float = 0) -> Tuple[
-        List[Coord], float, float, float]:
+        :param source: the source node
+        :param target: the target node
+        :param weight: the weight attribute or a function of the edge data
+        :param heuristic: a lower bound of the weight from a node to the target
+        :return: the shortest path according given weight
+        """
+        if isinstance(weight, str):
+            weight = itemgetter(weight)
+
+        dist, pred = {source: 0}, {source: None}
+        closed = set()
+        queue = [(heuristic(source), 0, source)]
+        while queue:
+            _, node_dist, node = heapq.heappop(queue)
+            if node == target:
+                return self._tree_path(pred, target)[::-1]
+            if node in closed:
+                continue
+            closed.add(node)
+
+            for neighbor, edge_data in self._neighbors(node):
+                neighbor_dist = node_dist + weight(edge_data)
+                if neighbor not in closed and neighbor_dist < dist.get(neighbor, inf):
+                    dist[neighbor] = neighbor_dist
+                    pred[neighbor] = node
+                    heapq.heappush(queue, (neighbor_dist + heuristic(neighbor), neighbor_dist, neighbor))
+
+        raise nx.NetworkXNoPath(f'No path between {source} and {target}.')
+
+    @staticmethod
+    def _tree_path(pred: Dict[Tuple[float, float], Tuple[float, float]], node: Tuple[float, float]) \
+            -> List[Tuple[float, float]]:
+        """Gets the path from a node to the root of a shortest paths tree
+
+        :param pred: the predecessors of the tree
+        :param node: the node
+        :return: the path from the node to the root
+        """
+        path = [node]
+        while pred[path[-1]] is not None:
+            path.append(pred[path[-1]])
+        return path
+
+    @staticmethod
+    def _layer_jump(cost: float) -> int:
+        """Computes the number of layers an edge of a given constraint cost jumps over
+
+        :param cost: the constraint cost of the edge
+        :return: the number of layers the edge jumps over
+        """
+        return ceil(round(cost / LAYER_GRANULARITY, 3))
+
+    def _lower_bounds(self, target: Tuple[float, float], attribute: Union[str, Dict[str, float]],
+                      layered: bool = False) \
+            -> Tuple[Dict[Tuple[float, float], float], Dict[Tuple[float, float], Tuple[float, float]]]:
+        """Computes by a reverse dijkstra from the target a lower bound of an attribute for reaching the target.
+        The bounds are cached per target until the graph is modified
+
+        :param target: the target node
+        :param attribute: the attribute to bound, or the coefficient of each attribute in a weighted sum
+        :param layered: if to bound the number of layers jumped over instead of the attribute itself
+        :return: the lower bound of each node and its predecessors towards the target
+        """
+        key = ('lower-bounds', target, attribute if isinstance(attribute, str) else tuple(sorted(attribute.items())),
+               layered)
+        if key not in self._cache:
+            weight: Union[str, Callable] = attribute if isinstance(attribute, str) else weight_function(attribute)
+            if layered:
+                weight = lambda edge_data: self._layer_jump(edge_data[attribute])
+
+            # the graph is undirected so a search from the target bounds the way to the target
+            self._cache[key] = self._dijkstra(target, weight)
+        return self._cache[key]
+
+    def constrained_shortest_path(self, weight: Union[str, Dict[str, float]] = 'length', constraint: str = 'risk',
+                                  budget: float = 0, source: Coord = None, target: Coord = None) \
+            -> Tuple[List[Coord], float, float, float]:
         """Computes the constrained shortest path given a weight, a constraint and a budget
-        This function uses a non-accurate and time expensive logic of layers graph
+        This function searches a layers graph in which each layer is a discretized constraint cost. The layers are
+        expanded lazily and labels which cannot reach the target within the budget, or cannot beat the incumbent path,
+        are pruned by reverse search bounds
 
-        :param weight: the weight
+        :param weight: the weight, or the coefficient of each attribute in a weighted sum
         :param constraint: the constraint
         :param budget: the constraint budget
+        :param source: the source node, the environment's source by default
+        :param target: the target node, the environment's target by default
         :return: the constrained shortest path
         """
-        source, target = self._environment.source.xy, self._environment.target.xy
+        source, target = self._query_endpoints(source, target)
 
         start = time()
-        layers_num = int((budget + 1) / LAYER_GRANULARITY)
-        layers_graph = nx.DiGraph()
-
-        # add nodes layers
-        for layer in range(layers_num):
-            for node in self.graph.nodes:
-                # each node is (original x, original y, layer)
-                layers_graph.add_node((node, layer))
-
-        # connect layers with edges
-        for layer in range(layers_num):
-            for u, v, edge_data in self.graph.edges(data=True):
-                jump = ceil(round(edge_data[constraint] / LAYER_GRANULARITY, 3))
-
-                # skip if edge goes outside layers
-                if layer + jump > layers_num:
+        path = self._lazy_search(
+            lambda: [Coord(*p) for p in self._constrained_search(source, target, weight, constraint, budget)],
+            lambda path: [path])
+        computation_time = time() - start
+
+        path_length, path_risk = self._compute_path_length_and_risk(path)
+        return self._expand_path(path), path_length, path_risk, round(computation_time, 3)
+
+    def _constrained_search(self, source: Tuple[float, float], target: Tuple[float, float],
+                            weight: Union[str, Dict[str, float]], constraint: str, budget: float) \
+            -> List[Tuple[float, float]]:
+        """Searches the layers graph for the constrained shortest path
+
+        :param source: the source node
+        :param target: the target node
+        :param weight: the weight, or the coefficient of each attribute in a weighted sum
+        :param constraint: the constraint
+        :param budget: the constraint budget
+        :return: the constrained shortest path
+        """
+        max_layer = int((budget + 1) / LAYER_GRANULARITY) - 1
+        edge_weight = itemgetter(weight) if isinstance(weight, str) else weight_function(weight)
+
+        weight_bound, _ = self._lower_bounds(target, weight)
+        layers_bound, layers_pred = self._lower_bounds(target, constraint, layered=True)
+
+        path = layers_search(
+            source, target, max_layer,
+            lambda node: ((neighbor, edge_weight(edge_data), self._layer_jump(edge_data[constraint]))
+                          for neighbor, edge_data in self._neighbors(node)),
+            lambda node: weight_bound.get(node, inf), lambda node: layers_bound.get(node, inf), layers_pred.__getitem__,
+            lambda u, v: edge_weight(self._edge_data(u, v)))
+        if path is None:
+            raise nx.NetworkXNoPath(f'No path between {source} and {target} within budget {budget}')
+        return path
+
+    def _pareto_search(self, source: Tuple[float, float], target: Tuple[float, float] = None, epsilon: float = 0) \
+            -> Tuple[List[Tuple[float, float]], List[float], List[float], List[int], Dict[Tuple[float, float], List[int]]]:
+        """Computes the non-dominated (length, risk) labels of the nodes by a multi-objective search from the source.
+        The labels are expanded by increasing length bound, so each node expands only labels that are less risky than
+        its previous ones. Given a target, a label is pruned once a target label is less risky than its risk bound
+
+        :param source: the source node
+        :param target: the target node, or None for the labels of all the nodes
+        :param epsilon: thinning factor, a target label is dropped if a shorter one is at most (1 + epsilon) times as
+        risky
+        :return: the node, length, risk and predecessor of each label, and the expanded labels of each node ordered by
+        increasing length
+        """
+        if target is None:
+            length_bound = risk_bound = defaultdict(float)
+        else:
+            length_bound, _ = self._lower_bounds(target, 'length')
+            risk_bound, _ = self._lower_bounds(target, 'risk')
+
+        nodes, lengths, risks, preds = [], [], [], []
+        fronts = {}
+        front_risk = inf
+        best_risk = {}
+
+        def _push(node: Tuple[float, float], length: float, risk: float, pred: int) -> None:
+            nodes.append(node)
+            lengths.append(length)
+            risks.append(risk)
+            preds.append(pred)
+            heapq.heappush(queue, (length + length_bound[node], risk + risk_bound[node], len(nodes) - 1))
+
+        queue = []
+        if target is None or source in length_bound:
+            _push(source, 0, 0, -1)
+
+        while queue:
+            _, estimated_risk, label = heapq.heappop(queue)
+            node, length, risk = nodes[label], lengths[label], risks[label]
+
+            # all expanded labels of the target and of the node are not longer
+            if front_risk <= (1 + epsilon) * estimated_risk or best_risk.get(node, inf) <= risk:
+                continue
+            best_risk[node] = risk
+            fronts.setdefault(node, []).append(label)
+
+            if node == target:
+                front_risk = risk
+                continue
+
+            for neighbor, edge_data in self._neighbors(node):
+                next_risk = risk + edge_data['risk']
+                if best_risk.get(neighbor, inf) <= next_risk or front_risk <= next_risk + risk_bound[neighbor]:
                     continue
+                _push(neighbor, length + edge_data['length'], next_risk, label)
 
-                layers_graph.add_edge((u, layer), (v, layer + jump), length=edge_data['length'], risk=edge_data['risk'])
-                layers_graph.add_edge((v, layer), (u, layer + jump), length=edge_data['length'], risk=edge_data['risk'])
+        return nodes, lengths, risks, preds, fronts
 
-        # connect all targets to virtual target
-        virtual_target = 'virtual-target'
-        layers_graph.add_node(virtual_target)
-        for layer in range(layers_num):
-            layers_graph.add_edge((target, layer), virtual_target, length=0, risk=0)
+    def pareto_paths(self, epsilon: float = 0, source: Coord = None, target: Coord = None) -> ParetoPaths:
+        """Computes all the non-dominated (length, risk) paths from the source to the target in one search
 
-        path = nx.shortest_path(layers_graph, weight=weight, source=(source, 0), target=virtual_target)
-        path = [Coord(*p) for p, _ in path[:-1]]
-        computation_time = time() - start
+        :param epsilon: thinning factor, a path is dropped if a shorter path is at most (1 + epsilon) times as risky
+        :param source: the source node, the environment's source by default
+        :param target: the target node, the environment's target by default
+        :return: the non-dominated paths ordered by increasing length
+        """
+        source, target = self._query_endpoints(source, target)
 
-        path_length, path_risk = self._compute_path_length_and_risk(path)
-        return path, path_length, path_risk, round(computation_time, 3)
+        def _front_paths(labels: Tuple) -> List[List[Coord]]:
+            *labels, fronts = labels
+            return [path for path, _, _ in ParetoPaths(*labels, fronts.get(target, []), 0)]
+
+        start = time()
+        nodes, lengths, risks, preds, fronts = self._lazy_search(
+            lambda: self._pareto_search(source, target, epsilon), _front_paths)
+        return ParetoPaths(nodes, lengths, risks, preds, fronts.get(target, []), time() - start, self._expand_path)
+
+    def _shortest_paths_tree(self, source: Tuple[float, float], weight: Union[str, Dict[str, float]]) \
+            -> Tuple[Dict[Tuple[float, float], float], Dict[Tuple[float, float], Tuple[float, float]]]:
+        """Computes the shortest paths tree from a source, cached until the graph is modified
+
+        :param source: the source node
+        :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+        :return: the distance and the predecessor of each reachable node
+        """
+        key = ('shortest-paths-tree', source, weight if isinstance(weight, str) else tuple(sorted(weight.items())))
+        if key not in self._cache:
+            self._cache[key] = self._dijkstra(source, weight if isinstance(weight, str) else weight_function(weight))
+        return self._cache[key]
+
+    def _pareto_labels(self, source: Tuple[float, float]) \
+            -> Tuple[List[Tuple[float, float]], List[float], List[float], List[int], Dict[Tuple[float, float], List[int]]]:
+        """Computes the non-dominated labels of all the nodes from a source, cached until the graph is modified
+
+        :param source: the source node
+        :return: the labels of the search and the labels of each node ordered by increasing length
+        """
+        key = ('pareto-labels', source)
+        if key not in self._cache:
+            self._cache[key] = self._pareto_search(source)
+        return self._cache[key]
+
+    def single_source(self, source: Coord = None) -> SingleSourcePaths:
+        """Gets the paths from a single source to any target. The searches from the source are done once and cached
+        until the roadmap is modified, so each target is answered by a path reconstruction.
+        The searches cover the whole graph, so in lazy mode the risks of all the edges are evaluated first
+
+        :param source: the source, the environment's source by default
+        :return: the paths from the source
+        """
+        source, _ = self._query_endpoints(source)
+        if self._lazy:
+            self._evaluate_edges(self._graph.edges)
+        return SingleSourcePaths(self, source)
+
+    def replanning_session(self, weight: Union[str, Dict[str, float]] = 'length', budget: float = None,
+                           constraint: str = 'risk', source: Coord = None, target: Coord = None) -> ReplanningSession:
+        """Starts a session of repeated queries to a target from a source which moves along the paths, keeping the
+        search state between the queries. The session is repaired when edges are added, removed or evaluated and when
+        threats change, and by its update_edges after other modifications of the roadmap, such as compression
+
+        :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+        :param budget: the constraint budget, if the paths are constrained
+        :param constraint: the constraint
+        :param source: the source, the environment's source by default
+        :param target: the target, the environment's target by default
+        :return: the replanning session
+        """
+        source, target = self._query_endpoints(source, target)
+        session = ReplanningSession(self, source, target, weight, budget, constraint)
+        self._sessions.add(session)
+        return session
 
     def plot(self, display_edges: bool = False) -> None:
         """Plots environment and graph
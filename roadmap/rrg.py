@@ -1,35 +1,63 @@
 import math
 from typing import List
 
+from roadmap.dynamic_kdtree import DynamicKDTree
 from roadmap.roadmap import Roadmap
 from geometry.coord import Coord
 from environment.environment import Environment
+from environment.sampling import Sampler
 
 
 class RRG(Roadmap):
     def __init__(self, environment: Environment) -> None:
-        super().__init__(environment)
+        self._init_state(environment)
+        self._build()
+
+    def _init_state(self, environment: Environment) -> None:
+        super()._init_state(environment)
 
         self._near_radius = 10
         self._steering_coefficient = 5
 
+        # spatial index of the nodes which grows with the graph
+        self._index = None
+
+    def _sync_index(self) -> None:
+        """Rebuilds the spatial index if the graph was modified other than by growing"""
+        if self._index is None or len(self._index) != self.graph.number_of_nodes():
+            self._index = DynamicKDTree(list(self.graph.nodes))
+
     def _near(self, point: Coord) -> List[Coord]:
-        return [Coord(*p) for p in self.graph.nodes if Coord(*p).distance(point) < self._near_radius]
+        return [Coord(*p) for p in self._index.near(point.xy, self._near_radius) if p != point.xy]
 
     def _nearest(self, point: Coord) -> Coord:
-        return min([Coord(*p) for p in self.graph.nodes], key=lambda p:point.distance(p))
+        return Coord(*self._index.nearest(point.xy))
 
-    def add_samples(self, iterations: int) -> None:
-        for _ in range(iterations):
-            sample = self._environment.sample(is_safe_sample=False)
+    def add_samples(self, iterations: int, sampler: Sampler = None) -> None:
+        """Grows the roadmap towards samples
+
+        :param iterations: num of samples to grow towards
+        :param sampler: the sampling strategy, uniform sampling of the environment by default
+        """
+        self._sync_index()
+        samples = None if sampler is None else sampler.sample(iterations)
+
+        # the growth depends only on the nodes, so the edges are evaluated at once in the end
+        edges = []
+        for iteration in range(iterations if samples is None else len(samples)):
+            sample = self._environment.sample(is_safe_sample=False) if samples is None else samples[iteration]
             nearest = self._nearest(sample)
 
             steered_sample = nearest.shifted(
                 distance=self._steering_coefficient,
-                angle=math.atan((sample.y - nearest.y)/(sample.x - nearest.x))
+                angle=math.atan2(sample.y - nearest.y, sample.x - nearest.x)
             )
+            # skip samples which are already nodes
+            near = self._index.near(steered_sample.xy, self._near_radius)
+            if steered_sample.xy in near:
+                continue
 
-            near = self._near(steered_sample)
-            self._add_edges([(steered_sample, node) for node in near])
-
+            edges.extend((steered_sample, Coord(*p)) for p in near)
+            self._index.insert(steered_sample.xy)
 
+        self._add_edges(edges)
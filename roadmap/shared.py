@@ -0,0 +1,259 @@
+import sys
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from time import time
+from typing import Dict, Iterable, List, Tuple, Union
+
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from geometry.coord import Coord
+from roadmap.layers_search import layers_search
+from roadmap.roadmap import LAYER_GRANULARITY, Roadmap
+
+# alignment of the arrays in the shared memory block
+ARRAY_ALIGNMENT = 64
+
+
+class SharedRoadmap:
+    def __init__(self, memory: SharedMemory, layout: Dict[str, Tuple[int, str, Tuple[int, ...]]],
+                 is_owner: bool) -> None:
+        """Init of read-only roadmap whose arrays are views of a shared memory block.
+        The roadmap is published once by the owner, and attached by other processes through its handle without copying.
+        The searches run between nodes of the roadmap only, since the endpoints of queries cannot be inserted into the
+        shared arrays, so queries between other points are answered by the roadmap itself
+
+        :param memory: the shared memory block
+        :param layout: the offset, dtype and shape of each array in the block
+        :param is_owner: if the roadmap was published by this process, which frees the block
+        """
+        self._memory = memory
+        self._layout = layout
+        self._is_owner = is_owner
+        self._arrays = {name: np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset)
+                        for name, (offset, dtype, shape) in layout.items()}
+        for array in self._arrays.values():
+            array.flags.writeable = False
+
+        # the search graphs of the weights, sharing the adjacency arrays
+        self._graphs = {}
+
+    @classmethod
+    def publish(cls, roadmap: 'Roadmap') -> 'SharedRoadmap':
+        """Copies the arrays of a roadmap to a new shared memory block. The risks of a lazy roadmap which were only
+        estimated are evaluated first, since the shared arrays are read-only
+
+        :param roadmap: the roadmap
+        :return: the shared roadmap, owning the block
+        """
+        if roadmap._lazy:
+            roadmap._evaluate_edges(roadmap._graph.edges)
+        arrays = roadmap._to_arrays()
+
+        # the adjacency is stored with the index type of the searches, so they use it as is
+        index_dtype = np.int32 if len(arrays['indices']) < np.iinfo(np.int32).max else np.int64
+        arrays['indptr'] = arrays['indptr'].astype(index_dtype)
+        arrays['indices'] = arrays['indices'].astype(index_dtype)
+
+        layout, size = {}, 0
+        for name, array in arrays.items():
+            layout[name] = (size, array.dtype.str, array.shape)
+            size += -(-array.nbytes // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+
+        memory = SharedMemory(create=True, size=max(size, 1))
+        for name, array in arrays.items():
+            offset, dtype, shape = layout[name]
+            np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset)[...] = array
+        return cls(memory, layout, True)
+
+    @property
+    def handle(self) -> Tuple[str, Dict[str, Tuple[int, str, Tuple[int, ...]]]]:
+        """The handle of the roadmap, which is small to send to other processes
+
+        :return: the name of the shared memory block and the layout of the arrays in it
+        """
+        return self._memory.name, self._layout
+
+    @classmethod
+    def attach(cls, handle: Tuple[str, Dict[str, Tuple[int, str, Tuple[int, ...]]]]) -> 'SharedRoadmap':
+        """Attaches a roadmap published by another process
+
+        :param handle: the handle of the roadmap
+        :return: the shared roadmap
+        """
+        name, layout = handle
+        if sys.version_info >= (3, 13):
+            memory = SharedMemory(name=name, track=False)
+        else:
+            # the block is freed by its owner, so it is not tracked by the attaching process
+            memory = SharedMemory(name=name)
+            resource_tracker.unregister(memory._name, 'shared_memory')
+        return cls(memory, layout, False)
+
+    def close(self) -> None:
+        """Detaches the roadmap, and frees the shared memory block if this process published it"""
+        self._arrays = self._graphs = None
+        self._memory.close()
+        if self._is_owner:
+            if sys.version_info < (3, 13):
+                # attached processes sharing the resource tracker of this process may have unregistered the block
+                resource_tracker.register(self._memory._name, 'shared_memory')
+            self._memory.unlink()
+
+    def __enter__(self) -> 'SharedRoadmap':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def number_of_nodes(self) -> int:
+        """The number of nodes of the roadmap
+
+        :return: the number of nodes
+        """
+        return len(self._arrays['nodes'])
+
+    def _node_index(self, point: Coord) -> int:
+        """Finds the index of a node by a vectorized scan, so no index is built when attaching
+
+        :param point: the node
+        :return: the index of the node
+        """
+        nodes = self._arrays['nodes']
+        matches = np.flatnonzero((nodes[:, 0] == point.x) & (nodes[:, 1] == point.y))
+        if not len(matches):
+            raise nx.NodeNotFound(f'Node {point.xy} is not in the roadmap.')
+        return int(matches[0])
+
+    def _edge_position(self, u: int, v: int) -> int:
+        """Finds the position of an edge in the adjacency arrays
+
+        :param u: the index of the first node of the edge
+        :param v: the index of the second node of the edge
+        :return: the position of the edge
+        """
+        indptr, indices = self._arrays['indptr'], self._arrays['indices']
+        return int(indptr[u] + np.flatnonzero(indices[indptr[u]:indptr[u + 1]] == v)[0])
+
+    def _graph(self, weight: Union[str, Dict[str, float]]) -> csr_matrix:
+        """Gets the search graph of a weight. An attribute is searched in place, while a weighted sum is computed once
+        in this process
+
+        :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+        :return: the graph as a sparse matrix of the weights
+        """
+        key = weight if isinstance(weight, str) else tuple(sorted(weight.items()))
+        if key not in self._graphs:
+            if isinstance(weight, str):
+                data = self._arrays[weight]
+            else:
+                data = sum(coefficient * self._arrays[attribute] for attribute, coefficient in weight.items())
+            self._graphs[key] = csr_matrix((data, self._arrays['indices'], self._arrays['indptr']),
+                                           shape=(self.number_of_nodes, self.number_of_nodes), copy=False)
+        return self._graphs[key]
+
+    def _layers_graph(self, constraint: str) -> csr_matrix:
+        """Gets the graph of the number of layers each edge jumps over by its constraint cost, as in the layers search
+        of the roadmap
+
+        :param constraint: the constraint
+        :return: the graph as a sparse matrix of the layer jumps
+        """
+        key = ('layers', constraint)
+        if key not in self._graphs:
+            jumps = np.ceil(np.round(self._arrays[constraint] / LAYER_GRANULARITY, 3))
+            self._graphs[key] = csr_matrix((jumps, self._arrays['indices'], self._arrays['indptr']),
+                                           shape=(self.number_of_nodes, self.number_of_nodes), copy=False)
+        return self._graphs[key]
+
+    def shortest_path(self, source: Coord, target: Coord, weight: Union[str, Dict[str, float]] = 'length') \
+            -> Tuple[List[Coord], float, float, float]:
+        """Computes the shortest path between nodes of the roadmap according given weight
+
+        :param source: the source node
+        :param target: the target node
+        :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+        :return: the shortest path according given weight
+        """
+        start = time()
+        source_idx, target_idx = self._node_index(source), self._node_index(target)
+        _, pred = dijkstra(self._graph(weight), indices=source_idx, return_predecessors=True)
+        if source_idx != target_idx and pred[target_idx] < 0:
+            raise nx.NetworkXNoPath(f'No path between {source.xy} and {target.xy}.')
+
+        path_idx = [target_idx]
+        while path_idx[-1] != source_idx:
+            path_idx.append(int(pred[path_idx[-1]]))
+        path_idx.reverse()
+        return self._path_result(path_idx, time() - start)
+
+    def constrained_shortest_path(self, source: Coord, target: Coord, weight: Union[str, Dict[str, float]] = 'length',
+                                  constraint: str = 'risk', budget: float = 0) \
+            -> Tuple[List[Coord], float, float, float]:
+        """Computes the constrained shortest path between nodes of the roadmap given a weight, a constraint and a
+        budget, by the layers search of the roadmap over the shared arrays
+
+        :param source: the source node
+        :param target: the target node
+        :param weight: the weight, or the coefficient of each attribute in a weighted sum
+        :param constraint: the constraint
+        :param budget: the constraint budget
+        :return: the constrained shortest path
+        """
+        start = time()
+        source_idx, target_idx = self._node_index(source), self._node_index(target)
+        max_layer = int((budget + 1) / LAYER_GRANULARITY) - 1
+
+        graph, layers_graph = self._graph(weight), self._layers_graph(constraint)
+        indptr, indices, weights, jumps = graph.indptr, graph.indices, graph.data, layers_graph.data
+
+        # the graph is undirected so searches from the target bound the way to the target
+        weight_bound = dijkstra(graph, indices=target_idx).tolist()
+        layers_bound, layers_pred = dijkstra(layers_graph, indices=target_idx, return_predecessors=True)
+        layers_bound, layers_pred = layers_bound.tolist(), layers_pred.tolist()
+
+        def _neighbors(node: int) -> Iterable[Tuple[int, float, int]]:
+            begin, end = int(indptr[node]), int(indptr[node + 1])
+            return zip(indices[begin:end].tolist(), weights[begin:end].tolist(), map(int, jumps[begin:end].tolist()))
+
+        path_idx = layers_search(source_idx, target_idx, max_layer, _neighbors, weight_bound.__getitem__,
+                                 layers_bound.__getitem__, layers_pred.__getitem__,
+                                 lambda u, v: float(weights[self._edge_position(u, v)]))
+        if path_idx is None:
+            raise nx.NetworkXNoPath(f'No path between {source.xy} and {target.xy} within budget {budget}')
+        return self._path_result(path_idx, time() - start)
+
+    def _path_result(self, path_idx: List[int], computation_time: float) -> Tuple[List[Coord], float, float, float]:
+        """Gets the expanded path of node indices, its length and risk
+
+        :param path_idx: the indices of the nodes of the path
+        :param computation_time: the computation time of the search
+        :return: the path, its length, risk and the computation time
+        """
+        positions = [self._edge_position(u, v) for u, v in zip(path_idx[:-1], path_idx[1:])]
+        path_length = float(self._arrays['length'][positions].sum())
+        path_risk = float(self._arrays['risk'][positions].sum())
+        return self._expand_path(path_idx, positions), round(path_length, 3), round(path_risk, 3), \
+            round(computation_time, 3)
+
+    def _expand_path(self, path_idx: List[int], positions: List[int]) -> List[Coord]:
+        """Expands the contracted chains of the edges of a path
+
+        :param path_idx: the indices of the nodes of the path
+        :param positions: the positions of the edges of the path
+        :return: the path through all the nodes of the contracted chains
+        """
+        nodes = [tuple(node) for node in self._arrays['nodes'][path_idx].tolist()]
+        expanded = [Coord(*nodes[0])]
+        for u, v, position in zip(nodes[:-1], nodes[1:], positions):
+            if 'via_indptr' in self._arrays:
+                begin, end = self._arrays['via_indptr'][position:position + 2].tolist()
+                via = [tuple(node) for node in self._arrays['via_nodes'][begin:end].tolist()]
+
+                # the chains are ordered from the lower node of their edge
+                expanded.extend(Coord(*p) for p in (via if u <= v else via[::-1]))
+            expanded.append(Coord(*v))
+        return expanded
@@ -0,0 +1,75 @@
+from time import time
+from typing import Dict, List, Tuple, Union, TYPE_CHECKING
+
+import networkx as nx
+
+from geometry.coord import Coord
+from roadmap.pareto import ParetoPaths
+
+if TYPE_CHECKING:
+    from roadmap.roadmap import Roadmap
+
+
+class SingleSourcePaths:
+    def __init__(self, roadmap: 'Roadmap', source: Tuple[float, float]) -> None:
+        """Init of the paths from a single source of a roadmap.
+        The searches from the source are cached by the roadmap, so they are invalidated when it is modified
+
+        :param roadmap: the roadmap
+        :param source: the source node
+        """
+        self._roadmap = roadmap
+        self._source = source
+
+    def shortest_path(self, target: Coord, weight: Union[str, Dict[str, float]] = 'length') \
+            -> Tuple[List[Coord], float, float, float]:
+        """Computes the shortest path to a target according given weight
+
+        :param target: the target
+        :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+        :return: the shortest path according given weight
+        """
+        start = time()
+        _, pred = self._roadmap._shortest_paths_tree(self._source, weight)
+        if target.xy not in pred:
+            raise nx.NetworkXNoPath(f'No path between {self._source} and {target.xy}.')
+
+        path = [Coord(*p) for p in self._roadmap._tree_path(pred, target.xy)[::-1]]
+        computation_time = time() - start
+
+        path_length, path_risk = self._roadmap._compute_path_length_and_risk(path)
+        return self._roadmap._expand_path(path), path_length, path_risk, round(computation_time, 3)
+
+    def pareto_paths(self, target: Coord) -> ParetoPaths:
+        """Computes all the non-dominated (length, risk) paths to a target
+
+        :param target: the target
+        :return: the non-dominated paths ordered by increasing length
+        """
+        start = time()
+        nodes, lengths, risks, preds, fronts = self._roadmap._pareto_labels(self._source)
+        return ParetoPaths(nodes, lengths, risks, preds, fronts.get(target.xy, []), time() - start,
+                           self._roadmap._expand_path)
+
+    def constrained_shortest_path(self, target: Coord, weight: str = 'length', constraint: str = 'risk',
+                                  budget: float = 0) -> Tuple[List[Coord], float, float, float]:
+        """Computes the constrained shortest path to a target given a weight, a constraint and a budget.
+        The path is the best non-dominated path within the budget, so unlike the layers search it is not discretized
+
+        :param target: the target
+        :param weight: the weight, length or risk
+        :param constraint: the constraint, risk or length
+        :param budget: the constraint budget
+        :return: the constrained shortest path
+        """
+        start = time()
+        paths = self.pareto_paths(target)
+        costs = {'length': paths.lengths, 'risk': paths.risks}
+
+        within_budget = [i for i, cost in enumerate(costs[constraint]) if cost <= budget]
+        if not within_budget:
+            raise nx.NetworkXNoPath(f'No path between {self._source} and {target.xy} within budget {budget}')
+
+        path, path_length, path_risk = paths[min(within_budget, key=lambda i: costs[weight][i])]
+        computation_time = time() - start
+        return path, path_length, path_risk, round(computation_time, 3)
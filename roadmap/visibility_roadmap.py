@@ -1,25 +1,104 @@
-from copy import deepcopy
+import math
+from itertools import combinations
+from typing import Any, Dict, List, Tuple
 
 from environment.environment import Environment
+from geometry.circle import Circle
+from geometry.coord import Coord
+from geometry.geometric import calculate_tangent_segments_of_circles
 from roadmap.roadmap import Roadmap
-from itertools import combinations
+
+BOUNDARY_RESOLUTION = 32
 
 
 class VisibilityRoadmap(Roadmap):
-    def __init__(self, environment: Environment) -> None:
-        """Init of visibility roadmap
+    def __init__(self, environment: Environment, boundary_resolution: int = BOUNDARY_RESOLUTION) -> None:
+        """Init of visibility roadmap.
+        The safe edges are the visible common tangents of the threats and the endpoints, connected along the threats'
+        boundaries. The risky edges are chords between sampled points on the boundary of each threat
 
         :param environment: the environment
+        :param boundary_resolution: the minimal number of points sampled on the boundary of each threat, which is
+        raised for large threats so the segments between neighbouring points stay out of the threat
         """
-        super().__init__(environment)
+        self._init_state(environment, boundary_resolution)
+        self._build()
+
+    def _init_state(self, environment: Environment, boundary_resolution: int = BOUNDARY_RESOLUTION) -> None:
+        super()._init_state(environment)
+        self._boundary_resolution = boundary_resolution
+
+    def _build(self) -> None:
+        super()._build()
+        boundary_resolution = self._boundary_resolution
+
+        threats = self._environment.threats
+        radii = [threat.radius + Circle.EPSILON for threat in threats]
+
+        sampled_nodes = []
+        for threat, radius in zip(threats, radii):
+            num_points = self._boundary_points_count(radius, boundary_resolution)
+            sampled_nodes.append([threat.center.shifted(radius, 2 * math.pi * i / num_points)
+                                  for i in range(num_points)])
+
+        # candidate tangent segments as (first point, its threat, second point, its threat) where -1 is no threat
+        candidates = []
+        risky_edges = [tuple(self._environment.endpoints)]
+        for endpoint in self._environment.endpoints:
+            for i, (threat, radius) in enumerate(zip(threats, radii)):
+                if endpoint.distance_to(threat.center) > radius:
+                    candidates.extend((endpoint, -1, contact, i)
+                                      for contact in endpoint.contact_points_with_circle(threat.center, radius))
+                else:
+                    risky_edges.extend((endpoint, node) for node in sampled_nodes[i])
+
+        for i, j in combinations(range(len(threats)), 2):
+            candidates.extend((p1, i, p2, j) for p1, p2 in calculate_tangent_segments_of_circles(
+                threats[i].center, radii[i], threats[j].center, radii[j]))
 
-        potential_nodes = deepcopy(environment.endpoints)
-        for threat in self._environment.threats:
-            potential_nodes.extend(threat.boundary)
+        # keep only the tangents which do not cross threats
+        is_visible = self._environment.are_safe_segments([(p1.xy, p2.xy) for p1, _, p2, _ in candidates])
+        boundary_nodes = [list(nodes) for nodes in sampled_nodes]
+        tangent_edges = []
+        for (p1, i, p2, j), visible in zip(candidates, is_visible):
+            if not visible:
+                continue
+            tangent_edges.append((p1, p2))
+            for point, threat_idx in [(p1, i), (p2, j)]:
+                if threat_idx != -1:
+                    boundary_nodes[threat_idx].append(point)
 
-        edges = []
-        for p1, p2 in combinations(potential_nodes, 2):
-            # if environment.is_safe_edge(p1,p2):
-            edges.append((p1, p2))
+        boundary_edges = []
+        for threat, nodes in zip(threats, boundary_nodes):
+            boundary_edges.extend(self._boundary_edges(threat, nodes))
 
-        self._add_edges(edges)
+        chord_edges = [edge for nodes in sampled_nodes for edge in combinations(nodes, 2)]
+
+        self._add_edges(tangent_edges + boundary_edges + chord_edges + risky_edges)
+
+    def _parameters(self) -> Dict[str, Any]:
+        return {'boundary_resolution': self._boundary_resolution}
+
+    @staticmethod
+    def _boundary_points_count(radius: float, boundary_resolution: int) -> int:
+        """Computes the number of points to sample on a boundary, so the sagitta of the segments between neighbouring
+        points is less than the margin of the boundary from the threat
+
+        :param radius: the radius of the boundary
+        :param boundary_resolution: the minimal number of points
+        :return: the number of points
+        """
+        if radius <= Circle.EPSILON:
+            return boundary_resolution
+        return max(boundary_resolution, math.floor(math.pi / math.acos(1 - Circle.EPSILON / radius)) + 1)
+
+    @staticmethod
+    def _boundary_edges(threat: Circle, nodes: List[Coord]) -> List[Tuple[Coord, Coord]]:
+        """Computes the edges between neighbouring nodes on the boundary of a threat
+
+        :param threat: the threat
+        :param nodes: the nodes on the boundary of the threat
+        :return: the edges along the boundary
+        """
+        nodes = sorted(nodes, key=lambda p: math.atan2(p.y - threat.center.y, p.x - threat.center.x))
+        return list(zip(nodes, nodes[1:] + nodes[:1]))
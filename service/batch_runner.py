@@ -0,0 +1,269 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+from collections import OrderedDict, defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import nullcontext
+from itertools import islice
+from pathlib import Path
+from time import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set, TextIO, Tuple
+
+import numpy as np
+
+from environment.environment import Environment
+from environment.sampling import UniformSampler
+from geometry.coord import Coord
+from roadmap.grid import Grid
+from roadmap.roadmap import Roadmap
+from service.planning_service import ROADMAP_TYPES, analytic_shortest_path
+
+BATCH_CHUNK_SIZE = 1024
+BATCH_TASK_SIZE = 64
+WORKER_CACHE_SIZE = 4
+RESULT_FIELDS = ['id', 'length', 'risk', 'computation_time', 'path', 'error']
+
+# the environments and roadmaps built by a worker process, by their file, roadmap spec and seed
+_worker_cache = OrderedDict()
+
+
+def read_jobs(lines: Iterable[str], file_format: str = 'jsonl') -> Iterator[Dict[str, Any]]:
+    """Reads jobs one at a time. A job has an id, an environment file, a roadmap, a source, a target, and optionally a
+    budget, a method and a weight. The roadmap is a saved roadmap directory, a type and number of samples such as
+    prm:2000, a grid and its step such as grid:20, or empty for analytic jobs around the one or two threats of the
+    environment. The method is analytic, shortest_path or constrained_shortest_path, by default the analytic method
+    without a roadmap and the constrained shortest path with a budget
+
+    :param lines: the lines of the jobs
+    :param file_format: jsonl, or csv with id, environment, roadmap, source_x, source_y, target_x, target_y, budget,
+    method and weight columns, where a weighted sum weight is a json object
+    :return: the jobs, and the id and error of each row or line which could not be read
+    """
+    if file_format == 'csv':
+        for row in csv.DictReader(lines):
+            try:
+                yield {'id': row.get('id') or None, 'environment': row['environment'],
+                       'roadmap': row.get('roadmap') or None,
+                       'source': [float(row['source_x']), float(row['source_y'])],
+                       'target': [float(row['target_x']), float(row['target_y'])],
+                       'budget': float(row['budget']) if row.get('budget') else None,
+                       'method': row.get('method') or None, 'weight': _parse_weight(row.get('weight'))}
+            except (KeyError, TypeError, ValueError) as e:
+                yield {'id': row.get('id') or None, 'error': f'{type(e).__name__}: {e}'}
+    else:
+        for line in lines:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield {'id': None, 'error': f'{type(e).__name__}: {e}'}
+
+
+def _parse_weight(cell: str) -> Any:
+    """Parses the weight cell of a csv job, an attribute name or the json object of a weighted sum
+
+    :param cell: the cell
+    :return: the weight, None if the cell is empty
+    """
+    if not cell:
+        return None
+    return cell if cell.isidentifier() else json.loads(cell)
+
+
+def result_writer(file: TextIO, file_format: str = 'jsonl') -> Callable[[Dict[str, Any]], None]:
+    """Creates a writer of results, with the path as flat coordinates
+
+    :param file: the file of the results
+    :param file_format: jsonl, or csv with the path as space separated coordinates
+    :return: a function writing a result
+    """
+    if file_format == 'csv':
+        writer = csv.DictWriter(file, RESULT_FIELDS)
+        writer.writeheader()
+        return lambda result: writer.writerow({**result, 'path': ' '.join(map(str, result.get('path', [])))})
+    return lambda result: file.write(json.dumps(result) + '\n')
+
+
+def run_batch(jobs: Iterable[Dict[str, Any]], write: Callable[[Dict[str, Any]], None], workers: int = None,
+              chunk_size: int = BATCH_CHUNK_SIZE, task_size: int = BATCH_TASK_SIZE, seed_value: int = 42) -> int:
+    """Runs a stream of jobs in a pool of worker processes, writing the results in order of completion.
+    The jobs are read in chunks, grouped by environment and roadmap into tasks, and at most two tasks per worker are
+    in flight, so the memory does not grow with the number of jobs. Each worker keeps the last environments and
+    roadmaps it built, so a roadmap is built at most once per worker while its jobs are running
+
+    :param jobs: the jobs
+    :param write: a function writing a result
+    :param workers: the number of worker processes, the number of processors by default
+    :param chunk_size: the number of jobs grouped at once
+    :param task_size: the maximal number of jobs of a task
+    :param seed_value: seed of the samples of the roadmaps, so all workers build the same roadmaps
+    :return: the number of jobs
+    """
+    workers = workers or os.cpu_count()
+    num_jobs, pending = 0, set()
+
+    def _write_done(futures: Set[Future]) -> int:
+        results = [result for future in futures for result in future.result()]
+        for result in results:
+            write(result)
+        return len(results)
+
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        for environment, roadmap, task_jobs in _tasks(jobs, chunk_size, task_size):
+            if environment is None:
+                for job in task_jobs:
+                    write(job)
+                num_jobs += len(task_jobs)
+                continue
+
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                num_jobs += _write_done(done)
+            pending.add(executor.submit(_run_task, environment, roadmap, seed_value, task_jobs))
+        num_jobs += _write_done(wait(pending).done)
+    return num_jobs
+
+
+def _tasks(jobs: Iterable[Dict[str, Any]], chunk_size: int, task_size: int) \
+        -> Iterator[Tuple[str, str, List[Dict[str, Any]]]]:
+    """Groups the jobs of each chunk by environment and roadmap into tasks, numbering the jobs without an id
+
+    :param jobs: the jobs
+    :param chunk_size: the number of jobs grouped at once
+    :param task_size: the maximal number of jobs of a task
+    :return: the environment, roadmap and jobs of each task, and the errors of the jobs which could not be read as a
+    task without environment
+    """
+    jobs, index = iter(jobs), 0
+    while chunk := list(islice(jobs, chunk_size)):
+        groups, errors = defaultdict(list), []
+        for job in chunk:
+            if job.get('id') is None:
+                job['id'] = index
+            index += 1
+            if 'error' in job or 'environment' not in job:
+                errors.append({'id': job['id'], 'error': job.get('error', "KeyError: 'environment'")})
+            else:
+                groups[job['environment'], job.get('roadmap')].append(job)
+
+        if errors:
+            yield None, None, errors
+        for (environment, roadmap), group in groups.items():
+            for start in range(0, len(group), task_size):
+                yield environment, roadmap, group[start:start + task_size]
+
+
+def _run_task(environment_path: str, roadmap_spec: str, seed_value: int, jobs: List[Dict[str, Any]]) \
+        -> List[Dict[str, Any]]:
+    """Runs the jobs of a task in a worker process
+
+    :param environment_path: the path of the environment's file
+    :param roadmap_spec: the roadmap of the jobs
+    :param seed_value: seed of the samples of the roadmap
+    :param jobs: the jobs
+    :return: the result of each job
+    """
+    try:
+        environment, roadmap = _load(environment_path, roadmap_spec, seed_value)
+    except Exception as e:
+        return [{'id': job['id'], 'error': f'{type(e).__name__}: {e}'} for job in jobs]
+    return [_run_job(environment, roadmap, job) for job in jobs]
+
+
+def _load(environment_path: str, roadmap_spec: str, seed_value: int) -> Tuple[Environment, Roadmap]:
+    """Gets an environment and its roadmap from the cache of the worker, or builds them
+
+    :param environment_path: the path of the environment's file
+    :param roadmap_spec: the roadmap
+    :param seed_value: seed of the samples of the roadmap
+    :return: the environment and the roadmap, None without a roadmap
+    """
+    key = (environment_path, roadmap_spec, seed_value)
+    if key in _worker_cache:
+        _worker_cache.move_to_end(key)
+        return _worker_cache[key]
+
+    environment = Environment.load(environment_path)
+    if roadmap_spec is None:
+        roadmap = None
+    elif Path(roadmap_spec).is_dir():
+        roadmap = Roadmap.load(roadmap_spec, environment)
+    else:
+        roadmap_type, _, parameter = roadmap_spec.partition(':')
+        if roadmap_type == 'grid':
+            roadmap = Grid(environment, int(parameter)) if parameter else Grid(environment)
+        elif roadmap_type in ROADMAP_TYPES and parameter:
+            roadmap = ROADMAP_TYPES[roadmap_type](environment)
+            roadmap.add_samples(int(parameter), UniformSampler(environment, seed_value=seed_value))
+        else:
+            raise ValueError(f'Unknown roadmap {roadmap_spec}')
+
+    _worker_cache[key] = environment, roadmap
+    if len(_worker_cache) > WORKER_CACHE_SIZE:
+        _worker_cache.popitem(last=False)
+    return environment, roadmap
+
+
+def _run_job(environment: Environment, roadmap: Roadmap, job: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs a job
+
+    :param environment: the environment of the job
+    :param roadmap: the roadmap of the job, None for analytic jobs
+    :param job: the job
+    :return: the result of the job, its length, risk, computation time and path as flat coordinates, or its error
+    """
+    start = time()
+    result = {'id': job['id']}
+    try:
+        budget = job.get('budget')
+        method = job.get('method') or ('analytic' if roadmap is None else
+                                       'shortest_path' if budget is None else 'constrained_shortest_path')
+        if method == 'analytic':
+            threats = np.column_stack([environment.threats_centers, environment.threats_radii]).tolist()
+            path, length, risk = analytic_shortest_path(tuple(job['source']), tuple(job['target']), threats, budget)
+        elif roadmap is None or method not in ['shortest_path', 'constrained_shortest_path']:
+            raise ValueError(f'Method {method} is not supported with roadmap {job.get("roadmap")}')
+        else:
+            kwargs = {'weight': job.get('weight') or 'length'}
+            if method == 'constrained_shortest_path':
+                kwargs['budget'] = budget
+            path, length, risk, _ = roadmap.query(Coord(*job['source']), Coord(*job['target']), method, **kwargs)
+            path = [point.xy for point in path]
+        result.update(length=length, risk=risk, path=[float(c) for point in path for c in point])
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['computation_time'] = round(time() - start, 3)
+    return result
+
+
+def _file_format(path: str, file_format: str) -> str:
+    return file_format or ('csv' if path.endswith('.csv') else 'jsonl')
+
+
+def _open(path: str, mode: str) -> TextIO:
+    if path == '-':
+        return nullcontext(sys.stdin if mode == 'r' else sys.stdout)
+    return open(path, mode, newline='')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Streaming batch runner of path queries from jsonl or csv files')
+    parser.add_argument('jobs', help='file of jobs, - for stdin')
+    parser.add_argument('results', help='file of results, - for stdout')
+    parser.add_argument('--jobs-format', choices=['jsonl', 'csv'], help='by the file extension by default')
+    parser.add_argument('--results-format', choices=['jsonl', 'csv'], help='by the file extension by default')
+    parser.add_argument('--workers', type=int, help='number of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=BATCH_CHUNK_SIZE, help='number of jobs grouped at once')
+    parser.add_argument('--task-size', type=int, default=BATCH_TASK_SIZE, help='maximal number of jobs of a task')
+    parser.add_argument('--seed', type=int, default=42, help='seed of the samples of the roadmaps')
+    args = parser.parse_args()
+
+    start = time()
+    with _open(args.jobs, 'r') as jobs_file, _open(args.results, 'w') as results_file:
+        count = run_batch(read_jobs(jobs_file, _file_format(args.jobs, args.jobs_format)),
+                          result_writer(results_file, _file_format(args.results, args.results_format)),
+                          args.workers, args.chunk_size, args.task_size, args.seed)
+    print(f'{count} jobs in {time() - start:.3f} seconds', file=sys.stderr)
@@ -0,0 +1,296 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import time
+from typing import Any, Dict, FrozenSet, List, Tuple
+
+from algorithms.single_threat import single_threat_shortest_path, single_threat_shortest_path_with_budget_constraint
+from algorithms.two_threats import two_threats_shortest_path, two_threats_shortest_path_with_budget_constraint
+from environment.environment import Environment
+from geometry.circle import Circle
+from geometry.coord import Coord
+from roadmap.grid import Grid
+from roadmap.prm import PRM
+from roadmap.roadmap import Roadmap
+from roadmap.rrg import RRG
+from roadmap.shared import SharedRoadmap
+
+ROADMAP_TYPES = {'prm': PRM, 'rrg': RRG, 'grid': Grid}
+
+# the shared roadmaps attached by a worker process, by the name of their memory block
+_attached_roadmaps = {}
+
+
+class PlanningService:
+    def __init__(self, workers: int = None) -> None:
+        """Init of local planning service, which keeps environments and roadmaps loaded between requests.
+        Analytic queries and queries between nodes of the roadmaps, which are published to shared memory, run in a
+        pool of worker processes. Other roadmap queries insert their endpoints into the roadmap, so they run in one
+        thread at a time
+
+        :param workers: the number of worker processes, the number of processors by default
+        """
+        self._environments = {}
+        self._roadmaps = {}
+        self._shared_roadmaps = {}
+
+        # the nodes of each roadmap when it was published, since queries insert their endpoints temporarily
+        self._published_nodes = {}
+
+        # the number of pool queries on each shared roadmap, and the replaced ones which are freed once they finish
+        self._pool_queries = Counter()
+        self._replaced = {}
+
+        # the workers are spawned, since forking copies the state of the threads of the service
+        self._pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        self._roadmaps_executor = ThreadPoolExecutor(1)
+
+    def close(self) -> None:
+        """Stops the workers and frees the shared roadmaps"""
+        self._pool.shutdown()
+        self._roadmaps_executor.shutdown()
+        for shared in [*self._shared_roadmaps.values(), *self._replaced.values()]:
+            shared.close()
+        self._shared_roadmaps.clear()
+        self._replaced.clear()
+
+    async def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Handles a request of a method and its parameters
+
+        :param request: the request, with its id, method and params
+        :return: the response, with the id of the request, the result or the error, and the latency in milliseconds
+        """
+        start = time()
+        response = {'id': request.get('id')}
+        try:
+            method = getattr(self, f'_{request["method"]}', None)
+            if request['method'] not in ['load_environment', 'build_roadmap', 'query', 'analytic'] or method is None:
+                raise ValueError(f'Unknown method {request["method"]}')
+            response['result'] = await method(**request.get('params', {}))
+        except Exception as e:
+            response['error'] = f'{type(e).__name__}: {e}'
+        response['latency'] = round(1000 * (time() - start), 3)
+        return response
+
+    async def _load_environment(self, name: str, path: str = None, source: List[float] = None,
+                                target: List[float] = None, num_threats: int = 10,
+                                env_range: List[int] = (1000, 1000), seed_value: int = 42) -> Dict[str, Any]:
+        """Loads an environment from a file, or generates it
+
+        :param name: the name of the environment
+        :param path: the path of the environment's file
+        :param source: source of query
+        :param target: target of query
+        :param num_threats: num of threats in the environment
+        :param env_range: the range of the environment
+        :param seed_value: seed of the environment's threats map
+        :return: the content hash of the environment
+        """
+        def _load() -> Environment:
+            if path is not None:
+                return Environment.load(path)
+            return Environment(Coord(*source), Coord(*target), num_threats, tuple(env_range), seed_value)
+
+        environment = await asyncio.get_running_loop().run_in_executor(self._roadmaps_executor, _load)
+        self._environments[name] = environment
+        return {'content_hash': environment.content_hash}
+
+    async def _build_roadmap(self, name: str, environment: str, roadmap_type: str = 'prm', path: str = None,
+                             **parameters) -> Dict[str, Any]:
+        """Builds a roadmap of a loaded environment, or loads it from a directory, and publishes it to shared memory
+
+        :param name: the name of the roadmap
+        :param environment: the name of the environment
+        :param roadmap_type: the type of the roadmap, one of prm, rrg and grid
+        :param path: the path of the roadmap's directory
+        :param parameters: the number of samples, or the parameters of the roadmap's constructor
+        :return: the number of nodes and edges of the roadmap and the computation time
+        """
+        start = time()
+
+        def _build() -> Tuple[Roadmap, SharedRoadmap]:
+            if path is not None:
+                roadmap = Roadmap.load(path, self._environments[environment])
+            else:
+                num_samples = parameters.pop('num_samples', 0)
+                roadmap = ROADMAP_TYPES[roadmap_type](self._environments[environment], **parameters)
+                if num_samples:
+                    roadmap.add_samples(num_samples)
+            return roadmap, SharedRoadmap.publish(roadmap)
+
+        roadmap, shared = await asyncio.get_running_loop().run_in_executor(self._roadmaps_executor, _build)
+        if name in self._shared_roadmaps:
+            self._release(self._shared_roadmaps.pop(name))
+        self._roadmaps[name] = roadmap
+        self._shared_roadmaps[name] = shared
+        self._published_nodes[name] = set(roadmap.graph)
+        return {'nodes': roadmap.graph.number_of_nodes(), 'edges': roadmap.graph.number_of_edges(),
+                'computation_time': round(time() - start, 3)}
+
+    async def _query(self, roadmap: str, source: List[float], target: List[float], weight: Any = 'length',
+                     budget: float = None) -> Dict[str, Any]:
+        """Answers a path query on a roadmap, a constrained shortest path if a budget is given
+
+        :param roadmap: the name of the roadmap
+        :param source: the source of the query
+        :param target: the target of the query
+        :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+        :param budget: the risk budget
+        :return: the path, its length and risk
+        """
+        loop = asyncio.get_running_loop()
+        source, target = Coord(*source), Coord(*target)
+        nodes = self._published_nodes[roadmap]
+        if source.xy in nodes and target.xy in nodes:
+            shared = self._shared_roadmaps[roadmap]
+            name = shared.handle[0]
+            published = frozenset([*self._shared_roadmaps.values(), *self._replaced.values()])
+            self._pool_queries[name] += 1
+            try:
+                path, length, risk, _ = await loop.run_in_executor(
+                    self._pool, _shared_query, shared.handle, frozenset(other.handle[0] for other in published),
+                    source.xy, target.xy, weight, budget)
+            finally:
+                self._pool_queries[name] -= 1
+                if name in self._replaced:
+                    self._release(shared)
+        elif budget is None:
+            path, length, risk, _ = await loop.run_in_executor(
+                self._roadmaps_executor, lambda: self._roadmaps[roadmap].query(source, target, weight=weight))
+        else:
+            path, length, risk, _ = await loop.run_in_executor(
+                self._roadmaps_executor, lambda: self._roadmaps[roadmap].query(
+                    source, target, 'constrained_shortest_path', weight=weight, budget=budget))
+        return {'path': [point.xy for point in path], 'length': length, 'risk': risk}
+
+    def _release(self, shared: SharedRoadmap) -> None:
+        """Frees a shared roadmap which was replaced, once no pool query runs on it
+
+        :param shared: the shared roadmap
+        """
+        name = shared.handle[0]
+        if self._pool_queries[name] > 0:
+            self._replaced[name] = shared
+            return
+        self._replaced.pop(name, None)
+        del self._pool_queries[name]
+        shared.close()
+
+    async def _analytic(self, source: List[float], target: List[float], threats: List[List[float]],
+                        budget: float = None) -> Dict[str, Any]:
+        """Answers a shortest path query around one or two threats analytically, within a budget if given
+
+        :param source: the source of the query
+        :param target: the target of the query
+        :param threats: the center coordinates and radius of each threat
+        :param budget: the risk budget
+        :return: the path, its length and risk
+        """
+        path, length, risk = await asyncio.get_running_loop().run_in_executor(
+            self._pool, analytic_shortest_path, tuple(source), tuple(target), [tuple(t) for t in threats], budget)
+        return {'path': path, 'length': length, 'risk': risk}
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answers the requests of a connection, one json per line, concurrently
+
+        :param reader: the reader of the connection
+        :param writer: the writer of the connection
+        """
+        async def _respond(line: bytes) -> None:
+            try:
+                response = await self.handle(json.loads(line))
+            except json.JSONDecodeError as e:
+                response = {'id': None, 'error': f'{type(e).__name__}: {e}'}
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+
+        tasks = set()
+        while line := await reader.readline():
+            task = asyncio.create_task(_respond(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        writer.close()
+
+    async def serve(self, socket_path: str = None, host: str = '127.0.0.1', port: int = 8765) -> None:
+        """Serves requests over a unix socket, or over tcp on localhost
+
+        :param socket_path: the path of the unix socket
+        :param host: the host of the tcp server
+        :param port: the port of the tcp server
+        """
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self._serve_connection, socket_path)
+        else:
+            server = await asyncio.start_server(self._serve_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def _shared_query(handle: Tuple, published: FrozenSet[str], source: Tuple[float, float],
+                  target: Tuple[float, float], weight: Any, budget: float = None) \
+        -> Tuple[List[Coord], float, float, float]:
+    """Answers a query on a shared roadmap in a worker process, which attaches each roadmap once and detaches the
+    roadmaps which are no longer published
+
+    :param handle: the handle of the shared roadmap
+    :param published: the names of the memory blocks of the published roadmaps
+    :param source: the source node
+    :param target: the target node
+    :param weight: a given weight, or the coefficient of each attribute in a weighted sum
+    :param budget: the risk budget
+    :return: the shortest path according given weight, or the constrained shortest path if a budget is given
+    """
+    for name in [name for name in _attached_roadmaps if name not in published]:
+        _attached_roadmaps.pop(name).close()
+
+    name = handle[0]
+    if name not in _attached_roadmaps:
+        _attached_roadmaps[name] = SharedRoadmap.attach(handle)
+    if budget is None:
+        return _attached_roadmaps[name].shortest_path(Coord(*source), Coord(*target), weight)
+    return _attached_roadmaps[name].constrained_shortest_path(Coord(*source), Coord(*target), weight, budget=budget)
+
+
+def analytic_shortest_path(source: Tuple[float, float], target: Tuple[float, float],
+                           threats: List[Tuple[float, float, float]], budget: float = None) \
+        -> Tuple[List[Tuple[float, float]], float, float]:
+    """Computes the shortest path around one or two threats analytically, within a budget if given
+
+    :param source: the source
+    :param target: the target
+    :param threats: the center coordinates and radius of each threat
+    :param budget: the risk budget
+    :return: the path, its length and risk
+    """
+    circles = [Circle(Coord(x, y), radius) for x, y, radius in threats]
+    if len(circles) not in [1, 2]:
+        raise ValueError(f'Analytic queries support one or two threats, not {len(circles)}')
+    if budget is None:
+        planner = single_threat_shortest_path if len(circles) == 1 else two_threats_shortest_path
+        path, length, risk = planner(Coord(*source), Coord(*target), *circles)
+    elif len(circles) == 1:
+        path, length, risk = single_threat_shortest_path_with_budget_constraint(
+            Coord(*source), Coord(*target), circles[0], budget)
+    else:
+        path, length, risk = two_threats_shortest_path_with_budget_constraint(
+            Coord(*source), Coord(*target), *circles, budget)
+    return [point.xy for point in path.coords], float(length), float(risk)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local planning service of newline delimited json requests')
+    parser.add_argument('--socket', help='path of a unix socket to serve on, instead of tcp')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, help='number of worker processes')
+    args = parser.parse_args()
+
+    service = PlanningService(args.workers)
+    try:
+        asyncio.run(service.serve(args.socket, args.host, args.port))
+    finally:
+        service.close()
@@ -0,0 +1,77 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from environment.environment import Environment, PARALLEL_CHUNK_SIZE
+from geometry.circle import Circle
+from geometry.coord import Coord
+from roadmap.prm import PRM
+
+
+def test_save_and_load(tmp_path):
+    environment = Environment(Coord(0, 0), Coord(1000, 1000), num_threats=8, seed_value=11)
+    environment.save(tmp_path / 'environment.npz')
+    loaded = Environment.load(tmp_path / 'environment.npz')
+
+    assert loaded.content_hash == environment.content_hash
+    assert loaded.endpoints == environment.endpoints
+    assert [threat.center for threat in loaded.threats] == [threat.center for threat in environment.threats]
+
+    points = np.random.default_rng(0).uniform(0, 1000, size=(500, 2))
+    assert np.array_equal(loaded.are_safe_points(points), environment.are_safe_points(points))
+
+    segments = np.stack([points[:-1], points[1:]], axis=1)
+    assert np.allclose(loaded.compute_segments_attributes(segments)['risk'],
+                       environment.compute_segments_attributes(segments)['risk'])
+
+
+def test_threats_loaders(tmp_path):
+    threats = np.array([[100, 200, 30], [500.5, 400, 50], [800, 900, 10.25]])
+    np.save(tmp_path / 'threats.npy', threats)
+    np.savetxt(tmp_path / 'threats.csv', threats, delimiter=',', header='x,y,radius', comments='')
+
+    # the npy file is memory-mapped without copying its rows
+    npy_environment = Environment.from_threats_npy(tmp_path / 'threats.npy', Coord(0, 0), Coord(1000, 1000))
+    assert not npy_environment.threats_radii.flags.writeable
+
+    for environment in [
+        npy_environment,
+        Environment.from_threats_csv(tmp_path / 'threats.csv', Coord(0, 0), Coord(1000, 1000), chunk_size=2),
+    ]:
+        assert np.array_equal(environment.threats_centers, threats[:, :2])
+        assert np.array_equal(environment.threats_radii, threats[:, 2])
+        assert not environment.is_safe_point(Coord(500, 420))
+        assert environment.is_safe_point(Coord(0, 0))
+
+
+def test_pickle():
+    environment = Environment(Coord(0, 0), Coord(1000, 1000), num_threats=8, seed_value=11)
+    prm = PRM(environment)
+    environment.is_safe_point(Coord(500, 500))
+
+    loaded = pickle.loads(pickle.dumps(environment))
+    assert loaded.content_hash == environment.content_hash
+    assert len(loaded._roadmaps) == 0 and len(environment._roadmaps) == 1 and prm is not None
+    assert loaded.is_safe_point(Coord(0, 0))
+
+
+@pytest.mark.parametrize('threads', [False, True])
+def test_parallel_segments_attributes(threads):
+    environment = Environment(Coord(0, 0), Coord(1000, 1000), num_threats=8, seed_value=11)
+    rng = np.random.default_rng(0)
+    starts = rng.uniform(0, 1000, size=(3 * PARALLEL_CHUNK_SIZE, 2))
+    points = np.stack([starts, starts + rng.normal(0, 30, size=starts.shape)], axis=1)
+    expected = environment.compute_segments_attributes(points)
+
+    with environment.parallel(workers=2, threads=threads):
+        attributes = environment.compute_segments_attributes(points)
+        assert pickle.loads(pickle.dumps(environment))._executor is None
+        assert all(np.array_equal(attributes[key], expected[key]) for key in expected)
+
+        # the workers are restarted with the changed threats
+        environment.add_threat(Circle(Coord(500, 500), 50))
+        attributes = environment.compute_segments_attributes(points)
+
+    assert np.array_equal(attributes['risk'], environment.compute_segments_attributes(points)['risk'])
+    assert not np.array_equal(attributes['risk'], expected['risk'])
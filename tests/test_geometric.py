@@ -1,10 +1,12 @@
 import math
 
 from geometry.coord import Coord
+from geometry.segment import Segment
 from geometry.geometric import is_left_side_of_line, calculate_angle_on_chord, \
     calculate_non_directional_angle_of_line, calculate_directional_angle_of_line, \
     calculate_points_in_distance_on_circle, calculate_contact_points_with_circle_from_point, \
-    calculate_arc_length_on_chord, calculate_outer_tangent_points_of_circles, calculate_inner_tangent_points_of_circles
+    calculate_arc_length_on_chord, calculate_outer_tangent_points_of_circles, calculate_inner_tangent_points_of_circles, \
+    calculate_tangent_segments_of_circles
 
 
 def test_is_left_side_of_line():
@@ -163,3 +165,24 @@ def test_pairs_of_inner_tangent_points_on_circle():
     assert t1.distance_to(t2) < t3.distance_to(t4)
     assert abs(t1.distance_to(t3) - t2.distance_to(t4)) < 1e-3
     assert t1.distance_to(center2) < t3.distance_to(center2)
+
+
+def test_tangent_segments_of_circles():
+    center1 = Coord(100, 100)
+    center2 = Coord(500, 100)
+    radius = 100
+    segments = calculate_tangent_segments_of_circles(center1, radius, center2, radius)
+    assert len(segments) == 4
+    assert all(p1.almost_equal(s1) and p2.almost_equal(s2) for (p1, p2), (s1, s2)
+               in zip(segments[:2], [(Coord(100, 200), Coord(500, 200)), (Coord(100, 0), Coord(500, 0))]))
+
+    center1 = Coord(-200, 100)
+    center2 = Coord(200, 300)
+    radius1 = 300
+    radius2 = 50
+    for p1, p2 in calculate_tangent_segments_of_circles(center1, radius1, center2, radius2):
+        assert abs(p1.distance_to(center1) - radius1) < 1e-8 and abs(p2.distance_to(center2) - radius2) < 1e-8
+        assert abs(Segment(p1, p2).to_shapely.distance(center1.to_shapely) - radius1) < 1e-6
+        assert abs(Segment(p1, p2).to_shapely.distance(center2.to_shapely) - radius2) < 1e-6
+
+    assert calculate_tangent_segments_of_circles(Coord(0, 0), 100, Coord(10, 0), 20) == []
@@ -0,0 +1,507 @@
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from environment.environment import Environment
+from geometry.circle import Circle
+from geometry.coord import Coord
+from roadmap.anytime import AnytimePlanner
+from roadmap.dynamic_kdtree import DynamicKDTree
+from roadmap.grid import Grid
+from roadmap.prm import PRM
+from roadmap.quadtree import Quadtree
+from roadmap.roadmap import Roadmap, EPSILON
+from roadmap.rrg import RRG
+from roadmap.shared import SharedRoadmap
+from roadmap.visibility_roadmap import VisibilityRoadmap
+
+environment = Environment(source=Coord(0, 0), target=Coord(950, 950), num_threats=8)
+grid = Grid(environment)
+
+
+def test_constrained_shortest_path_within_budget():
+    shortest_path, shortest_length, shortest_risk, _ = grid.shortest_path(weight='length')
+    _, safest_length, safest_risk, _ = grid.shortest_path(weight='risk')
+
+    # each edge may exceed its risk by one layer
+    path, length, risk, _ = grid.constrained_shortest_path(budget=shortest_risk + len(shortest_path))
+    assert length == shortest_length
+
+    for budget in [400, 1000]:
+        path, length, risk, _ = grid.constrained_shortest_path(budget=budget)
+        assert risk <= budget
+        assert shortest_length <= length <= safest_length
+        assert path[0] == environment.source and path[-1] == environment.target
+
+    with pytest.raises(nx.NetworkXNoPath):
+        grid.constrained_shortest_path(budget=safest_risk - 100)
+
+
+def test_constrained_shortest_path_reuses_bounds():
+    grid.constrained_shortest_path(budget=400)
+    bounds = grid._lower_bounds(environment.target.xy, 'length')
+    grid.constrained_shortest_path(budget=1000)
+    assert grid._lower_bounds(environment.target.xy, 'length') is bounds
+
+
+def test_pareto_paths():
+    _, shortest_length, _, _ = grid.shortest_path(weight='length')
+    _, _, safest_risk, _ = grid.shortest_path(weight='risk')
+
+    paths = grid.pareto_paths()
+    assert paths.lengths[0] == shortest_length and paths.risks[-1] == safest_risk
+    assert all(r1 > r2 for r1, r2 in zip(paths.risks[:-1], paths.risks[1:]))
+
+    # the pareto path of a budget is not longer than the discretized constrained path of the budget
+    budget = 400
+    _, length, _, _ = grid.constrained_shortest_path(budget=budget)
+    assert min(l for l, r in zip(paths.lengths, paths.risks) if r <= budget) <= length
+
+    path, length, risk = paths[1]
+    assert path[0] == environment.source and path[-1] == environment.target
+    assert grid._compute_path_length_and_risk(path) == (length, risk)
+
+    assert len(grid.pareto_paths(epsilon=0.2)) < len(paths)
+
+
+def test_query_many():
+    pairs = [(Coord(13, 17), Coord(888, 901)), (Coord(13, 17), Coord(500, 20)), (Coord(600, 33), Coord(888, 901))]
+    num_nodes, num_edges = grid.graph.number_of_nodes(), grid.graph.number_of_edges()
+
+    results = grid.query_many(pairs)
+    assert grid.graph.number_of_nodes() == num_nodes and grid.graph.number_of_edges() == num_edges
+
+    # the kd-tree of the nodes outlives the insertion and the removal of the endpoints
+    node_index = grid._node_index()
+    grid.query(Coord(14, 18), Coord(889, 902))
+    assert grid._cache['node-index'] is node_index
+
+    for (source, target), (path, length, risk, _) in zip(pairs, results):
+        assert path[0] == source and path[-1] == target
+        assert grid.query(source, target, weight='length')[1] == length
+
+    for (source, target), (path, length, risk, _) in zip(pairs, grid.query_many(
+            pairs, 'constrained_shortest_path', budget=400)):
+        assert path[0] == source and path[-1] == target
+        assert risk <= 400
+
+
+def test_single_source():
+    paths = grid.single_source()
+    target = Coord(500, 600)
+
+    assert paths.shortest_path(target)[1] == grid.shortest_path(target=target)[1]
+    assert paths.pareto_paths(target).lengths == grid.pareto_paths(target=target).lengths
+
+    path, length, risk, _ = paths.constrained_shortest_path(environment.target, budget=400)
+    assert risk <= 400 and length <= grid.constrained_shortest_path(budget=400)[1]
+
+    # the cached searches are dropped once the roadmap is modified
+    assert ('pareto-labels', environment.source.xy) in grid._cache
+    grid.query(environment.source, target)
+    assert ('pareto-labels', environment.source.xy) in grid._cache
+    grid.query(environment.source, Coord(13, 17))
+    assert ('pareto-labels', environment.source.xy) not in grid._cache
+
+
+def test_prm_connects_k_nearest():
+    prm = PRM(environment)
+    prm.add_samples(300)
+
+    point = Coord(500.5, 500.5)
+    nodes = [Coord(*p) for p in prm.graph.nodes]
+    assert set(prm._k_neighborhood(point)) == set(sorted(nodes, key=point.distance_to)[:prm._neighborhood_k])
+    assert all(node.distance_to(point) < prm._near_radius for node in prm._near(point))
+    assert all(prm.graph.degree(node) >= prm._neighborhood_k for node in prm.graph.nodes
+               if node not in [environment.source.xy, environment.target.xy])
+
+
+def test_dynamic_kdtree():
+    points = [(x * 7 % 101, x * 13 % 97) for x in range(1000)]
+    index = DynamicKDTree(points[:100])
+    for point in points[100:]:
+        index.insert(point)
+    assert len(index) == len(points)
+
+    query = (50.5, 40.5)
+    distance = lambda p: Coord(*p).distance_to(Coord(*query))
+    assert index.nearest(query) == min(points, key=distance)
+    assert sorted(index.near(query, 10)) == sorted(p for p in set(points) if distance(p) <= 10)
+
+
+def test_rrg_grows_towards_samples():
+    rrg = RRG(environment)
+    rrg.add_samples(500)
+    nodes = [Coord(*p) for p in rrg.graph.nodes]
+
+    # the tree grows from the source towards samples in every direction
+    assert max(node.x for node in nodes) > 50 and max(node.y for node in nodes) > 50
+    assert all(rrg.graph.degree(node.xy) > 0 for node in nodes if node != environment.target)
+
+
+def test_merge_graph():
+    prm, other = PRM(environment), PRM(environment)
+    prm.add_samples(200)
+    other.add_samples(200)
+    nodes = set(prm.graph.nodes)
+
+    prm.merge_graph(other.graph, merge_radius=30)
+    assert nx.number_of_selfloops(prm.graph) == 0
+    assert all(prm.graph.has_edge(u, v) for u, v in other.graph.edges)
+    assert all(prm.graph.has_edge(u, v) for u in nodes for v in other.graph.nodes
+               if 0 < Coord(*u).distance_to(Coord(*v)) < 30)
+
+
+def test_visibility_roadmap():
+    visibility_roadmap = VisibilityRoadmap(environment)
+
+    _, length, _, _ = visibility_roadmap.shortest_path(weight='length')
+    assert length == round(environment.source.distance_to(environment.target), 3)
+
+    # the tangents and the boundaries are safe so the safest path is at least as safe as on the grid
+    _, _, risk, _ = visibility_roadmap.shortest_path(weight='risk')
+    assert risk <= grid.shortest_path(weight='risk')[2]
+    assert visibility_roadmap.graph.number_of_edges() < 10000
+
+    # the boundary of a large threat is sampled densely enough for its boundary segments to stay safe
+    large = Environment.from_arrays(Coord(0, 0), Coord(2000, 2000), np.array([[1000, 1000]]), np.array([600]),
+                                    (2000, 2000))
+    _, length, risk, _ = VisibilityRoadmap(large).shortest_path(weight='risk')
+    assert risk < EPSILON * length + 1e-6
+
+
+def test_implicit_grid():
+    assert grid.graph.number_of_edges() == 4 * 19 * 19 + 2 * 19
+
+    implicit_grid = Grid(environment, implicit=True)
+    for weight in ['length', 'risk', {'length': 1, 'risk': 1}]:
+        assert implicit_grid.shortest_path(weight)[1:3] == grid.shortest_path(weight)[1:3]
+    assert implicit_grid.graph.number_of_edges() == 0
+
+    fine_grid = Grid(environment, step=5, implicit=True)
+    path, _, _, _ = fine_grid.shortest_path(target=Coord(300, 200))
+    assert path[-1] == Coord(300, 200)
+    assert len(fine_grid._edges_data) < 4 * 200 * 200 / 10
+
+    # the endpoints are off the grid when the step does not divide the range
+    for implicit in [False, True]:
+        path, _, _, _ = Grid(environment, step=30, implicit=implicit).shortest_path()
+        assert path[0] == environment.source and path[-1] == environment.target
+
+
+def test_quadtree_refines_near_threats():
+    quadtree = Quadtree(environment, min_depth=3, max_depth=6)
+    fine_grid = Grid(environment, step=1000 // 2 ** 6)
+    assert quadtree.graph.number_of_nodes() < fine_grid.graph.number_of_nodes() / 2
+
+    # the leaves are of the max depth near the threats' boundaries
+    threat = environment.threats[0]
+    assert any(abs(Coord(*node).distance_to(threat.center) - threat.radius) < 1000 / 2 ** 6
+               for node in quadtree.graph.nodes)
+
+    for weight in ['length', 'risk']:
+        _, length, risk, _ = quadtree.shortest_path(weight)
+        _, grid_length, grid_risk, _ = fine_grid.query(environment.source, environment.target, weight=weight)
+        assert abs(length - grid_length) < 0.05 * grid_length
+        if weight == 'risk':
+            # refining near the threats lets the safest path pass their boundaries as closely as on the fine grid
+            assert risk <= 1.05 * grid_risk
+
+
+def test_lazy_prm_matches_eager_prm():
+    eager = PRM(environment)
+    eager.add_samples(1000)
+    lazy = PRM(environment, lazy=True)
+    lazy.merge_graph(eager.graph, merge_radius=0)
+
+    for weight in ['length', 'risk']:
+        assert eager.shortest_path(weight)[1:3] == lazy.shortest_path(weight)[1:3]
+    budget = eager.shortest_path('risk')[2] + 20
+    assert eager.constrained_shortest_path(budget=budget)[1:3] == lazy.constrained_shortest_path(budget=budget)[1:3]
+    assert eager.pareto_paths().risks == lazy.pareto_paths().risks
+
+    # only the edges on the candidate paths were evaluated, and the evaluated risks are kept
+    evaluated = [data for _, _, data in lazy.graph.edges(data=True) if data['evaluated']]
+    assert len(evaluated) < lazy.graph.number_of_edges()
+    assert all((data['length'], data['risk']) == (eager.graph.edges[u, v]['length'], eager.graph.edges[u, v]['risk'])
+               for u, v, data in lazy.graph.edges(data=True) if data['evaluated'])
+
+
+def test_refine_path():
+    path, length, risk, _ = grid.shortest_path('risk')
+    refined = grid.refine_path(path)
+    assert refined[0] == path[0] and refined[-1] == path[-1] and len(refined) < len(path)
+    assert set(refined) <= set(path)
+
+    attributes = environment.compute_path_attributes(refined)
+    assert attributes['length'] <= length and attributes['risk'] <= risk + 1e-6
+
+    # a straight path of many waypoints is shortcut by the look-ahead
+    straight = [Coord(i, i) for i in range(1000)]
+    assert len(grid.refine_path(straight, lookahead=10)) == 1 + ceil(999 / 10)
+
+    # the slack for rounding is allowed once over the path, not per shortcut
+    threat = environment.threats[0]
+    crossing = [threat.center.shifted(threat.radius * 2, 0)] + [Coord(threat.center.x + x, threat.center.y + (x % 2))
+                                                               for x in range(int(threat.radius), -1, -1)]
+    path_risk = environment.compute_path_attributes(crossing)['risk']
+    assert environment.compute_path_attributes(grid.refine_path(crossing))['risk'] <= path_risk + EPSILON
+
+
+def test_compress_keeps_paths():
+    rrg = RRG(environment)
+    rrg.add_samples(3000)
+    rrg.merge_graph(grid.graph, merge_radius=10)
+    paths = {weight: rrg.shortest_path(weight) for weight in ['length', 'risk']}
+    pareto = rrg.pareto_paths()
+    num_nodes = rrg.graph.number_of_nodes()
+
+    rrg.compress()
+    assert rrg.graph.number_of_nodes() < 0.8 * num_nodes
+    for weight, (path, length, risk, _) in paths.items():
+        compressed_path, compressed_length, compressed_risk, _ = rrg.shortest_path(weight)
+        assert (compressed_length, compressed_risk) == pytest.approx((length, risk))
+        assert compressed_path[0] == environment.source and compressed_path[-1] == environment.target
+        assert environment.compute_path_attributes(compressed_path)['length'] == pytest.approx(compressed_length)
+
+    # each front dominates the other, up to paths of the same length
+    compressed_pareto = rrg.pareto_paths()
+    front, compressed_front = list(zip(pareto.lengths, pareto.risks)), list(zip(compressed_pareto.lengths,
+                                                                                compressed_pareto.risks))
+    for first, second in [(front, compressed_front), (compressed_front, front)]:
+        assert all(any(l2 <= l1 + 1e-3 and r2 <= r1 + 1e-3 for l2, r2 in second) for l1, r1 in first)
+    assert all(environment.compute_path_attributes(path)['length'] == pytest.approx(length)
+               for path, length, _ in compressed_pareto)
+
+    # a straight edge added over a contracted chain which is safer keeps the chain
+    chains = [(u, v) for u, v, data in rrg.graph.edges(data=True) if data.get('via')]
+    straight_risks = environment.compute_segments_attributes(chains)['risk']
+    chains = [(u, v) for (u, v), risk in zip(chains, straight_risks) if risk > rrg.graph[u][v]['risk']]
+    assert chains
+    for u, v in chains:
+        bounds = {weight: nx.shortest_path_length(rrg.graph, u, v, weight=weight) for weight in ['length', 'risk']}
+        rrg._add_edges([(Coord(*u), Coord(*v))])
+        for weight, bound in bounds.items():
+            assert nx.shortest_path_length(rrg.graph, u, v, weight=weight) <= bound + 1e-6
+
+
+def test_contraction_hierarchy(tmp_path):
+    prm = PRM(environment)
+    prm.add_samples(300)
+    pairs = list(zip(list(prm.graph.nodes)[::10], list(prm.graph.nodes)[5::10]))
+    weights = ['length', 'risk', {'length': 1, 'risk': 10}]
+    expected = {str(weight): [prm.shortest_path(weight, Coord(*s), Coord(*t))[1:3] for s, t in pairs]
+                for weight in weights}
+
+    for weight in weights:
+        hierarchy = prm.build_contraction_hierarchy(weight)
+        assert hierarchy.preprocessing_time >= 0
+        assert [prm.shortest_path(weight, Coord(*s), Coord(*t))[1:3] for s, t in pairs] \
+               == pytest.approx(expected[str(weight)])
+
+    # the hierarchy is persisted and loaded into a roadmap of the same graph
+    prm.build_contraction_hierarchy('risk').save(tmp_path / 'risk.npz')
+    prm._hierarchies.clear()
+    prm.load_contraction_hierarchy(tmp_path / 'risk.npz')
+    path, _, risk, _ = prm.query(Coord(13, 17), Coord(900.5, 800.5), weight='risk')
+    assert prm._contraction_hierarchy('risk') is not None
+    assert path[0] == Coord(13, 17) and path[-1] == Coord(900.5, 800.5)
+
+    # queries which insert their endpoints temporarily keep the hierarchies
+    prm.query(Coord(13, 17), Coord(900.5, 800.5), 'constrained_shortest_path', weight='length', budget=100)
+    assert prm._contraction_hierarchy('risk') is not None
+
+    prm._hierarchies.clear()
+    assert prm.query(Coord(13, 17), Coord(900.5, 800.5), weight='risk')[2] == pytest.approx(risk)
+    with pytest.raises(ValueError):
+        grid.load_contraction_hierarchy(tmp_path / 'risk.npz')
+
+    # a hierarchy of the same nodes but other weights of the edges is rejected
+    u, v = next(iter(prm.graph.edges))
+    prm.graph[u][v]['risk'] += 1
+    with pytest.raises(ValueError):
+        prm.load_contraction_hierarchy(tmp_path / 'risk.npz')
+
+
+def test_save_and_load(tmp_path, monkeypatch):
+    prm = PRM(environment, lazy=True)
+    prm.add_samples(300)
+    prm.compress()
+    prm.build_contraction_hierarchy('risk')
+    path = PRM.store_path(tmp_path, environment, samples=300)
+    prm.save(path)
+
+    loaded = Roadmap.load(path, environment)
+    assert isinstance(loaded, PRM) and loaded._neighborhood_k == prm._neighborhood_k and loaded._lazy
+    edges = lambda graph: {frozenset((u, v)): edge_data for u, v, edge_data in graph.edges(data=True)}
+    assert edges(loaded.graph) == edges(prm.graph)
+    assert loaded._contraction_hierarchy('risk') is not None
+    assert loaded.shortest_path('risk') == pytest.approx(prm.shortest_path('risk'), abs=1)
+
+    implicit_grid = Grid(environment, 25, implicit=True)
+    implicit_grid.save(tmp_path / 'grid')
+    loaded_grid = Grid.load(tmp_path / 'grid', environment)
+    assert loaded_grid._step == 25 and loaded_grid._implicit
+    assert loaded_grid.shortest_path()[1:3] == implicit_grid.shortest_path()[1:3]
+
+    # a loaded roadmap is not built again
+    grid.save(tmp_path / 'materialized-grid')
+    for method in ['_build', '_add_edges']:
+        monkeypatch.setattr(Grid, method, lambda *args, name=method: pytest.fail(f'{name} was called'))
+    loaded_grid = Grid.load(tmp_path / 'materialized-grid', environment)
+    monkeypatch.undo()
+    assert edges(loaded_grid.graph) == edges(grid.graph)
+    assert loaded_grid.shortest_path('risk')[1:3] == grid.shortest_path('risk')[1:3]
+
+    with pytest.raises(ValueError):
+        Roadmap.load(path, Environment(source=Coord(0, 0), target=Coord(950, 950), num_threats=3))
+    with pytest.raises(ValueError):
+        Grid.load(path, environment)
+
+
+def test_update_threats():
+    changing = Environment(source=Coord(0, 0), target=Coord(950, 950), num_threats=4, seed_value=3)
+    prm = PRM(changing)
+    prm.add_samples(500)
+    prm.compress()
+    implicit_grid = Grid(changing, implicit=True)
+    implicit_grid.shortest_path(weight='risk')
+
+    prm.shortest_path(weight='risk')
+    prm._shortest_paths_tree(changing.source.xy, 'length')
+
+    changing.add_threat(Circle(Coord(500, 500), 60))
+    changing.move_threat(0, Coord(200, 800))
+    changing.remove_threat(1)
+
+    # the trees by length are kept and the trees by risk are recomputed over the updated risks
+    assert ('shortest-paths-tree', changing.source.xy, 'length') in prm._cache
+    assert ('shortest-paths-tree', changing.source.xy, 'risk') not in prm._cache
+
+    for roadmap, edges_data in [(prm, {(u, v): edge_data for u, v, edge_data in prm.graph.edges(data=True)}),
+                                (implicit_grid, implicit_grid._edges_data)]:
+        for (u, v), edge_data in edges_data.items():
+            chain = [u, *roadmap._edge_via(u, v), v]
+            risk = sum(changing.compute_segments_attributes(list(zip(chain[:-1], chain[1:])))['risk'])
+            assert edge_data['risk'] == pytest.approx(risk + EPSILON * edge_data['length'], abs=1e-6)
+
+
+def test_replanning_session():
+    changing = Environment(source=Coord(0, 0), target=Coord(950, 950), num_threats=4, seed_value=5)
+    prm = PRM(changing)
+    prm.add_samples(500)
+
+    session = prm.replanning_session(weight='risk')
+    path, length, risk, _ = session.path()
+    assert (length, risk) == prm.shortest_path(weight='risk')[1:3]
+
+    # move along the path and change the threats, each path is the shortest path from the current position
+    session.move_to(path[len(path) // 3])
+    changing.add_threat(Circle(Coord(700, 700), 80))
+    for position in [path[len(path) // 2], Coord(600, 420)]:
+        session.move_to(position)
+        _, length, risk, _ = session.path()
+        assert risk == pytest.approx(prm.shortest_path(weight='risk', source=position)[2], abs=1e-3)
+
+    constrained = prm.replanning_session(budget=300)
+    path, _, risk, _ = constrained.path()
+    constrained.move_to(path[len(path) // 2])
+    _, _, remaining_risk, _ = constrained.path()
+    assert remaining_risk <= constrained.remaining_budget < 300
+
+    # the positions off the roadmap are removed once the source leaves them
+    num_nodes = prm.graph.number_of_nodes()
+    session.move_to(Coord(610.5, 430.5))
+    assert session.path()[0][0] == Coord(610.5, 430.5)
+    session.close()
+    assert prm.graph.number_of_nodes() == num_nodes - 1 and Coord(600, 420).xy not in prm.graph
+
+    weighted = prm.replanning_session(weight={'length': 1, 'risk': 10}, budget=300)
+    _, length, risk, _ = weighted.path()
+    assert risk <= 300 and (length, risk) == prm.constrained_shortest_path({'length': 1, 'risk': 10}, budget=300)[1:3]
+
+
+def test_pickle():
+    prm = PRM(environment)
+    prm.add_samples(100)
+    loaded = pickle.loads(pickle.dumps(prm))
+    assert set(loaded.graph.edges) == set(prm.graph.edges)
+    assert loaded in loaded._environment._roadmaps
+    assert loaded.shortest_path()[1:3] == prm.shortest_path()[1:3]
+
+
+def test_anytime_planner():
+    prm = PRM(environment)
+    path, length, risk, trace = AnytimePlanner(prm, weight='risk', batch_size=100).plan(deadline=1.5)
+
+    # the path is the best path of the grown roadmap and it only improves
+    assert (length, risk) == prm.shortest_path(weight='risk')[1:3]
+    assert path[0] == environment.source and path[-1] == environment.target
+    assert all(later[3] <= earlier[3] for earlier, later in zip(trace[:-1], trace[1:]))
+    assert trace[-1][0] <= 1.5 + 0.5
+
+    _, _, _, trace = AnytimePlanner(PRM(environment), batch_size=100).plan(deadline=10, max_samples=300)
+    assert len(trace) == 3 and trace[-1][1] <= 302
+
+    # a first batch which cannot end before the deadline is cut short
+    _, _, _, trace = AnytimePlanner(PRM(environment), batch_size=10 ** 5).plan(deadline=1)
+    assert len(trace) == 1 and trace[0][0] <= 1 + 0.5 and trace[0][1] < 10 ** 5
+
+
+def test_build_tiled_prm():
+    prm = PRM.build_tiled(environment, 2000, tile_size=250, workers=2, seed_value=7)
+    assert nx.is_connected(prm.graph)
+    assert environment.source.xy in prm.graph and environment.target.xy in prm.graph
+
+    edges = list(prm.graph.edges(data=True))
+    attributes = environment.compute_segments_attributes([(u, v) for u, v, _ in edges])
+    for (_, _, edge_data), length, risk in zip(edges, attributes['length'], attributes['risk']):
+        assert edge_data['risk'] == pytest.approx(risk + EPSILON * length)
+
+    # the tiles are stitched across their boundaries
+    assert any(u[0] // 250 != v[0] // 250 or u[1] // 250 != v[1] // 250 for u, v, _ in edges)
+
+
+def _shared_shortest_path(handle, weight):
+    with SharedRoadmap.attach(handle) as shared:
+        return shared.shortest_path(environment.source, environment.target, weight)[:3]
+
+
+def test_shared_roadmap():
+    prm = PRM(environment)
+    prm.add_samples(1000)
+    prm.compress()
+
+    with SharedRoadmap.publish(prm) as shared:
+        assert shared.number_of_nodes == prm.graph.number_of_nodes()
+        with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context('spawn')) as executor:
+            for weight in ['length', 'risk', {'length': 1, 'risk': 10}]:
+                path, length, risk = executor.submit(_shared_shortest_path, shared.handle, weight).result()
+                expected_path, expected_length, expected_risk, _ = prm.shortest_path(weight)
+                assert path == expected_path
+                assert (length, risk) == pytest.approx((expected_length, expected_risk), abs=1e-3)
+
+        # the budgeted searches over the shared arrays agree with the layers search of the roadmap
+        min_risk = prm.shortest_path('risk')[2]
+        budgets = [('length', min_risk + 20), ('length', min_risk + 100), ({'length': 1, 'risk': 10}, min_risk + 50)]
+        for weight, budget in budgets:
+            _, length, risk, _ = shared.constrained_shortest_path(environment.source, environment.target, weight,
+                                                                  budget=budget)
+            expected_length, expected_risk = prm.constrained_shortest_path(weight, budget=budget)[1:3]
+            assert risk <= budget and (length, risk) == pytest.approx((expected_length, expected_risk), abs=1e-3)
+
+        with pytest.raises(nx.NodeNotFound):
+            shared.shortest_path(Coord(-1, -1), environment.target)
+
+    # the estimated risks of a lazy roadmap are evaluated before they are shared
+    lazy_prm = PRM(environment, lazy=True)
+    lazy_prm.add_samples(300)
+    with SharedRoadmap.publish(lazy_prm) as shared:
+        assert all(evaluated for _, _, evaluated in lazy_prm.graph.edges(data='evaluated', default=True))
+        _, length, risk, _ = shared.shortest_path(environment.source, environment.target, 'risk')
+        assert (length, risk) == pytest.approx(lazy_prm.shortest_path('risk')[1:3], abs=1e-3)
@@ -0,0 +1,52 @@
+import numpy as np
+
+from environment.environment import Environment
+from environment.sampling import BridgeSampler, GaussianBoundarySampler, MixtureSampler, TangentSampler, \
+    UniformSampler
+from geometry.circle import Circle
+from geometry.coord import Coord
+from roadmap.prm import PRM
+
+environment = Environment(source=Coord(0, 0), target=Coord(950, 950), num_threats=8)
+
+
+def _boundary_distances(points: np.ndarray) -> np.ndarray:
+    centers = np.array([threat.center.xy for threat in environment.threats])
+    radii = np.array([threat.radius for threat in environment.threats])
+    return np.min(np.abs(np.hypot(*(points[:, None, :] - centers[None]).transpose(2, 0, 1)) - radii), axis=1)
+
+
+def test_uniform_sampler_is_safe():
+    points = UniformSampler(environment, is_safe_sample=True, seed_value=0).sample_array(500)
+    assert len(points) == 500
+    assert environment.are_safe_points(points).all()
+    assert all(environment.is_safe_point(p) for p in UniformSampler(environment, True, 0).sample(50))
+
+
+def test_boundary_samplers_concentrate_near_threats():
+    uniform = UniformSampler(environment, seed_value=0).sample_array(1000)
+    gaussian = GaussianBoundarySampler(environment, sigma=5, seed_value=0).sample_array(1000)
+    assert np.median(_boundary_distances(gaussian)) < np.median(_boundary_distances(uniform)) / 2
+
+    bridges = BridgeSampler(environment, seed_value=0).sample_array(100)
+    assert len(bridges) and environment.are_safe_points(bridges).all()
+
+    tangents = TangentSampler(environment, seed_value=0).sample_array(10 ** 6)
+    assert len(tangents) < 10 ** 6 and np.allclose(_boundary_distances(tangents), Circle.EPSILON)
+
+
+def test_prm_with_sampler():
+    sampler = MixtureSampler([UniformSampler(environment), GaussianBoundarySampler(environment)], [1, 1], 0)
+    prm = PRM(environment)
+    prm.add_samples(300, sampler=sampler)
+    assert prm.graph.number_of_nodes() >= 300
+
+
+def test_gaussian_sampler_follows_threats():
+    changing = Environment(source=Coord(0, 0), target=Coord(950, 950), num_threats=1, seed_value=2)
+    sampler = GaussianBoundarySampler(changing, sigma=1, seed_value=0)
+    changing.move_threat(0, Coord(500, 500))
+
+    points = sampler.sample_array(100)
+    distances = np.hypot(points[:, 0] - 500, points[:, 1] - 500)
+    assert np.allclose(distances, changing.threats[0].radius, atol=10)
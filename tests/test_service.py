@@ -0,0 +1,135 @@
+import asyncio
+import io
+import json
+
+import numpy as np
+import pytest
+
+from environment.environment import Environment
+from geometry.coord import Coord
+from service.batch_runner import read_jobs, result_writer, run_batch
+from service.planning_service import PlanningService
+
+
+async def _send(socket_path: str, requests: list) -> dict:
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    for request in requests:
+        writer.write(json.dumps(request).encode() + b'\n')
+    await writer.drain()
+    responses = [json.loads(await reader.readline()) for _ in requests]
+    writer.close()
+    return {response['id']: response for response in responses}
+
+
+async def _run_service(socket_path: str, environment_path: str) -> dict:
+    service = PlanningService(2)
+    server = asyncio.create_task(service.serve(socket_path))
+    try:
+        while True:
+            try:
+                await _send(socket_path, [])
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(0.01)
+
+        responses = await _send(socket_path, [
+            {'id': 'environment', 'method': 'load_environment',
+             'params': {'name': 'e', 'source': [0, 0], 'target': [950, 950], 'num_threats': 8}}])
+        responses.update(await _send(socket_path, [
+            {'id': 'roadmap', 'method': 'build_roadmap',
+             'params': {'name': 'r', 'environment': 'e', 'roadmap_type': 'prm', 'num_samples': 500}}]))
+
+        # concurrent queries on the same connection
+        responses.update(await _send(socket_path, [
+            {'id': 'nodes', 'method': 'query', 'params': {'roadmap': 'r', 'source': [0, 0], 'target': [950, 950]}},
+            {'id': 'points', 'method': 'query', 'params': {'roadmap': 'r', 'source': [10, 20], 'target': [940, 930],
+                                                          'weight': {'length': 1, 'risk': 10}}},
+            {'id': 'budget', 'method': 'query', 'params': {'roadmap': 'r', 'source': [0, 0], 'target': [950, 950],
+                                                          'budget': 200}},
+            {'id': 'single', 'method': 'analytic', 'params': {'source': [5, 3], 'target': [-0.5, 4],
+                                                              'threats': [[3, 4, 1.8]], 'budget': 2}},
+            {'id': 'unknown', 'method': 'close'},
+            {'id': 'missing', 'method': 'query', 'params': {'roadmap': 'x', 'source': [0, 0], 'target': [1, 1]}},
+        ]))
+
+        # a roadmap rebuilt while it is queried is freed once its queries finish
+        responses.update(await _send(socket_path, [
+            {'id': 'file', 'method': 'load_environment', 'params': {'name': 'f', 'path': environment_path}},
+            {'id': 'before', 'method': 'query', 'params': {'roadmap': 'r', 'source': [0, 0], 'target': [950, 950],
+                                                          'budget': 200}},
+            {'id': 'rebuild', 'method': 'build_roadmap',
+             'params': {'name': 'r', 'environment': 'e', 'roadmap_type': 'prm', 'num_samples': 300}},
+        ]))
+        responses.update(await _send(socket_path, [
+            {'id': 'after', 'method': 'query', 'params': {'roadmap': 'r', 'source': [0, 0], 'target': [950, 950]}}]))
+        responses['replaced'] = len(service._replaced) + sum(service._pool_queries.values())
+        return responses
+    finally:
+        server.cancel()
+        service.close()
+
+
+def test_planning_service(tmp_path):
+    Environment(Coord(0, 0), Coord(950, 950), num_threats=4).save(tmp_path / 'environment.npz')
+    responses = asyncio.run(_run_service(str(tmp_path / 'planning.sock'), str(tmp_path / 'environment.npz')))
+    assert responses.pop('replaced') == 0
+    assert all(response['latency'] >= 0 for response in responses.values())
+    assert responses['environment']['result']['content_hash']
+    assert responses['roadmap']['result']['nodes'] == 502
+
+    for name in ['nodes', 'points', 'budget', 'single']:
+        result = responses[name]['result']
+        assert len(result['path']) >= 2 and result['length'] > 0
+    assert responses['nodes']['result']['path'][0] == [0, 0]
+    assert responses['points']['result']['path'][-1] == [940, 930]
+    assert responses['budget']['result']['risk'] <= 200 + 1e-6
+    assert responses['single']['result']['risk'] == pytest.approx(2, abs=1e-3)
+
+    assert responses['file']['result']['content_hash']
+    assert responses['before']['result']['risk'] <= 200 + 1e-6 and responses['after']['result']['length'] > 0
+    assert responses['rebuild']['result']['nodes'] == 302
+
+    assert responses['unknown']['error'].startswith('ValueError')
+    assert responses['missing']['error'].startswith('KeyError')
+
+
+def test_batch_runner(tmp_path):
+    Environment(source=Coord(0, 0), target=Coord(950, 950), num_threats=8).save(tmp_path / 'threats.npz')
+    Environment.from_arrays(Coord(5, 3), Coord(-0.5, 4), np.array([[3, 4]]), np.array([1.8]), (10, 10)) \
+        .save(tmp_path / 'threat.npz')
+
+    rows = ['id,environment,roadmap,source_x,source_y,target_x,target_y,budget,method,weight']
+    for i in range(20):
+        rows.append(f'{i},{tmp_path / "threats.npz"},prm:300,{10 + i},20,940,{930 - i},,,')
+        rows.append(f'{i}b,{tmp_path / "threats.npz"},prm:300,{10 + i},20,940,{930 - i},,,')
+    rows.append(f'budget,{tmp_path / "threats.npz"},prm:300,0,0,950,950,400,,')
+    rows.append(f'weighted,{tmp_path / "threats.npz"},prm:300,0,0,950,950,,,"{{""length"": 1, ""risk"": 10}}"')
+    rows.append(f'analytic,{tmp_path / "threat.npz"},,5,3,-0.5,4,2,,')
+    rows.append(f'missing,{tmp_path / "missing.npz"},prm:300,0,0,950,950,,,')
+    rows.append(f'unknown,{tmp_path / "threats.npz"},,0,0,950,950,,,')
+    rows.append(f'malformed,{tmp_path / "threats.npz"},prm:300,0,zero,950,950,,,')
+    rows.append(f'bad-weight,{tmp_path / "threats.npz"},prm:300,0,0,950,950,,,{{length}}')
+
+    output = io.StringIO()
+    jobs = read_jobs(io.StringIO('\n'.join(rows)), 'csv')
+    assert run_batch(jobs, result_writer(output, 'jsonl'), workers=2, chunk_size=16, task_size=4) == len(rows) - 1
+    results = {result['id']: result for result in read_jobs(io.StringIO(output.getvalue()))}
+
+    # the workers build the same roadmap
+    for i in range(20):
+        assert results[str(i)]['path'] == results[f'{i}b']['path']
+        assert results[str(i)]['path'][:2] == [10 + i, 20] and results[str(i)]['path'][-2:] == [940, 930 - i]
+    assert results['budget']['risk'] <= 400 + 1e-6
+    assert 'error' not in results['weighted'] and results['weighted']['length'] > 0
+    assert results['analytic']['risk'] == pytest.approx(2, abs=1e-3)
+    assert results['missing']['error'].startswith('FileNotFoundError')
+    assert results['unknown']['error'].startswith('ValueError')
+
+    # the rows which cannot be read fail alone
+    assert results['malformed']['error'].startswith('ValueError')
+    assert results['bad-weight']['error'].startswith('JSONDecodeError')
+
+    output = io.StringIO()
+    jobs = read_jobs(io.StringIO('{"id": "broken", "environment": \n{"id": "no-environment"}\n'))
+    assert run_batch(jobs, result_writer(output, 'jsonl'), workers=1) == 2
+    assert all('error' in result for result in read_jobs(io.StringIO(output.getvalue())))